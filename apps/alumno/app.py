@@ -1,13 +1,16 @@
-from flask import Flask, render_template, Response, jsonify
-import json, time
+from flask import Flask, render_template, Response, jsonify, request
+import json, time, secrets
 from routes.auth import bp as auth_bp
 from jwt_helper import JWTHelper
 
-from config import APP_NAME, DEBUG
-from mqtt_client import mqtt_bridge
+from config import APP_NAME, DEBUG, SSE_KEEPALIVE_S, SSE_TICKET_TTL_S
+from db import get_redis
+from mqtt_sesiones import sesiones_mqtt
+from sse_hub import sse_hub
+from hash_pool import pool_hash
 
 from routes.auth import bp as auth_bp
-from routes.materias import bp as materias_bp
+from routes.materias import bp as materias_bp, require_jwt
 from routes.mqtt_api import bp as mqtt_bp
 
 app = Flask(__name__)
@@ -31,19 +34,87 @@ def materias_view():
 
 @app.get("/health")
 def health():
-    return jsonify({"app": APP_NAME, "status": "ok"})
+    return jsonify({
+        "app": APP_NAME,
+        "status": "ok",
+        "sse": sse_hub.estadisticas(),
+        "mqtt": sesiones_mqtt.estadisticas(),
+        "jwt_cache": JWTHelper._default().cache.estadisticas(),
+        "auth_pool": pool_hash.estadisticas(),
+    })
+
+def _filtros_sse(args):
+    """?carrera=X&materia=A&materia=B -> prefijos de topic de notificaciones"""
+    carrera = (args.get("carrera") or "").strip()
+    if not carrera:
+        return []
+    base = f"universidad/notificaciones/aula/{carrera}"
+    materias = [m.strip() for m in args.getlist("materia") if m.strip()]
+    return [f"{base}/{m}" for m in materias] or [base]
+
+def _usuario_sse(args):
+    """
+    EventSource no manda headers: el JWT no viaja en la URL (queda en logs e
+    historial), sino un ?ticket= de un solo uso pedido antes a /events/ticket.
+    """
+    ticket = (args.get("ticket") or "").strip()
+    if not ticket:
+        return None
+    try:
+        # GET + DEL atómicos: el ticket se consume aunque la conexión falle
+        pipe = get_redis().pipeline(transaction=True)
+        pipe.get(f"sse_ticket:{ticket}")
+        pipe.delete(f"sse_ticket:{ticket}")
+        id_usuario, _ = pipe.execute()
+    except Exception:
+        return None
+    return id_usuario or None
+
+@app.post("/events/ticket")
+@require_jwt
+def events_ticket(jwt_payload):
+    """Cambia el JWT (header Authorization) por un ticket corto para /events"""
+    id_usuario = jwt_payload.get("id_usuario")
+    if not id_usuario:
+        return jsonify({"error": "token_invalido"}), 401
+
+    ticket = secrets.token_urlsafe(32)
+    try:
+        get_redis().set(f"sse_ticket:{ticket}", str(id_usuario), ex=SSE_TICKET_TTL_S)
+    except Exception:
+        return jsonify({"error": "redis_no_disponible"}), 503
+    return jsonify({"ticket": ticket, "expira_en": SSE_TICKET_TTL_S})
 
 @app.get("/events")
 def events():
+    # Last-Event-ID lo manda el navegador solo al reconectar
+    suscriptor = sse_hub.suscribir(
+        _filtros_sse(request.args),
+        request.headers.get("Last-Event-ID") or request.args.get("lastEventId"),
+        usuario=_usuario_sse(request.args),
+    )
+
     def stream():
-        yield f"data: {json.dumps({'type':'sse','event':'open'})}\n\n"
-        while True:
-            try:
-                event = mqtt_bridge.events.get(timeout=15)
-                yield f"data: {json.dumps(event, default=str)}\n\n"
-            except Exception:
-                yield f"data: {json.dumps({'type':'sse','event':'keepalive','ts':time.time()})}\n\n"
-    return Response(stream(), mimetype="text/event-stream")
+        try:
+            yield f"data: {json.dumps({'type':'sse','event':'open'})}\n\n"
+            if sesiones_mqtt.conectado():
+                # El pool ya estaba conectado: este cliente no va a ver el "connect"
+                yield f"data: {json.dumps({'type':'mqtt','event':'connect','rc':0})}\n\n"
+            while True:
+                eventos = suscriptor.tomar(timeout=SSE_KEEPALIVE_S)
+                if not eventos:
+                    yield f"data: {json.dumps({'type':'sse','event':'keepalive','ts':time.time()})}\n\n"
+                for event_id, event in eventos:
+                    yield f"id: {event_id}\ndata: {json.dumps(event, default=str)}\n\n"
+        finally:
+            # El cliente se desconectó (el servidor cierra el generador)
+            sse_hub.desuscribir(suscriptor)
+
+    return Response(
+        stream(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5001, debug=DEBUG)
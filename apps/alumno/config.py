@@ -12,6 +12,22 @@ JWT_SECRET = os.getenv("JWT_SECRET", "dev_secret_change_me")
 JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 JWT_EXP_MINUTES = int(os.getenv("JWT_EXP_MINUTES", "120"))
 
+# Verificación de contraseñas en procesos aparte (hash_pool.py)
+AUTH_PROCESOS = int(os.getenv("AUTH_PROCESOS", "2"))
+AUTH_COLA_MAX = int(os.getenv("AUTH_COLA_MAX", "64"))
+AUTH_COLA_POR_USUARIO = int(os.getenv("AUTH_COLA_POR_USUARIO", "3"))
+AUTH_ESPERA_MAX_S = float(os.getenv("AUTH_ESPERA_MAX_S", "10"))
+BCRYPT_COSTO = int(os.getenv("BCRYPT_COSTO", "12"))
+
+# Cache de JWT verificados y lista de revocados (jwt_cache.py)
+JWT_CACHE_MAX = int(os.getenv("JWT_CACHE_MAX", "10000"))
+JWT_REVOCADOS_REFRESCO_S = float(os.getenv("JWT_REVOCADOS_REFRESCO_S", "5"))
+
+# Redis (compartido con App_Bedelia)
+REDIS_HOST = os.getenv("REDIS_HOST", "redis")
+REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
+REDIS_DB = int(os.getenv("REDIS_DB", "0"))
+
 # MQTT / EMQX
 MQTT_BROKER_HOST = os.getenv("MQTT_BROKER_HOST", "emqx")
 MQTT_BROKER_PORT = int(os.getenv("MQTT_BROKER_PORT", "8883"))
@@ -23,3 +39,16 @@ MQTT_TLS_KEY = os.getenv("MQTT_TLS_KEY", "/opt/certs/alumno.key")
 
 # Dónde mandamos el JWT al broker
 MQTT_JWT_MODE = os.getenv("MQTT_JWT_MODE", "password")
+
+# Versión del protocolo: "auto" (5, y 3.1.1 si el broker no lo acepta), "5" o "3.1.1"
+MQTT_PROTOCOLO = os.getenv("MQTT_PROTOCOLO", "auto")
+
+# SSE (/events)
+SSE_BUFFER_SUSCRIPTOR = int(os.getenv("SSE_BUFFER_SUSCRIPTOR", "200"))
+SSE_HISTORIAL = int(os.getenv("SSE_HISTORIAL", "1000"))
+SSE_KEEPALIVE_S = int(os.getenv("SSE_KEEPALIVE_S", "15"))
+# Ticket de un solo uso para abrir /events (EventSource no manda headers)
+SSE_TICKET_TTL_S = int(os.getenv("SSE_TICKET_TTL_S", "30"))
+
+# Pool de conexiones MQTT compartido por todas las sesiones de alumnos
+MQTT_POOL_CONEXIONES = int(os.getenv("MQTT_POOL_CONEXIONES", "2"))
@@ -1,8 +1,10 @@
+import redis
 from pymongo import MongoClient
-from config import MONGO_URI, MONGO_DB_NAME
+from config import MONGO_URI, MONGO_DB_NAME, REDIS_HOST, REDIS_PORT, REDIS_DB
 
 _client = None
 _db = None
+_redis = None
 
 def get_db():
     global _client, _db
@@ -14,10 +16,26 @@ def get_db():
     _db = _client[MONGO_DB_NAME]
     return _db
 
+def get_redis():
+    global _redis
+    if _redis is None:
+        # Timeouts cortos: si Redis no está, los requests no se cuelgan
+        _redis = redis.Redis(
+            host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB,
+            decode_responses=True,
+            socket_connect_timeout=1, socket_timeout=1,
+        )
+    return _redis
+
 def find_user_by_username(username: str):
     db = get_db()
     return db.usuarios.find_one({"usuario": username, "estado": "activo"})
 
+def update_password_hash(user_id, campo: str, anterior: str, nuevo: str):
+    """Rehash: solo pisa si la contraseña no cambió mientras tanto"""
+    db = get_db()
+    db.usuarios.update_one({"_id": user_id, campo: anterior}, {"$set": {campo: nuevo}})
+
 def find_user_carrera(user_id):
     """
     Devuelve id_carrera (string) para un alumno.
@@ -0,0 +1,173 @@
+"""
+Cache de verificación de JWT
+LRU de token verificado -> claims (hasta su 'exp') y lista de revocados en Redis.
+El mismo módulo lo usan App_Bedelia (utils/jwt_cache.py) y App_Alumno (jwt_cache.py)
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Set
+
+import jwt
+
+
+class TokenRevocado(jwt.InvalidTokenError):
+    """El token es válido pero fue revocado (logout)"""
+
+
+class CacheJWT:
+    """
+    Evita repetir HMAC + parseo cuando la misma sesión pega varias veces.
+
+    - Clave: SHA-256 del token (no se guarda el token en memoria).
+    - Cada entrada vence con el 'exp' del token; el tamaño está acotado (LRU).
+    - Revocados: sorted set en Redis (miembro = jti, score = exp del token).
+      Se relee cada refresco_s segundos en un solo round trip; un logout
+      tarda como mucho eso en verse en los otros procesos.
+    - Si Redis no responde se sigue con la última lista conocida.
+    """
+
+    def __init__(self, max_items: int = 10000, redis_fn: Optional[Callable[[], Any]] = None,
+                 clave_revocados: str = "jwt:revocados", refresco_s: float = 5.0):
+        self.max_items = max_items
+        self.redis_fn = redis_fn
+        self.clave_revocados = clave_revocados
+        self.refresco_s = refresco_s
+
+        self._lock = threading.Lock()
+        self._lock_refresco = threading.Lock()
+        self._items: "OrderedDict[bytes, tuple]" = OrderedDict()
+        self._revocados: Set[str] = set()
+        # Revocados en este proceso (id -> exp): sobreviven al refresco aunque Redis haya fallado
+        self._locales: Dict[str, float] = {}
+        self._ultimo_refresco = 0.0
+
+        self.aciertos = 0
+        self.fallos = 0
+        self.rechazados = 0
+        self.errores_redis = 0
+
+    @staticmethod
+    def _clave(token: str) -> bytes:
+        return hashlib.sha256(token.encode("utf-8")).digest()
+
+    @staticmethod
+    def identificador(token: str, claims: Dict[str, Any]) -> str:
+        """jti del token; los tokens viejos sin jti se identifican por su digest"""
+        return str(claims.get("jti") or hashlib.sha256(token.encode("utf-8")).hexdigest())
+
+    # -----------------------------
+    # Verificación
+    # -----------------------------
+
+    def validar(self, token: str, decodificar: Callable[[str], Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Devuelve los claims del token, verificándolo solo si no está en cache
+
+        Args:
+            token: JWT
+            decodificar: Verifica firma y exp y devuelve los claims (jwt.decode)
+
+        Returns:
+            Copia de los claims
+
+        Raises:
+            jwt.InvalidTokenError: Token inválido, expirado o revocado
+        """
+        ahora = time.time()
+        self._refrescar_revocados(ahora)
+        clave = self._clave(token)
+
+        claims = None
+        with self._lock:
+            entrada = self._items.get(clave)
+            if entrada is not None:
+                if entrada[1] > ahora:
+                    self._items.move_to_end(clave)
+                    claims = entrada[0]
+                else:
+                    del self._items[clave]
+
+        if claims is None:
+            claims = decodificar(token)
+            exp = claims.get("exp")
+            with self._lock:
+                self.fallos += 1
+                self._items[clave] = (claims, float(exp) if exp is not None else float("inf"))
+                while len(self._items) > self.max_items:
+                    self._items.popitem(last=False)
+        else:
+            self.aciertos += 1
+
+        if self.identificador(token, claims) in self._revocados:
+            self.rechazados += 1
+            raise TokenRevocado("Token revocado")
+        return dict(claims)
+
+    # -----------------------------
+    # Revocación
+    # -----------------------------
+
+    def revocar(self, token: str, claims: Dict[str, Any]) -> bool:
+        """
+        Revoca un token hasta su 'exp' (en este proceso al instante, en el resto
+        al próximo refresco)
+
+        Returns:
+            bool: False si no se pudo registrar en Redis
+        """
+        identificador = self.identificador(token, claims)
+        exp = float(claims.get("exp") or time.time() + 86400)
+        with self._lock:
+            self._revocados.add(identificador)
+            self._locales[identificador] = exp
+            self._items.pop(self._clave(token), None)
+
+        if self.redis_fn is None:
+            return False
+        try:
+            self.redis_fn().zadd(self.clave_revocados, {identificador: exp})
+            return True
+        except Exception as e:
+            self.errores_redis += 1
+            print(f"⚠️  No se pudo registrar el token revocado en Redis: {e}")
+            return False
+
+    def _refrescar_revocados(self, ahora: float):
+        if self.redis_fn is None or ahora - self._ultimo_refresco < self.refresco_s:
+            return
+        # Un solo hilo refresca; el resto sigue con la lista actual
+        if not self._lock_refresco.acquire(blocking=False):
+            return
+        try:
+            self._ultimo_refresco = ahora
+            pipe = self.redis_fn().pipeline(transaction=False)
+            pipe.zremrangebyscore(self.clave_revocados, "-inf", ahora)
+            pipe.zrange(self.clave_revocados, 0, -1)
+            _, miembros = pipe.execute()
+            revocados = {m.decode("utf-8") if isinstance(m, bytes) else str(m) for m in miembros}
+            with self._lock:
+                self._locales = {i: exp for i, exp in self._locales.items() if exp > ahora}
+                self._revocados = revocados | set(self._locales)
+        except Exception as e:
+            self.errores_redis += 1
+            if self.errores_redis % 100 == 1:
+                print(f"⚠️  No se pudo leer la lista de tokens revocados: {e}")
+        finally:
+            self._lock_refresco.release()
+
+    def estadisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            items = len(self._items)
+            revocados = len(self._revocados)
+        return {
+            "items": items,
+            "max_items": self.max_items,
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "rechazados": self.rechazados,
+            "revocados": revocados,
+            "errores_redis": self.errores_redis,
+        }
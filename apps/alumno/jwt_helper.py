@@ -2,11 +2,20 @@
 from __future__ import annotations
 
 import os
+import uuid
 from datetime import datetime, timedelta, timezone
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Optional, Tuple
 
 import jwt  # PyJWT
 
+from jwt_cache import CacheJWT
+
+
+def _redis():
+    """Importación lazy: Redis solo hace falta para la lista de revocados"""
+    from db import get_redis
+    return get_redis()
+
 
 class JWTHelper:
     """
@@ -16,9 +25,17 @@ class JWTHelper:
     - O usar como clase: JWTHelper.create(payload) leyendo env vars
 
     Env vars soportadas:
-      JWT_SECRET, JWT_ALGORITHM, JWT_EXP_MINUTES
+      JWT_SECRET, JWT_ALGORITHM, JWT_EXP_MINUTES,
+      JWT_CACHE_MAX, JWT_REVOCADOS_REFRESCO_S
+
+    decode() cachea los tokens ya verificados hasta su exp y rechaza los
+    revocados (ver jwt_cache.py).
     """
 
+    _instancia: Optional["JWTHelper"] = None
+    # Un cache por (secret, algoritmo), compartido por todas las instancias
+    _caches: Dict[Tuple[str, str], CacheJWT] = {}
+
     def __init__(
         self,
         secret: Optional[str] = None,
@@ -28,6 +45,14 @@ class JWTHelper:
         self.secret = secret or os.getenv("JWT_SECRET", "dev-secret-change-me")
         self.algorithm = algorithm or os.getenv("JWT_ALGORITHM", "HS256")
         self.exp_minutes = int(exp_minutes or os.getenv("JWT_EXP_MINUTES", "60"))
+        clave = (self.secret, self.algorithm)
+        if clave not in JWTHelper._caches:
+            JWTHelper._caches[clave] = CacheJWT(
+                max_items=int(os.getenv("JWT_CACHE_MAX", "10000")),
+                redis_fn=_redis,
+                refresco_s=float(os.getenv("JWT_REVOCADOS_REFRESCO_S", "5")),
+            )
+        self.cache = JWTHelper._caches[clave]
 
     # -------------------------
     # Métodos de instancia
@@ -37,6 +62,7 @@ class JWTHelper:
         exp = now + timedelta(minutes=(expires_minutes or self.exp_minutes))
 
         data = dict(payload)
+        data.setdefault("jti", uuid.uuid4().hex)
         data["iat"] = int(now.timestamp())
         data["exp"] = int(exp.timestamp())
 
@@ -48,6 +74,11 @@ class JWTHelper:
         return token
 
     def decode(self, token: str, verify_exp: bool = True) -> Dict[str, Any]:
+        if verify_exp:
+            return self.cache.validar(token, self._decode)
+        return self._decode(token, verify_exp=False)
+
+    def _decode(self, token: str, verify_exp: bool = True) -> Dict[str, Any]:
         options = {"verify_exp": verify_exp}
         return jwt.decode(
             token,
@@ -56,6 +87,15 @@ class JWTHelper:
             options=options,
         )
 
+    def revoke(self, token: str) -> bool:
+        """Revoca un token válido hasta su exp (logout). False si el token no es válido"""
+        try:
+            payload = self.decode(token)
+        except jwt.PyJWTError:
+            return False
+        self.cache.revocar(token, payload)
+        return True
+
     def verify(self, token: str) -> bool:
         try:
             self.decode(token, verify_exp=True)
@@ -68,7 +108,10 @@ class JWTHelper:
     # -------------------------
     @classmethod
     def _default(cls) -> "JWTHelper":
-        return cls()  # toma env vars
+        # Una sola instancia (toma env vars): conserva el cache entre llamadas
+        if cls._instancia is None:
+            cls._instancia = cls()
+        return cls._instancia
 
     @classmethod
     def create(cls, payload: Dict[str, Any], expires_minutes: Optional[int] = None) -> str:
@@ -81,3 +124,7 @@ class JWTHelper:
     @classmethod
     def verify_token(cls, token: str) -> bool:
         return cls._default().verify(token)
+
+    @classmethod
+    def revoke_token(cls, token: str) -> bool:
+        return cls._default().revoke(token)
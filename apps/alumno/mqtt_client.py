@@ -1,19 +1,37 @@
 import ssl
 import json
-import queue
 import uuid
+import threading
 import paho.mqtt.client as mqtt
 
 from config import (
     MQTT_BROKER_HOST, MQTT_BROKER_PORT,
     MQTT_TLS_ENABLED, MQTT_TLS_CA_CERT, MQTT_TLS_CERT, MQTT_TLS_KEY,
-    MQTT_JWT_MODE
+    MQTT_JWT_MODE, MQTT_PROTOCOLO
 )
+from mqtt_protocolo import NegociacionMQTT, codigo
+from sse_hub import sse_hub
 
 class MQTTBridge:
+    """
+    Una conexión al broker del pool de SesionesMQTT (ver mqtt_sesiones.py).
+    Los mensajes recibidos se entregan a on_mensaje(topic, event) para rutearlos.
+
+    - Versión MQTT 5 o 3.1.1 según MQTT_PROTOCOLO (ver mqtt_protocolo.py); si
+      la negociación baja a 3.1.1 el cliente se recrea con esa versión.
+    - No anuncia TopicAliasMaximum: paho no resuelve alias entrantes, así que
+      el broker manda siempre el topic completo.
+    """
+
     def __init__(self, host: str, port: int, tls_enabled: bool,
                  ca_cert: str, client_cert: str, client_key: str,
-                 jwt_mode: str = "password"):
+                 jwt_mode: str = "password", indice: int = 0,
+                 on_mensaje=None, token_fn=None,
+                 protocolo: str = MQTT_PROTOCOLO):
+        self.indice = indice
+        self.on_mensaje = on_mensaje
+        # Genera el JWT de servicio; se renueva en cada reconexión (el anterior puede haber vencido)
+        self.token_fn = token_fn
         self.host = host
         self.port = port
         self.tls_enabled = tls_enabled
@@ -21,32 +39,41 @@ class MQTTBridge:
         self.client_cert = client_cert
         self.client_key = client_key
         self.jwt_mode = jwt_mode
+        self.negociacion = NegociacionMQTT(protocolo)
 
         self._client = None
         self._connected = False
-        self.events = queue.Queue(maxsize=500)
+        self._prefijo = "alumno"
         self.subscriptions = set()
 
+    @property
+    def connected(self) -> bool:
+        return self._connected
+
     def _push_event(self, event: dict):
-        try:
-            self.events.put_nowait(event)
-        except queue.Full:
-            try:
-                _ = self.events.get_nowait()
-            except queue.Empty:
-                pass
-            try:
-                self.events.put_nowait(event)
-            except queue.Full:
-                pass
+        # Eventos de estado de la conexión: van a todos los clientes SSE
+        sse_hub.publicar({**event, "conexion": self.indice})
+
+    def _set_credentials(self, jwt_token: str, client=None):
+        client = client or self._client
+        if self.jwt_mode == "username":
+            client.username_pw_set(username=jwt_token, password="")
+        else:
+            client.username_pw_set(username="jwt", password=jwt_token)
 
-    def connect(self, jwt_token: str, client_id_prefix: str = "alumno"):
+    def connect(self, jwt_token: str = None, client_id_prefix: str = "alumno"):
         if self._client and self._connected:
-            self._push_event({"type": "mqtt", "event": "connect_skip"})
             return
+        if self._client:
+            # Ya conectando (loop_start reintenta solo)
+            return
+        if jwt_token is None:
+            jwt_token = self.token_fn()
 
+        self._prefijo = client_id_prefix
+        version = self.negociacion.version
         client_id = f"{client_id_prefix}-{uuid.uuid4()}"
-        self._client = mqtt.Client(client_id=client_id, protocol=mqtt.MQTTv311)
+        self._client = mqtt.Client(client_id=client_id, protocol=self.negociacion.protocolo)
 
         self._client.on_connect = self._on_connect
         self._client.on_disconnect = self._on_disconnect
@@ -54,12 +81,7 @@ class MQTTBridge:
         self._client.on_log = self._on_log
         self._client.on_subscribe = self._on_subscribe
 
-        if self.jwt_mode == "password":
-            self._client.username_pw_set(username="jwt", password=jwt_token)
-        elif self.jwt_mode == "username":
-            self._client.username_pw_set(username=jwt_token, password="")
-        else:
-            self._client.username_pw_set(username="jwt", password=jwt_token)
+        self._set_credentials(jwt_token)
 
         if self.tls_enabled:
             ctx = ssl.create_default_context(ssl.Purpose.SERVER_AUTH, cafile=self.ca_cert)
@@ -68,20 +90,57 @@ class MQTTBridge:
             ctx.verify_mode = ssl.CERT_REQUIRED
             self._client.tls_set_context(ctx)
 
-        self._client.connect(self.host, self.port, keepalive=60)
+        try:
+            self._client.connect(self.host, self.port, keepalive=60)
+        except Exception:
+            self._client = None
+            raise
         self._client.loop_start()
 
-        self._push_event({"type": "mqtt", "event": "connect_start", "client_id": client_id})
+        self._push_event({
+            "type": "mqtt", "event": "connect_start", "client_id": client_id, "protocolo": version
+        })
+
+    def _recrear(self):
+        """
+        Recrea el cliente con la versión negociada. Corre en un hilo aparte:
+        loop_stop() espera al hilo de red, que es el que detectó el cambio.
+        """
+        client = self._client
+        self._client = None
+        self._connected = False
+        if client:
+            client.loop_stop()
+        try:
+            self.connect(client_id_prefix=self._prefijo)
+        except Exception as e:
+            self._push_event({"type": "mqtt", "event": "connect_error", "error": str(e)})
+
+    def _bajar_version(self):
+        threading.Thread(target=self._recrear, name=f"mqtt-pool{self.indice}-recrear", daemon=True).start()
 
     def subscribe(self, topic: str, qos: int = 1):
-        if not self._client or not self._connected:
-            raise RuntimeError("MQTT no conectado. Conectá primero.")
-        self._client.subscribe(topic, qos=qos)
+        # Sin conexión queda registrado y se suscribe en _on_connect
         self.subscriptions.add(topic)
+        if self._client and self._connected:
+            self._client.subscribe(topic, qos=qos)
 
-    def _on_connect(self, client, userdata, flags, rc):
+    def unsubscribe(self, topic: str):
+        self.subscriptions.discard(topic)
+        if self._client and self._connected:
+            self._client.unsubscribe(topic)
+
+    # properties: solo en MQTT 5 (paho llama a los callbacks con otra firma en 3.1.1)
+    def _on_connect(self, client, userdata, flags, rc, properties=None):
+        if client is not self._client:
+            return
+        rc = codigo(rc)
         self._connected = (rc == 0)
-        self._push_event({"type": "mqtt", "event": "connect", "rc": int(rc)})
+        self._push_event({"type": "mqtt", "event": "connect", "rc": rc, "protocolo": self.negociacion.version})
+
+        if self.negociacion.connack(rc):
+            self._bajar_version()
+            return
 
         if rc == 0:
             for t in list(self.subscriptions):
@@ -91,16 +150,22 @@ class MQTTBridge:
                 except Exception:
                     pass
 
-    def _on_disconnect(self, client, userdata, rc):
+    def _on_disconnect(self, client, userdata, rc, properties=None):
+        rc = codigo(rc)
         self._connected = False
-        self._push_event({"type": "mqtt", "event": "disconnect", "rc": int(rc)})
+        self._push_event({"type": "mqtt", "event": "disconnect", "rc": rc})
+        if client is not self._client:
+            # Cliente viejo que se está reemplazando (_recrear)
+            return
+        if self.token_fn:
+            self._set_credentials(self.token_fn(), client)
 
-    def _on_subscribe(self, client, userdata, mid, granted_qos):
-        self._push_event({"type": "mqtt", "event": "subscribed", "mid": int(mid), "granted_qos": list(granted_qos)})
+    def _on_subscribe(self, client, userdata, mid, granted_qos, properties=None):
+        # En MQTT 5 llegan ReasonCodes (QoS otorgado o código de error >= 128)
+        granted_qos = [codigo(q) for q in granted_qos]
+        self._push_event({"type": "mqtt", "event": "subscribed", "mid": int(mid), "granted_qos": granted_qos})
 
     def _on_message(self, client, userdata, msg):
-        self._push_event({"type": "debug", "event": "on_message_called"})
-
         try:
             raw = msg.payload.decode("utf-8", errors="replace")
             try:
@@ -110,24 +175,18 @@ class MQTTBridge:
         except Exception as e:
             payload = f"<error decoding payload: {e}>"
 
-        self._push_event({
+        event = {
             "type": "mqtt",
             "event": "message",
             "topic": msg.topic,
             "qos": int(msg.qos),
             "retain": bool(msg.retain),
             "payload": payload
-        })
+        }
+        if self.on_mensaje:
+            self.on_mensaje(msg.topic, event)
+        else:
+            sse_hub.publicar(event)
 
     def _on_log(self, client, userdata, level, buf):
         self._push_event({"type": "mqtt", "event": "log", "message": buf})
-
-mqtt_bridge = MQTTBridge(
-    host=MQTT_BROKER_HOST,
-    port=MQTT_BROKER_PORT,
-    tls_enabled=MQTT_TLS_ENABLED,
-    ca_cert=MQTT_TLS_CA_CERT,
-    client_cert=MQTT_TLS_CERT,
-    client_key=MQTT_TLS_KEY,
-    jwt_mode=MQTT_JWT_MODE,
-)
@@ -0,0 +1,62 @@
+"""
+Negociación de la versión de MQTT (5 con vuelta a 3.1.1)
+El mismo módulo lo usan App_Bedelia (utils/mqtt_protocolo.py) y App_Alumno (mqtt_protocolo.py)
+"""
+
+import paho.mqtt.client as mqtt
+
+
+MODOS = ("auto", "5", "3.1.1")
+# CONNACK de un broker que no habla MQTT 5 ("versión no aceptada"): paho lo entrega como 132
+RC_VERSION_NO_SOPORTADA = (1, 132)
+
+
+def codigo(rc) -> int:
+    """Código de retorno como int (en MQTT 5 paho entrega ReasonCodes)"""
+    return rc.value if hasattr(rc, "value") else int(rc)
+
+
+class NegociacionMQTT:
+    """
+    Versión de protocolo de un cliente MQTT.
+
+    - "5" / "3.1.1": fija.
+    - "auto": arranca en 5 y baja a 3.1.1 solo si el broker rechaza la versión
+      de forma explícita (CONNACK 1/132). Un socket cerrado antes del CONNACK
+      no cuenta: EMQX lo hace también mientras arranca o reinicia. Con un broker
+      que corta el CONNECT v5 sin responder, configurar MQTT_PROTOCOLO=3.1.1.
+    - Bajar es para el resto de la vida del proceso: el cliente paho se
+      recrea con la versión nueva (la versión se fija al construirlo).
+    """
+
+    def __init__(self, modo: str = "auto"):
+        modo = (modo or "auto").strip().lower()
+        if modo == "311":
+            modo = "3.1.1"
+        if modo not in MODOS:
+            raise ValueError(f"MQTT_PROTOCOLO inválido: {modo} (opciones: {', '.join(MODOS)})")
+        self.modo = modo
+        self.protocolo = mqtt.MQTTv311 if modo == "3.1.1" else mqtt.MQTTv5
+
+    @property
+    def v5(self) -> bool:
+        return self.protocolo == mqtt.MQTTv5
+
+    @property
+    def version(self) -> str:
+        return "5" if self.v5 else "3.1.1"
+
+    def connack(self, rc) -> bool:
+        """
+        Registra un CONNACK
+
+        Returns:
+            bool: True si hay que recrear el cliente con 3.1.1
+        """
+        rc = codigo(rc)
+        return self.v5 and self.modo == "auto" and rc in RC_VERSION_NO_SOPORTADA and self._bajar()
+
+    def _bajar(self) -> bool:
+        print("⚠️  El broker no acepta MQTT 5: se sigue con MQTT 3.1.1")
+        self.protocolo = mqtt.MQTTv311
+        return True
@@ -0,0 +1,128 @@
+import threading
+import zlib
+from typing import Any, Dict, Iterable, List, Set
+
+from config import (
+    APP_NAME, MQTT_BROKER_HOST, MQTT_BROKER_PORT,
+    MQTT_TLS_ENABLED, MQTT_TLS_CA_CERT, MQTT_TLS_CERT, MQTT_TLS_KEY,
+    MQTT_JWT_MODE, MQTT_POOL_CONEXIONES
+)
+from jwt_helper import JWTHelper
+from mqtt_client import MQTTBridge
+from sse_hub import sse_hub
+from topic_trie import TopicTrie
+
+
+class SesionesMQTT:
+    """
+    Multiplexa las sesiones de todos los alumnos sobre un pool chico de
+    conexiones al broker (en vez de una conexión por alumno).
+
+    - Cada filtro vive en una sola conexión del pool (hash del filtro).
+    - Suscripciones compartidas: el broker recibe SUBSCRIBE solo con el primer
+      alumno de un filtro y UNSUBSCRIBE cuando se va el último (conteo de refs).
+    - Ruteo: cada mensaje se entrega por SSE solo a los alumnos cuyos filtros
+      coinciden con el topic (TopicTrie, admite '+' y '#').
+    """
+
+    def __init__(self, conexiones: int = MQTT_POOL_CONEXIONES):
+        self._lock = threading.Lock()
+        self._lock_conexion = threading.Lock()
+        self._pool: List[MQTTBridge] = [
+            MQTTBridge(
+                host=MQTT_BROKER_HOST,
+                port=MQTT_BROKER_PORT,
+                tls_enabled=MQTT_TLS_ENABLED,
+                ca_cert=MQTT_TLS_CA_CERT,
+                client_cert=MQTT_TLS_CERT,
+                client_key=MQTT_TLS_KEY,
+                jwt_mode=MQTT_JWT_MODE,
+                indice=i,
+                on_mensaje=self._rutear,
+                token_fn=self._token_servicio,
+            )
+            for i in range(max(1, conexiones))
+        ]
+        # filtro -> id_usuario suscriptos
+        self._trie = TopicTrie()
+        # id_usuario -> filtros (para cerrar la sesión completa)
+        self._topics_usuario: Dict[str, Set[str]] = {}
+        self.ruteados = 0
+
+    @staticmethod
+    def _token_servicio() -> str:
+        # Mismo rol que los alumnos: el broker aplica las mismas reglas
+        return JWTHelper.create({"usuario": APP_NAME, "rol": "alumno", "servicio": True})
+
+    def _conexion(self, topic: str) -> MQTTBridge:
+        return self._pool[zlib.crc32(topic.encode("utf-8")) % len(self._pool)]
+
+    def conectar(self):
+        """Conecta las conexiones del pool que no estén conectadas (idempotente)"""
+        errores = []
+        with self._lock_conexion:
+            for bridge in self._pool:
+                try:
+                    bridge.connect(client_id_prefix=f"alumno-pool{bridge.indice}")
+                except Exception as e:
+                    errores.append(str(e))
+        if len(errores) == len(self._pool):
+            raise RuntimeError(f"No se pudo conectar al broker MQTT: {errores[0]}")
+
+    def conectado(self) -> bool:
+        return any(bridge.connected for bridge in self._pool)
+
+    def suscribir(self, usuario: str, topic: str):
+        self.suscribir_lote(usuario, [topic])
+
+    def suscribir_lote(self, usuario: str, topics: List[str]):
+        """Anota al alumno en varios filtros con un solo paso por el trie"""
+        with self._lock:
+            nuevos, _ = self._trie.actualizar(altas=[(t, usuario) for t in topics])
+            self._topics_usuario.setdefault(usuario, set()).update(topics)
+            for topic in nuevos:
+                self._conexion(topic).subscribe(topic, qos=1)
+
+    def desuscribir(self, usuario: str, topic: str):
+        with self._lock:
+            topics = self._topics_usuario.get(usuario)
+            if topics is None or topic not in topics:
+                return
+            topics.discard(topic)
+            if not topics:
+                del self._topics_usuario[usuario]
+            self._soltar(usuario, [topic])
+
+    def cerrar_sesion(self, usuario: str):
+        """Suelta todas las suscripciones del alumno"""
+        with self._lock:
+            self._soltar(usuario, self._topics_usuario.pop(usuario, set()))
+
+    def _soltar(self, usuario: str, topics: Iterable[str]):
+        # Llamar con self._lock tomado
+        _, vacios = self._trie.actualizar(bajas=[(t, usuario) for t in topics])
+        for topic in vacios:
+            self._conexion(topic).unsubscribe(topic)
+
+    def _rutear(self, topic: str, event: Dict[str, Any]):
+        with self._lock:
+            destinatarios = frozenset(self._trie.match(topic))
+        if destinatarios:
+            self.ruteados += 1
+            sse_hub.publicar(event, destinatarios=destinatarios)
+
+    def estadisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            trie = self._trie.estadisticas()
+            usuarios = len(self._topics_usuario)
+        return {
+            "conexiones": len(self._pool),
+            "conectadas": sum(1 for bridge in self._pool if bridge.connected),
+            "usuarios": usuarios,
+            "ruteados": self.ruteados,
+            "protocolo": [bridge.negociacion.version for bridge in self._pool],
+            "trie": trie,
+        }
+
+
+sesiones_mqtt = SesionesMQTT()
@@ -1,7 +1,7 @@
 from flask import Blueprint, request, jsonify
-import bcrypt
 
-from db import find_user_by_username
+from db import find_user_by_username, update_password_hash
+from hash_pool import pool_hash, AuthSaturado
 from jwt_helper import JWTHelper
 
 bp = Blueprint("auth", __name__)
@@ -25,13 +25,18 @@ def login():
 
     stored_hash = u.get("contraseña") or ""
     try:
-        ok = bcrypt.checkpw(password.encode("utf-8"), stored_hash.encode("utf-8"))
-    except Exception:
-        ok = False
+        ok = pool_hash.verificar(usuario, password, stored_hash)
+    except AuthSaturado as e:
+        return jsonify({"error": "login_saturado", "mensaje": str(e)}), 503, {"Retry-After": "2"}
 
     if not ok:
         return jsonify({"error": "credenciales_invalidas"}), 401
 
+    pool_hash.rehash_en_segundo_plano(
+        password, stored_hash,
+        lambda nuevo: update_password_hash(u["_id"], "contraseña", stored_hash, nuevo)
+    )
+
     payload = {
         "id_usuario": str(u.get("_id")),
         "usuario": u.get("usuario"),
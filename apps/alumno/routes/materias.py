@@ -1,30 +1,29 @@
 from flask import Blueprint, request, jsonify
-import bcrypt
 
 from jwt_helper import JWTHelper
-from db import find_user_by_username, find_user_carrera, find_materias_by_carrera  # <-- si no existe, te digo abajo
+from db import find_user_by_username, find_user_carrera, find_materias_by_carrera, update_password_hash  # <-- si no existe, te digo abajo
+from hash_pool import pool_hash, AuthSaturado
 from config import JWT_SECRET, JWT_ALGORITHM, JWT_EXP_MINUTES
 
 bp = Blueprint("materias", __name__)
 
 jwt_helper = JWTHelper(JWT_SECRET, JWT_ALGORITHM, JWT_EXP_MINUTES)
 
-def _verify_password(stored: str, provided: str) -> bool:
+def _verify_password(username: str, stored: str, provided: str) -> bool:
     """
     Soporta:
-    - bcrypt: strings tipo $2b$12$...
+    - bcrypt: strings tipo $2b$12$... (se verifica en el pool de procesos)
     - texto plano (MVP)
+
+    Raises:
+        AuthSaturado: si hay demasiados logins en curso
     """
     if not stored or not provided:
         return False
 
     # bcrypt hashes suelen empezar con $2a$, $2b$, $2y$
-    if stored.startswith("$2a$") or stored.startswith("$2b$") or stored.startswith("$2y$"):
-        try:
-            return bcrypt.checkpw(provided.encode("utf-8"), stored.encode("utf-8"))
-        except ValueError:
-            # hash corrupto / salt inválida
-            return False
+    if pool_hash.es_bcrypt(stored):
+        return pool_hash.verificar(username, provided, stored)
 
     # fallback: texto plano
     return stored == provided
@@ -55,10 +54,21 @@ def _do_login():
     if user.get("rol") != "alumno":
         return jsonify({"error": "El usuario no es alumno"}), 403
 
-    stored_pass = user.get("contraseña") or user.get("contrasena") or user.get("password") or ""
-    if not _verify_password(stored_pass, password):
+    campo = next((c for c in ("contraseña", "contrasena", "password") if user.get(c)), "contraseña")
+    stored_pass = user.get(campo) or ""
+    try:
+        ok = _verify_password(username, stored_pass, password)
+    except AuthSaturado as e:
+        return jsonify({"error": "login_saturado", "mensaje": str(e)}), 503, {"Retry-After": "2"}
+    if not ok:
         return jsonify({"error": "credenciales_invalidas"}), 401
 
+    # Texto plano o costo viejo: se pasa a bcrypt al costo actual en segundo plano
+    pool_hash.rehash_en_segundo_plano(
+        password, stored_pass,
+        lambda nuevo: update_password_hash(user["_id"], campo, stored_pass, nuevo)
+    )
+
     user_id = user["_id"]
     id_carrera = user.get("id_carrera") or find_user_carrera(user_id)
     if not id_carrera:
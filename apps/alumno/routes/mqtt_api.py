@@ -1,10 +1,10 @@
 from flask import Blueprint, jsonify, request
 from bson import ObjectId
 
-from mqtt_client import mqtt_bridge
+from mqtt_sesiones import sesiones_mqtt
 from jwt_helper import JWTHelper
 from config import JWT_SECRET, JWT_ALGORITHM, JWT_EXP_MINUTES
-from db import save_subscription
+from db import save_subscription, list_subscriptions
 
 bp = Blueprint("mqtt_api", __name__, url_prefix="/mqtt")
 jwt_helper = JWTHelper(JWT_SECRET, JWT_ALGORITHM, JWT_EXP_MINUTES)
@@ -14,14 +14,24 @@ def require_jwt():
     if not auth.startswith("Bearer "):
         raise ValueError("Falta Authorization: Bearer <token>")
     token = auth.split(" ", 1)[1].strip()
-    return token, jwt_helper.verify_token(token)
+    return token, jwt_helper.decode(token)
+
+def _topic(id_carrera: str, id_materia: str) -> str:
+    return f"universidad/notificaciones/aula/{id_carrera}/{id_materia}"
 
 @bp.post("/connect")
 def connect():
     try:
-        token, payload = require_jwt()
-        mqtt_bridge.connect(jwt_token=token, client_id_prefix="alumno")
-        return jsonify({"status": "ok"}), 200
+        _, p = require_jwt()
+        sesiones_mqtt.conectar()
+
+        # Retomar las materias que el alumno ya tenía anotadas
+        id_carrera = str(p["id_carrera"])
+        user_id = str(p["id_usuario"])
+        topics = [_topic(id_carrera, s["id_materia"]) for s in list_subscriptions(ObjectId(user_id), id_carrera)]
+        sesiones_mqtt.suscribir_lote(user_id, topics)
+
+        return jsonify({"status": "ok", "conectado": sesiones_mqtt.conectado()}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -35,8 +45,8 @@ def subscribe():
         data = request.get_json(force=True, silent=True) or {}
         id_materia = str(data.get("id_materia"))
 
-        topic = f"universidad/notificaciones/aula/{id_carrera}/{id_materia}"
-        mqtt_bridge.subscribe(topic, qos=1)
+        topic = _topic(id_carrera, id_materia)
+        sesiones_mqtt.suscribir(str(user_id), topic)
         save_subscription(user_id, id_carrera, id_materia, subscribed=True)
 
         return jsonify({"status": "ok", "topic": topic}), 200
@@ -53,17 +63,19 @@ def unsubscribe():
         data = request.get_json(force=True, silent=True) or {}
         id_materia = str(data.get("id_materia"))
 
-        topic = f"universidad/notificaciones/aula/{id_carrera}/{id_materia}"
-
-        if not mqtt_bridge._client or not mqtt_bridge._connected:
-            return jsonify({"error": "MQTT no conectado"}), 400
-
-        mqtt_bridge._client.unsubscribe(topic)
-        if topic in mqtt_bridge.subscriptions:
-            mqtt_bridge.subscriptions.remove(topic)
-
+        topic = _topic(id_carrera, id_materia)
+        sesiones_mqtt.desuscribir(str(user_id), topic)
         save_subscription(user_id, id_carrera, id_materia, subscribed=False)
 
         return jsonify({"status": "ok", "topic": topic}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+
+@bp.post("/disconnect")
+def disconnect():
+    try:
+        _, p = require_jwt()
+        sesiones_mqtt.cerrar_sesion(str(p["id_usuario"]))
+        return jsonify({"status": "ok"}), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
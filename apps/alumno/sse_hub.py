@@ -0,0 +1,179 @@
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from config import SSE_BUFFER_SUSCRIPTOR, SSE_HISTORIAL
+from topic_trie import TopicTrie
+
+
+class Suscriptor:
+    """
+    Un navegador conectado a /events.
+
+    Buffer circular propio: si el cliente es lento se descartan sus eventos
+    más viejos (solo los suyos) en vez de frenar al resto.
+    """
+
+    def __init__(self, filtros: Iterable[str], max_eventos: int, usuario: Optional[str] = None):
+        # Prefijos de topic; vacío = todos los mensajes
+        self.filtros = tuple(f.rstrip("/") for f in filtros if f)
+        # id_usuario del JWT (si vino); los mensajes ruteados le llegan según sus suscripciones
+        self.usuario = usuario
+        self.cola: deque = deque(maxlen=max_eventos)
+        self.aviso = threading.Event()
+        self.descartados = 0
+        # Filtros con los que quedó registrado en el trie del hub
+        self.indice: List[str] = []
+
+    def acepta(self, event: Dict[str, Any], destinatarios: Optional[FrozenSet[str]] = None) -> bool:
+        # Los eventos de estado del bridge (connect/disconnect/...) van a todos
+        if event.get("event") != "message":
+            return True
+        # Un mensaje con destinatarios es solo de esos alumnos: un stream anónimo
+        # (sin ticket) no lo recibe aunque coincida el topic
+        if destinatarios is not None:
+            return self.usuario is not None and self.usuario in destinatarios
+        if not self.filtros:
+            return True
+        topic = str(event.get("topic", ""))
+        return any(topic == f or topic.startswith(f + "/") for f in self.filtros)
+
+    def entregar(self, event_id: str, event: Dict[str, Any]):
+        if len(self.cola) == self.cola.maxlen:
+            self.descartados += 1
+        self.cola.append((event_id, event))
+        self.aviso.set()
+
+    def tomar(self, timeout: float) -> List[Tuple[str, Dict[str, Any]]]:
+        """Espera hasta timeout y devuelve todo lo pendiente (lista vacía = keepalive)"""
+        self.aviso.wait(timeout)
+        self.aviso.clear()
+        eventos = []
+        while self.cola:
+            eventos.append(self.cola.popleft())
+        return eventos
+
+
+class SSEHub:
+    """
+    Fan-out de eventos del bridge MQTT hacia los clientes SSE del proceso.
+
+    - El pool de SesionesMQTT publica acá; cada suscriptor recibe su copia
+      filtrada por destinatarios (suscripciones del usuario) o, si el mensaje
+      no tiene destinatarios, por topic.
+    - Índices por usuario y por filtro (TopicTrie): un mensaje solo se evalúa
+      contra los suscriptores que pueden recibirlo, no contra todos.
+    - IDs "<arranque>-<n>": con Last-Event-ID el cliente que reconecta recibe
+      lo que se perdió, si sigue en el historial y es del mismo proceso.
+    """
+
+    def __init__(self, historial: int = SSE_HISTORIAL, buffer_suscriptor: int = SSE_BUFFER_SUSCRIPTOR):
+        self.buffer_suscriptor = buffer_suscriptor
+        self._arranque = str(int(time.time()))
+        self._lock = threading.Lock()
+        self._siguiente = 1
+        self._historial: deque = deque(maxlen=historial)
+        self._suscriptores = set()
+        self._por_usuario: Dict[str, set] = {}
+        self._por_filtro = TopicTrie()
+        # Sin filtros (o con filtros que no entran al trie): candidatos a todo mensaje
+        self._sin_indice = set()
+        self.publicados = 0
+
+    def publicar(self, event: Dict[str, Any], destinatarios: Optional[Iterable[str]] = None):
+        """destinatarios: ids de usuario a los que va un mensaje (None = filtrar por topic)"""
+        if destinatarios is not None:
+            destinatarios = frozenset(destinatarios)
+        with self._lock:
+            event_id = f"{self._arranque}-{self._siguiente}"
+            self._siguiente += 1
+            self._historial.append((self._siguiente - 1, event_id, event, destinatarios))
+            suscriptores = self._candidatos(event, destinatarios)
+            self.publicados += 1
+
+        for s in suscriptores:
+            if s.acepta(event, destinatarios):
+                s.entregar(event_id, event)
+
+    def _candidatos(self, event: Dict[str, Any], destinatarios: Optional[FrozenSet[str]]) -> List[Suscriptor]:
+        # Llamar con self._lock tomado; la decisión final la toma Suscriptor.acepta
+        if event.get("event") != "message":
+            return list(self._suscriptores)
+        candidatos = set(self._sin_indice)
+        candidatos |= self._por_filtro.match(str(event.get("topic", "")))
+        for usuario in destinatarios or ():
+            candidatos |= self._por_usuario.get(usuario, set())
+        return list(candidatos)
+
+    def _indexar(self, s: Suscriptor):
+        if s.usuario:
+            self._por_usuario.setdefault(s.usuario, set()).add(s)
+        try:
+            # Prefijo 'a/b' = filtro MQTT 'a/b/#' (que también coincide con 'a/b')
+            filtros = [f + "/#" for f in s.filtros]
+            for f in filtros:
+                TopicTrie.validar(f)
+        except ValueError:
+            filtros = []
+        if not filtros:
+            self._sin_indice.add(s)
+        for f in filtros:
+            self._por_filtro.add(f, s)
+        s.indice = filtros
+
+    def _desindexar(self, s: Suscriptor):
+        if s.usuario:
+            conjunto = self._por_usuario.get(s.usuario)
+            if conjunto is not None:
+                conjunto.discard(s)
+                if not conjunto:
+                    del self._por_usuario[s.usuario]
+        self._sin_indice.discard(s)
+        for f in s.indice:
+            self._por_filtro.remove(f, s)
+
+    def _numero(self, last_event_id: Optional[str]) -> Optional[int]:
+        if not last_event_id:
+            return None
+        arranque, _, numero = last_event_id.partition("-")
+        if arranque != self._arranque or not numero.isdigit():
+            return None
+        return int(numero)
+
+    def suscribir(self, filtros: Iterable[str] = (), last_event_id: Optional[str] = None,
+                  usuario: Optional[str] = None) -> Suscriptor:
+        s = Suscriptor(filtros, self.buffer_suscriptor, usuario)
+        ultimo = self._numero(last_event_id)
+
+        with self._lock:
+            if ultimo is not None:
+                if self._historial and self._historial[0][0] > ultimo + 1:
+                    # Parte de lo perdido ya salió del historial: avisar al cliente
+                    s.entregar(f"{self._arranque}-{ultimo}", {"type": "sse", "event": "gap"})
+                for numero, event_id, event, destinatarios in self._historial:
+                    if numero > ultimo and s.acepta(event, destinatarios):
+                        s.entregar(event_id, event)
+            self._suscriptores.add(s)
+            self._indexar(s)
+        return s
+
+    def desuscribir(self, s: Suscriptor):
+        with self._lock:
+            if s in self._suscriptores:
+                self._suscriptores.discard(s)
+                self._desindexar(s)
+
+    def estadisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            suscriptores = list(self._suscriptores)
+            trie = self._por_filtro.estadisticas()
+        return {
+            "suscriptores": len(suscriptores),
+            "trie": trie,
+            "publicados": self.publicados,
+            "descartados": sum(s.descartados for s in suscriptores),
+        }
+
+
+sse_hub = SSEHub()
@@ -19,5 +19,6 @@ export const api = {
   mqttConnect: () => request("/mqtt/connect", { method:"POST" }),
   subscribe: (id_materia) => request("/mqtt/subscribe", { method:"POST", json:{ id_materia } }),
   unsubscribe: (id_materia) => request("/mqtt/unsubscribe", { method:"POST", json:{ id_materia } }),
+  sseTicket: () => request("/events/ticket", { method:"POST" }),
 };
 
@@ -1,9 +1,44 @@
-export function startSSE(onEvent) {
-  const ev = new EventSource("/events");
-  ev.onmessage = (e) => {
-    try { onEvent(JSON.parse(e.data)); }
-    catch { onEvent({ type:"raw", data:e.data }); }
+import { api } from "./api.js";
+
+export function startSSE(onEvent, filtros = {}) {
+  // filtros: { carrera, materias: [] } -> solo notificaciones de esos topics
+  // filtros.autenticado: pide un ticket de un solo uso (el JWT no va en la URL)
+  // para recibir los mensajes de las suscripciones del alumno
+  const sesion = { ev: null, lastEventId: null, cerrado: false };
+
+  async function abrir() {
+    const params = new URLSearchParams();
+    if (filtros.autenticado) {
+      const r = await api.sseTicket();
+      if (r.ok) params.set("ticket", r.data.ticket);
+    }
+    if (filtros.carrera) params.set("carrera", filtros.carrera);
+    for (const m of filtros.materias || []) params.append("materia", m);
+    if (sesion.lastEventId) params.set("lastEventId", sesion.lastEventId);
+    if (sesion.cerrado) return;
+    const qs = params.toString();
+
+    const ev = new EventSource(qs ? `/events?${qs}` : "/events");
+    sesion.ev = ev;
+    ev.onmessage = (e) => {
+      if (e.lastEventId) sesion.lastEventId = e.lastEventId;
+      try { onEvent(JSON.parse(e.data)); }
+      catch { onEvent({ type:"raw", data:e.data }); }
+    };
+    ev.onerror = () => {
+      onEvent({ type:"sse", event:"error" });
+      if (!filtros.autenticado) return;
+      // La reconexión automática reusaría el ticket ya consumido: se reabre a mano
+      ev.close();
+      setTimeout(() => { if (!sesion.cerrado) abrir(); }, 3000);
+    };
+  }
+
+  abrir();
+  return {
+    close() {
+      sesion.cerrado = true;
+      if (sesion.ev) sesion.ev.close();
+    },
   };
-  ev.onerror = () => onEvent({ type:"sse", event:"error" });
-  return ev;
 }
@@ -112,7 +112,7 @@ async function init() {
       // filtramos solo notificaciones aula (por si llegan logs)
       addFeedMessage(ev.topic, ev.payload);
     }
-  });
+  }, { carrera: state.payload?.id_carrera, autenticado: !!state.token });
 }
 
 init();
@@ -0,0 +1,209 @@
+import sys
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+
+class _Nodo:
+    __slots__ = ("hijos", "valores")
+
+    def __init__(self):
+        self.hijos: Dict[str, "_Nodo"] = {}
+        # Se crea recién cuando un filtro termina en este nivel
+        self.valores: Optional[Set[Hashable]] = None
+
+
+class TopicTrie:
+    """
+    Filtros MQTT (con '+' y '#') -> conjunto de suscriptores.
+
+    - match(topic) recorre un nivel del trie por nivel del topic: el costo
+      depende de la profundidad del topic, no de la cantidad de filtros.
+    - add/remove informan si el filtro apareció o quedó vacío, para que el
+      llamador haga SUBSCRIBE/UNSUBSCRIBE una sola vez por filtro.
+    - No es thread-safe: el llamador lo protege con su propio lock.
+    - Sin dependencias de la app, así lo puede usar cualquier suscriptor MQTT.
+    """
+
+    def __init__(self):
+        self._raiz = _Nodo()
+        self._filtros = 0
+        self._referencias = 0
+
+    @staticmethod
+    def validar(filtro: str) -> List[str]:
+        """
+        Parte un filtro en niveles
+
+        Raises:
+            ValueError: Si el filtro no es un filtro MQTT válido
+        """
+        if not filtro:
+            raise ValueError("Filtro de topic vacío")
+        niveles = filtro.split("/")
+        for i, nivel in enumerate(niveles):
+            if "#" in nivel and (nivel != "#" or i != len(niveles) - 1):
+                raise ValueError(f"'#' solo puede ser el último nivel completo: {filtro}")
+            if "+" in nivel and nivel != "+":
+                raise ValueError(f"'+' debe ocupar un nivel completo: {filtro}")
+        return niveles
+
+    # -----------------------------
+    # Altas y bajas
+    # -----------------------------
+
+    def add(self, filtro: str, valor: Hashable) -> bool:
+        """
+        Agrega un suscriptor a un filtro
+
+        Returns:
+            bool: True si el filtro no tenía suscriptores (hay que suscribirlo en el broker)
+        """
+        nodo = self._raiz
+        for nivel in self.validar(filtro):
+            hijo = nodo.hijos.get(nivel)
+            if hijo is None:
+                hijo = nodo.hijos[nivel] = _Nodo()
+            nodo = hijo
+
+        nuevo = not nodo.valores
+        if nodo.valores is None:
+            nodo.valores = set()
+        if valor not in nodo.valores:
+            nodo.valores.add(valor)
+            self._referencias += 1
+        if nuevo:
+            self._filtros += 1
+        return nuevo
+
+    def remove(self, filtro: str, valor: Hashable) -> bool:
+        """
+        Quita un suscriptor de un filtro (los nodos que quedan vacíos se podan)
+
+        Returns:
+            bool: True si el filtro se quedó sin suscriptores (hay que desuscribirlo)
+        """
+        camino: List[Tuple[_Nodo, str]] = []
+        nodo = self._raiz
+        for nivel in self.validar(filtro):
+            hijo = nodo.hijos.get(nivel)
+            if hijo is None:
+                return False
+            camino.append((nodo, nivel))
+            nodo = hijo
+
+        if not nodo.valores or valor not in nodo.valores:
+            return False
+        nodo.valores.discard(valor)
+        self._referencias -= 1
+        if nodo.valores:
+            return False
+
+        nodo.valores = None
+        self._filtros -= 1
+        for padre, nivel in reversed(camino):
+            hijo = padre.hijos[nivel]
+            if hijo.hijos or hijo.valores:
+                break
+            del padre.hijos[nivel]
+        return True
+
+    def actualizar(self, altas: Iterable[Tuple[str, Hashable]] = (),
+                   bajas: Iterable[Tuple[str, Hashable]] = ()) -> Tuple[List[str], List[str]]:
+        """
+        Aplica varias altas y bajas de una vez (ej. al restaurar la sesión de un alumno)
+
+        Returns:
+            (filtros nuevos, filtros que quedaron vacíos); un filtro que aparece y
+            desaparece dentro del mismo lote no figura en ninguna de las dos listas
+        """
+        nuevos: Dict[str, None] = {}
+        vacios: Dict[str, None] = {}
+        for filtro, valor in altas:
+            if self.add(filtro, valor):
+                if filtro in vacios:
+                    del vacios[filtro]
+                else:
+                    nuevos[filtro] = None
+        for filtro, valor in bajas:
+            if self.remove(filtro, valor):
+                if filtro in nuevos:
+                    del nuevos[filtro]
+                else:
+                    vacios[filtro] = None
+        return list(nuevos), list(vacios)
+
+    # -----------------------------
+    # Consultas
+    # -----------------------------
+
+    def valores(self, filtro: str) -> Set[Hashable]:
+        """Suscriptores de un filtro exacto (no hace matching de wildcards)"""
+        nodo = self._raiz
+        for nivel in self.validar(filtro):
+            nodo = nodo.hijos.get(nivel)
+            if nodo is None:
+                return set()
+        return set(nodo.valores or ())
+
+    def match(self, topic: str) -> Set[Hashable]:
+        """Suscriptores de todos los filtros que coinciden con un topic concreto"""
+        niveles = topic.split("/")
+        resultado: Set[Hashable] = set()
+        # Los topics '$SYS/...' no coinciden con wildcards en el primer nivel
+        sistema = topic.startswith("$")
+
+        pendientes = [(self._raiz, 0)]
+        while pendientes:
+            nodo, i = pendientes.pop()
+
+            comodin = nodo.hijos.get("#")
+            if comodin is not None and comodin.valores and not (sistema and i == 0):
+                # 'a/#' también coincide con 'a'
+                resultado |= comodin.valores
+
+            if i == len(niveles):
+                if nodo.valores:
+                    resultado |= nodo.valores
+                continue
+
+            hijo = nodo.hijos.get(niveles[i])
+            if hijo is not None:
+                pendientes.append((hijo, i + 1))
+            mas = nodo.hijos.get("+")
+            if mas is not None and not (sistema and i == 0):
+                pendientes.append((mas, i + 1))
+        return resultado
+
+    def filtros(self) -> List[str]:
+        salida = []
+        pendientes = [(self._raiz, [])]
+        while pendientes:
+            nodo, niveles = pendientes.pop()
+            if nodo.valores:
+                salida.append("/".join(niveles))
+            for nivel, hijo in nodo.hijos.items():
+                pendientes.append((hijo, niveles + [nivel]))
+        return salida
+
+    def __len__(self) -> int:
+        return self._filtros
+
+    def estadisticas(self) -> Dict[str, Any]:
+        """Tamaño del trie (bytes aproximados: nodos, dicts y sets, sin los valores)"""
+        nodos = 0
+        bytes_aprox = 0
+        pendientes = [self._raiz]
+        while pendientes:
+            nodo = pendientes.pop()
+            nodos += 1
+            bytes_aprox += sys.getsizeof(nodo) + sys.getsizeof(nodo.hijos)
+            if nodo.valores is not None:
+                bytes_aprox += sys.getsizeof(nodo.valores)
+            for nivel, hijo in nodo.hijos.items():
+                bytes_aprox += sys.getsizeof(nivel)
+                pendientes.append(hijo)
+        return {
+            "filtros": self._filtros,
+            "referencias": self._referencias,
+            "nodos": nodos,
+            "bytes_aprox": bytes_aprox,
+        }
@@ -143,48 +143,96 @@
 #     app.run(host="0.0.0.0", port=5000)
 """
 App_Bedelia – Application Entry Point
+
+Todo lo que conecta o arranca hilos (MongoDB, Redis, MQTT, services de los
+blueprints) se importa dentro de crear_app(): el pool de bcrypt usa procesos
+'spawn', que vuelven a ejecutar este archivo como __mp_main__ y solo deben
+encontrar imports livianos.
 """
 
-from flask import Flask, jsonify
+import os
 from datetime import datetime
 
 from config import APP_NAME, DEBUG
-from db.mongo import get_mongo_db
-from flask import render_template
-
-# Importar blueprints
-from routes import aulas_bp, usuarios_bp, cronograma_bp, carreras_bp
-
-# Crear app Flask
-app = Flask(__name__)
-app.config['JSON_AS_ASCII'] = False  # Para soportar caracteres UTF-8
-app.config['DEBUG'] = DEBUG
-
-#(acepta rutas con/sin slash final)
-app.url_map.strict_slashes = False
 
-# Registrar blueprints
-app.register_blueprint(aulas_bp)
-app.register_blueprint(usuarios_bp)
-app.register_blueprint(cronograma_bp)
-app.register_blueprint(carreras_bp)
 
+def crear_app():
+    """
+    Crea la app Flask con sus blueprints, hooks de Redis y endpoints de salud
+
+    Returns:
+        Flask: La aplicación lista para app.run()
+    """
+    from flask import Flask, jsonify, render_template
+
+    # Importar blueprints (instancian los services: MongoDB, índices en memoria, etc.)
+    from routes import aulas_bp, usuarios_bp, cronograma_bp, carreras_bp
+    from utils.mqtt_cola import cola_mqtt
+    from db.redis import redis_client, aplicar_pendientes_request, estadisticas_request
+    from utils.jwt_helper import JWTHelper
+    from utils.hash_pool import pool_hash
+    from mqtt_client import estado_mqtt
+    from services.metricas_publicador import publicador_metricas
+
+    # Crear app Flask
+    app = Flask(__name__)
+    app.config['JSON_AS_ASCII'] = False  # Para soportar caracteres UTF-8
+    app.config['DEBUG'] = DEBUG
+
+    #(acepta rutas con/sin slash final)
+    app.url_map.strict_slashes = False
+
+    # Registrar blueprints
+    app.register_blueprint(aulas_bp)
+    app.register_blueprint(usuarios_bp)
+    app.register_blueprint(cronograma_bp)
+    app.register_blueprint(carreras_bp)
+
+    @app.after_request
+    def redis_fin_request(response):
+        """Aplica las invalidaciones de caché del request (un solo envío) y expone el conteo de Redis"""
+        aplicar_pendientes_request()
+        uso = estadisticas_request()
+        response.headers["X-Redis-Comandos"] = str(uso["comandos"])
+        response.headers["X-Redis-Round-Trips"] = str(uso["round_trips"])
+        return response
+
+    @app.teardown_request
+    def redis_teardown(error=None):
+        """Si el request terminó con una excepción, after_request no corre: aplicar igual"""
+        aplicar_pendientes_request()
+
+    @app.route('/health', methods=['GET'])
+    def health():
+        """Health check endpoint"""
+        return jsonify({
+            "app": APP_NAME,
+            "status": "ok",
+            "timestamp": datetime.utcnow().isoformat(),
+            "mqtt": estado_mqtt(),
+            "mqtt_cola": cola_mqtt.estadisticas(),
+            "redis": redis_client.estado(),
+            "jwt_cache": JWTHelper.estadisticas_cache(),
+            "auth_pool": pool_hash.estadisticas(),
+            "metricas": publicador_metricas.estadisticas()
+        }), 200
+
+    @app.route('/', methods=['GET'])
+    def index():
+        """Ruta para el Dashboard Principal"""
+        return render_template('dashboard.html')
+
+    return app
 
-@app.route('/health', methods=['GET'])
-def health():
-    """Health check endpoint"""
-    return jsonify({
-        "app": APP_NAME,
-        "status": "ok",
-        "timestamp": datetime.utcnow().isoformat()
-    }), 200
 
+if __name__ == '__main__':
+    from utils.mqtt_cola import cola_mqtt
+    from services.metricas_publicador import publicador_metricas
 
-@app.route('/', methods=['GET'])
-def index():
-    """Ruta para el Dashboard Principal"""
-    return render_template('dashboard.html')
-
+    app = crear_app()
 
-if __name__ == '__main__':
+    # Con el reloader de debug solo el proceso hijo publica (el desborde a disco admite un proceso)
+    if not DEBUG or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        cola_mqtt.iniciar()
+        publicador_metricas.iniciar()
     app.run(host='0.0.0.0', port=5000, debug=DEBUG)
@@ -24,6 +24,15 @@ MONGO_URI = os.getenv(
 )
 MONGO_DB_NAME = os.getenv("MONGO_DB_NAME", "smartcampus")
 
+# Pool de conexiones
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", 50))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", 5))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", 2000))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000))
+
+# Atraso máximo tolerado al leer listados desde secundarios (mínimo de MongoDB: 90 s)
+MONGO_MAX_STALENESS_S = max(90, int(os.getenv("MONGO_MAX_STALENESS_S", 90)))
+
 # -----------------------------
 # Redis
 # -----------------------------
@@ -31,10 +40,38 @@ REDIS_HOST = os.getenv("REDIS_HOST", "redis")
 REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
 REDIS_DB = int(os.getenv("REDIS_DB", 0))
 
+# Pool de conexiones y resiliencia
+REDIS_MAX_CONEXIONES = int(os.getenv("REDIS_MAX_CONEXIONES", 50))
+REDIS_POOL_TIMEOUT_S = float(os.getenv("REDIS_POOL_TIMEOUT_S", 2))
+REDIS_CONNECT_TIMEOUT_S = float(os.getenv("REDIS_CONNECT_TIMEOUT_S", 1))
+REDIS_SOCKET_TIMEOUT_S = float(os.getenv("REDIS_SOCKET_TIMEOUT_S", 1))
+REDIS_HEALTH_CHECK_S = int(os.getenv("REDIS_HEALTH_CHECK_S", 30))
+REDIS_REINTENTOS = int(os.getenv("REDIS_REINTENTOS", 2))
+# Segundos sin intentar Redis después de un error de conexión (circuit breaker)
+REDIS_DEGRADADO_S = float(os.getenv("REDIS_DEGRADADO_S", 10))
+
 # TTLs (en segundos) – acordados en el diseño
 REDIS_TTL_AULA_CACHE = 300   # 5 minutos
 REDIS_TTL_SESION = 43200      # 12 horas
-REDIS_TTL_LOCK = 30           # 30 segundos
+REDIS_TTL_LOCK = 30           # 30 segundos (lease, se renueva mientras el lock está tomado)
+# Backoff con jitter mientras se espera un lock ocupado
+REDIS_LOCK_ESPERA_BASE_MS = 50
+REDIS_LOCK_ESPERA_MAX_MS = 1000
+
+# Cada cuánto se recalculan los contadores de aulas por estado desde MongoDB
+AULAS_CONTADORES_RECONCILIAR_S = int(os.getenv("AULAS_CONTADORES_RECONCILIAR_S", 300))
+
+# Caché local por proceso (delante de Redis) e invalidación por pub/sub
+CACHE_LOCAL_MAX_ITEMS = int(os.getenv("CACHE_LOCAL_MAX_ITEMS", 1024))
+CACHE_LOCAL_TTL_S = float(os.getenv("CACHE_LOCAL_TTL_S", 30))
+CACHE_CANAL_INVALIDACION = os.getenv("CACHE_CANAL_INVALIDACION", "cache:invalidaciones")
+
+# Relleno de caché sin estampidas
+CACHE_NEGATIVO_TTL_S = int(os.getenv("CACHE_NEGATIVO_TTL_S", 30))        # IDs inexistentes
+CACHE_VIEJO_EXTRA_S = int(os.getenv("CACHE_VIEJO_EXTRA_S", 600))         # vida extra de la copia vieja
+CACHE_LOCK_RELLENO_MS = int(os.getenv("CACHE_LOCK_RELLENO_MS", 5000))
+CACHE_ESPERA_RELLENO_S = float(os.getenv("CACHE_ESPERA_RELLENO_S", 1.0))
+CACHE_XFETCH_BETA = float(os.getenv("CACHE_XFETCH_BETA", 1.0))
 
 # -----------------------------
 # EMQX / MQTT
@@ -49,12 +86,66 @@ MQTT_TLS_CA_CERT = os.getenv("MQTT_TLS_CA_CERT", "/opt/certs/ca.crt")
 MQTT_TLS_CERT = os.getenv("MQTT_TLS_CERT", "/opt/certs/bedelia.crt")
 MQTT_TLS_KEY = os.getenv("MQTT_TLS_KEY", "/opt/certs/bedelia.key")
 
+# Supervisor de conexión (backoff con jitter entre reintentos)
+MQTT_RECONEXION_BASE_S = float(os.getenv("MQTT_RECONEXION_BASE_S", 0.5))
+MQTT_RECONEXION_MAX_S = float(os.getenv("MQTT_RECONEXION_MAX_S", 30))
+
+# Versión del protocolo: "auto" (5, y 3.1.1 si el broker no lo acepta), "5" o "3.1.1"
+MQTT_PROTOCOLO = os.getenv("MQTT_PROTOCOLO", "auto")
+# MQTT 5: alias de topic para los topics largos que se repiten (prefijos)
+MQTT_ALIAS_PREFIJOS = [
+    t.strip() for t in os.getenv("MQTT_ALIAS_PREFIJOS", "universidad/notificaciones/").split(",") if t.strip()
+]
+# Tope propio de alias por conexión (además del TopicAliasMaximum del broker)
+MQTT_ALIAS_MAX = int(os.getenv("MQTT_ALIAS_MAX", 256))
+# MQTT 5: vencimiento de mensajes que no sirven si llegan tarde (prefijo -> segundos)
+MQTT_EXPIRACION_S = {
+    "universidad/notificaciones/": int(os.getenv("MQTT_EXPIRACION_NOTIFICACIONES_S", 900)),
+    "universidad/errores/": int(os.getenv("MQTT_EXPIRACION_ERRORES_S", 300)),
+}
+
+# Cola de publicación en segundo plano
+MQTT_COLA_MAX = int(os.getenv("MQTT_COLA_MAX", 10000))
+MQTT_LOTE_MAX = int(os.getenv("MQTT_LOTE_MAX", 200))
+# Desborde a disco cuando la cola en memoria se llena (broker caído)
+MQTT_DESBORDE_DIR = os.getenv("MQTT_DESBORDE_DIR", "/app/data/mqtt_desborde")
+MQTT_DESBORDE_SEGMENTO_MB = int(os.getenv("MQTT_DESBORDE_SEGMENTO_MB", 8))
+MQTT_DESBORDE_MAX_MB = int(os.getenv("MQTT_DESBORDE_MAX_MB", 256))
+# Ritmo máximo de publicación (evita la ráfaga contra EMQX al reconectar)
+MQTT_DRENAJE_MSG_S = float(os.getenv("MQTT_DRENAJE_MSG_S", 500))
+# Topics de los que solo interesa el último valor (se fusionan en la cola)
+MQTT_TOPICS_COALESCIBLES = [
+    t.strip() for t in os.getenv("MQTT_TOPICS_COALESCIBLES", "universidad/metricas/aulas").split(",") if t.strip()
+]
+
+# Outbox de eventos (relay_outbox.py)
+OUTBOX_LOTE_MAX = int(os.getenv("OUTBOX_LOTE_MAX", 200))
+OUTBOX_BARRIDO_S = int(os.getenv("OUTBOX_BARRIDO_S", 30))
+OUTBOX_PUBACK_TIMEOUT_S = int(os.getenv("OUTBOX_PUBACK_TIMEOUT_S", 10))
+
+# Publicador de métricas de aulas (services/metricas_publicador.py)
+METRICAS_MUESTREO_S = float(os.getenv("METRICAS_MUESTREO_S", 1))
+METRICAS_DEBOUNCE_S = float(os.getenv("METRICAS_DEBOUNCE_S", 2))
+METRICAS_INTERVALO_S = float(os.getenv("METRICAS_INTERVALO_S", 30))
+METRICAS_LIDER_TTL_S = int(os.getenv("METRICAS_LIDER_TTL_S", 15))
+
 # -----------------------------
 # Seguridad
 # -----------------------------
 # Usado para sesiones Flask (más adelante)
 SECRET_KEY = os.getenv("SECRET_KEY", "bedelia_secret_key_change_in_production") ##### CAMBIAR ESTO EN PRODUCCIÓN #####
 
+# Verificación de contraseñas en procesos aparte (utils/hash_pool.py)
+AUTH_PROCESOS = int(os.getenv("AUTH_PROCESOS", 2))
+AUTH_COLA_MAX = int(os.getenv("AUTH_COLA_MAX", 64))            # logins esperando (más = 503)
+AUTH_COLA_POR_USUARIO = int(os.getenv("AUTH_COLA_POR_USUARIO", 3))
+AUTH_ESPERA_MAX_S = float(os.getenv("AUTH_ESPERA_MAX_S", 10))
+BCRYPT_COSTO = int(os.getenv("BCRYPT_COSTO", 12))
+
+# Cache de JWT verificados (utils/jwt_cache.py)
+JWT_CACHE_MAX = int(os.getenv("JWT_CACHE_MAX", 10000))
+JWT_REVOCADOS_REFRESCO_S = float(os.getenv("JWT_REVOCADOS_REFRESCO_S", 5))
+
 # -----------------------------
 # Validación básica
 # -----------------------------
@@ -0,0 +1,425 @@
+# =============================
+# Caché en dos niveles: memoria del proceso (LRU/TTL) + Redis
+# =============================
+
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+
+from config import (
+    CACHE_LOCAL_MAX_ITEMS,
+    CACHE_LOCAL_TTL_S,
+    CACHE_CANAL_INVALIDACION,
+    CACHE_NEGATIVO_TTL_S,
+    CACHE_VIEJO_EXTRA_S,
+    CACHE_LOCK_RELLENO_MS,
+    CACHE_ESPERA_RELLENO_S,
+    CACHE_XFETCH_BETA,
+)
+from redis.exceptions import RedisError
+
+from db.redis import redis_client, diferir_en_request, RedisNoDisponible
+
+
+class CacheLocal:
+    """
+    LRU con TTL en memoria del proceso (thread-safe).
+
+    Guarda los objetos ya deserializados: quien los lee NO debe modificarlos.
+    """
+
+    def __init__(self, max_items: int = CACHE_LOCAL_MAX_ITEMS, ttl: float = CACHE_LOCAL_TTL_S):
+        self.max_items = max_items
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._datos: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        # Se incrementa en cada invalidación: evita guardar valores leídos antes de ella
+        self._version = 0
+        self.hits = 0
+        self.misses = 0
+        self.desalojos = 0
+
+    def version(self) -> int:
+        return self._version
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """Devuelve (encontrado, valor)"""
+        ahora = time.monotonic()
+        with self._lock:
+            item = self._datos.get(key)
+            if item is None or item[0] <= ahora:
+                if item is not None:
+                    del self._datos[key]
+                self.misses += 1
+                return False, None
+            self._datos.move_to_end(key)
+            self.hits += 1
+            return True, item[1]
+
+    def set(self, key: str, valor: Any, version: Optional[int] = None):
+        """
+        Guarda un valor. Si se pasa 'version' y hubo invalidaciones desde entonces,
+        el valor puede estar viejo y se descarta.
+        """
+        if self.max_items <= 0:
+            return
+        with self._lock:
+            if version is not None and version != self._version:
+                return
+            self._datos[key] = (time.monotonic() + self.ttl, valor)
+            self._datos.move_to_end(key)
+            while len(self._datos) > self.max_items:
+                self._datos.popitem(last=False)
+                self.desalojos += 1
+
+    def invalidar(self, *keys: str):
+        with self._lock:
+            self._version += 1
+            for key in keys:
+                self._datos.pop(key, None)
+
+    def limpiar(self):
+        with self._lock:
+            self._version += 1
+            self._datos.clear()
+
+    def estadisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            consultas = self.hits + self.misses
+            return {
+                "items": len(self._datos),
+                "max_items": self.max_items,
+                "ttl_segundos": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "desalojos": self.desalojos,
+                "hit_ratio": round(self.hits / consultas, 4) if consultas else 0.0
+            }
+
+
+class CacheDosNiveles:
+    """
+    Caché de lectura: primero memoria local, después Redis (JSON).
+
+    - invalidar() borra en Redis y publica las keys en CACHE_CANAL_INVALIDACION;
+      cada worker escucha el canal y descarta sus copias locales.
+    - Si se pierde la suscripción, al reconectar se vacía la caché local
+      (pudo perderse algún mensaje). El TTL local acota cualquier otro desfasaje.
+
+    obtener_o_calcular() evita estampidas al recalcular:
+    - Un solo worker recalcula (lock corto en Redis); el resto recibe la copia
+      vieja ("{key}:stale", que sobrevive a la expiración y a la invalidación).
+    - Refresco anticipado probabilístico (XFetch): cuanto más cerca del vencimiento
+      y más caro el cálculo, más probable que una lectura lo recalcule antes.
+    - Los resultados None se cachean con un TTL corto (caché negativa).
+
+    Tags: una entrada puede registrarse bajo uno o más tags (ej. "aulas:estado:ocupada");
+    invalidar_tags() borra todas las entradas del tag. Cada tag tiene un número de
+    versión: un relleno que empezó antes de la invalidación no se guarda.
+    """
+
+    SUFIJO_VIEJO = ":stale"
+    SUFIJO_LOCK = ":relleno"
+    PREFIJO_TAG = "cache:tag:"
+    PREFIJO_TAG_VERSION = "cache:tagver:"
+
+    # Borra el lock solo si sigue siendo nuestro
+    _LUA_LIBERAR = """
+    if redis.call('get', KEYS[1]) == ARGV[1] then
+        return redis.call('del', KEYS[1])
+    end
+    return 0
+    """
+
+    # KEYS: key, key vieja, sets de tags (n), versiones de tags (n)
+    # ARGV: texto, ttl, ttl viejo (0 = sin copia vieja), versiones leídas antes de calcular (n)
+    _LUA_GUARDAR = """
+    local n = (#KEYS - 2) / 2
+    for i = 1, n do
+        if (redis.call('get', KEYS[2 + n + i]) or '0') ~= ARGV[3 + i] then
+            return 0
+        end
+    end
+    redis.call('setex', KEYS[1], ARGV[2], ARGV[1])
+    if ARGV[3] ~= '0' then
+        redis.call('setex', KEYS[2], ARGV[3], ARGV[1])
+    end
+    for i = 1, n do
+        redis.call('sadd', KEYS[2 + i], KEYS[1])
+        redis.call('expire', KEYS[2 + i], math.max(tonumber(ARGV[2]), tonumber(ARGV[3])))
+    end
+    return 1
+    """
+
+    # KEYS: keys a borrar (n), sets de tags (m), versiones de tags (m)
+    # ARGV: n, canal. Borra todo, avisa a los workers y devuelve las keys borradas
+    _LUA_INVALIDAR = """
+    local n = tonumber(ARGV[1])
+    local m = (#KEYS - n) / 2
+    local borradas = {}
+    for i = 1, n do
+        redis.call('unlink', KEYS[i])
+        table.insert(borradas, KEYS[i])
+    end
+    for i = 1, m do
+        redis.call('incr', KEYS[n + m + i])
+        for _, key in ipairs(redis.call('smembers', KEYS[n + i])) do
+            redis.call('unlink', key)
+            table.insert(borradas, key)
+        end
+        redis.call('unlink', KEYS[n + i])
+    end
+    if #borradas > 0 then
+        redis.call('publish', ARGV[2], cjson.encode(borradas))
+    end
+    return borradas
+    """
+
+    def __init__(self, canal: str = CACHE_CANAL_INVALIDACION):
+        self.canal = canal
+        self.local = CacheLocal()
+        self.redis_hits = 0
+        self.redis_misses = 0
+        self.rellenos = 0
+        self.servidos_viejos = 0
+        self.refrescos_anticipados = 0
+        self.negativos = 0
+        self.degradados = 0
+        self._escucha = None
+        # Invalidaciones que no llegaron a Redis (caído): se reenvían al reconectar
+        self._lock_pendientes = threading.Lock()
+        self._pendientes: Dict[str, set] = {"keys": set(), "tags": set()}
+
+    def _asegurar_escucha(self):
+        # El hilo se inicia en el primer uso (después de un fork de gunicorn)
+        if self._escucha is None or not self._escucha.is_alive():
+            self._escucha = threading.Thread(target=self._escuchar, name="cache-invalidacion", daemon=True)
+            self._escucha.start()
+
+    def _escuchar(self):
+        while True:
+            try:
+                pubsub = redis_client.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.canal)
+                self.local.limpiar()
+                self._reenviar_pendientes()
+                while True:
+                    # get_message con timeout: el socket_timeout del pool no corta la escucha
+                    mensaje = pubsub.get_message(timeout=1.0)
+                    if mensaje and mensaje.get("type") == "message":
+                        self.local.invalidar(*json.loads(mensaje["data"]))
+            except Exception as e:
+                print(f"⚠️  Suscripción de invalidación de caché caída: {e}. Reintentando...")
+                self.local.limpiar()
+                time.sleep(2)
+
+    # -----------------------------
+    # Sobres: {"v": valor, "d": segundos de cálculo, "exp": vencimiento lógico}
+    # -----------------------------
+
+    @staticmethod
+    def _debe_refrescar(sobre: Dict[str, Any]) -> bool:
+        # XFetch: now - d * beta * ln(rand) >= exp
+        delta = max(sobre.get("d", 0), 0.001)
+        return time.time() - delta * CACHE_XFETCH_BETA * math.log(random.random() or 1e-12) >= sobre["exp"]
+
+    def _leer(self, key: str) -> Optional[Dict[str, Any]]:
+        encontrado, sobre = self.local.get(key)
+        if encontrado:
+            return sobre
+
+        version = self.local.version()
+        cached = redis_client.client.get(key)
+        if cached is None:
+            self.redis_misses += 1
+            return None
+
+        self.redis_hits += 1
+        sobre = json.loads(cached)
+        self.local.set(key, sobre, version)
+        return sobre
+
+    def _calcular_y_guardar(self, key: str, calcular: Callable[[], Any], ttl: int, tags: Sequence[str] = ()) -> Any:
+        version = self.local.version()
+        keys_tags = [f"{self.PREFIJO_TAG}{tag}" for tag in tags]
+        keys_versiones = [f"{self.PREFIJO_TAG_VERSION}{tag}" for tag in tags]
+        versiones = [v or "0" for v in redis_client.client.mget(keys_versiones)] if tags else []
+
+        inicio = time.time()
+        valor = calcular()
+        duracion = time.time() - inicio
+
+        ttl_viejo = ttl + CACHE_VIEJO_EXTRA_S
+        if valor is None:
+            ttl, ttl_viejo = CACHE_NEGATIVO_TTL_S, 0
+            self.negativos += 1
+
+        texto = json.dumps({"v": valor, "d": duracion, "exp": time.time() + ttl}, default=str)
+        guardado = redis_client.client.eval(
+            self._LUA_GUARDAR,
+            2 + 2 * len(tags),
+            key, f"{key}{self.SUFIJO_VIEJO}", *keys_tags, *keys_versiones,
+            texto, ttl, ttl_viejo, *versiones
+        )
+        self.rellenos += 1
+
+        # Localmente se guarda lo mismo que devolvería Redis (fechas como string, etc.)
+        sobre = json.loads(texto)
+        if guardado:
+            self.local.set(key, sobre, version)
+        return sobre["v"]
+
+    def _con_lock(self, key: str, calcular: Callable[[], Any], ttl: int, tags: Sequence[str] = ()) -> Tuple[bool, Any]:
+        """Recalcula solo si obtiene el lock de relleno. Devuelve (recalculado, valor)"""
+        lock_key = f"{key}{self.SUFIJO_LOCK}"
+        token = uuid.uuid4().hex
+        if not redis_client.client.set(lock_key, token, nx=True, px=CACHE_LOCK_RELLENO_MS):
+            return False, None
+        try:
+            return True, self._calcular_y_guardar(key, calcular, ttl, tags)
+        finally:
+            redis_client.client.eval(self._LUA_LIBERAR, 1, lock_key, token)
+
+    def obtener_o_calcular(self, key: str, calcular: Callable[[], Any], ttl: int, tags: Sequence[str] = ()) -> Any:
+        """
+        Devuelve el valor cacheado o lo calcula una sola vez entre todos los workers
+
+        Args:
+            key: Key de Redis
+            calcular: Función sin argumentos que obtiene el valor (None = no existe)
+            ttl: Segundos de vigencia
+            tags: Tags bajo los que se registra la entrada (para invalidar_tags)
+
+        Returns:
+            El valor (ya pasado por JSON, como lo devolvería la caché)
+        """
+        self._asegurar_escucha()
+
+        try:
+            return self._obtener_o_calcular(key, calcular, ttl, tags)
+        except RedisError as e:
+            if not isinstance(e, RedisNoDisponible):
+                print(f"⚠️  Caché Redis no disponible, leyendo de MongoDB: {e}")
+            return self._sin_redis(key, calcular, ttl)
+
+    def _sin_redis(self, key: str, calcular: Callable[[], Any], ttl: int) -> Any:
+        """Modo degradado: solo la caché local (TTL corto) delante de MongoDB"""
+        self.degradados += 1
+        encontrado, sobre = self.local.get(key)
+        if encontrado:
+            return sobre["v"]
+        version = self.local.version()
+        sobre = json.loads(json.dumps({"v": calcular(), "d": 0, "exp": time.time() + ttl}, default=str))
+        self.local.set(key, sobre, version)
+        return sobre["v"]
+
+    def _obtener_o_calcular(self, key: str, calcular: Callable[[], Any], ttl: int, tags: Sequence[str] = ()) -> Any:
+        sobre = self._leer(key)
+        if sobre is not None:
+            if self._debe_refrescar(sobre):
+                recalculado, valor = self._con_lock(key, calcular, ttl, tags)
+                if recalculado:
+                    self.refrescos_anticipados += 1
+                    return valor
+            return sobre["v"]
+
+        recalculado, valor = self._con_lock(key, calcular, ttl, tags)
+        if recalculado:
+            return valor
+
+        # Otro worker está recalculando: copia vieja si la hay
+        viejo = redis_client.client.get(f"{key}{self.SUFIJO_VIEJO}")
+        if viejo is not None:
+            self.servidos_viejos += 1
+            return json.loads(viejo)["v"]
+
+        # Sin copia vieja: esperar un poco al que recalcula
+        limite = time.monotonic() + CACHE_ESPERA_RELLENO_S
+        while time.monotonic() < limite:
+            time.sleep(0.05)
+            cached = redis_client.client.get(key)
+            if cached is not None:
+                return json.loads(cached)["v"]
+
+        return self._calcular_y_guardar(key, calcular, ttl, tags)
+
+    def invalidar(self, *keys: str):
+        """
+        Borra las keys en Redis y avisa a todos los workers.
+        Las copias viejas se conservan para servirlas mientras se recalcula.
+        Dentro de un request se acumula y se aplica al final (ver _aplicar_invalidaciones).
+        """
+        self._invalidar(keys, ())
+
+    def invalidar_tags(self, *tags: str):
+        """
+        Borra todas las entradas registradas bajo los tags y avisa a todos los workers
+        """
+        if tags:
+            self._invalidar((), tags)
+
+    def _invalidar(self, keys: Sequence[str], tags: Sequence[str]):
+        if not diferir_en_request(f"cache:{self.canal}", self._aplicar_invalidaciones, keys=keys, tags=tags):
+            self._aplicar_invalidaciones({"keys": set(keys), "tags": set(tags)})
+
+    def _aplicar_invalidaciones(self, grupos: Dict[str, set]):
+        """Keys y tags de todo un request en un solo EVAL (UNLINK + PUBLISH)"""
+        with self._lock_pendientes:
+            keys = sorted(set(grupos.get("keys", ())) | self._pendientes["keys"])
+            tags = sorted(set(grupos.get("tags", ())) | self._pendientes["tags"])
+            self._pendientes = {"keys": set(), "tags": set()}
+        if not keys and not tags:
+            return
+        try:
+            borradas = redis_client.client.eval(
+                self._LUA_INVALIDAR,
+                len(keys) + 2 * len(tags),
+                *keys,
+                *[f"{self.PREFIJO_TAG}{tag}" for tag in tags],
+                *[f"{self.PREFIJO_TAG_VERSION}{tag}" for tag in tags],
+                len(keys),
+                self.canal
+            )
+        except RedisError as e:
+            # Redis caído: local se descarta ya; en Redis se reintenta al reconectar
+            with self._lock_pendientes:
+                self._pendientes["keys"].update(keys)
+                self._pendientes["tags"].update(tags)
+            if tags:
+                self.local.limpiar()
+            else:
+                self.local.invalidar(*keys)
+            if not isinstance(e, RedisNoDisponible):
+                print(f"⚠️  Invalidación de caché pendiente (Redis no disponible): {e}")
+            return
+        # Después del borrado: una lectura concurrente de este proceso no puede re-guardar el valor viejo
+        if borradas:
+            self.local.invalidar(*borradas)
+
+    def _reenviar_pendientes(self):
+        with self._lock_pendientes:
+            hay = self._pendientes["keys"] or self._pendientes["tags"]
+        if hay:
+            self._aplicar_invalidaciones({})
+
+    def estadisticas(self) -> Dict[str, Any]:
+        return {
+            "degradados": self.degradados,
+            "local": self.local.estadisticas(),
+            "redis": {"hits": self.redis_hits, "misses": self.redis_misses},
+            "rellenos": {
+                "calculados": self.rellenos,
+                "servidos_viejos": self.servidos_viejos,
+                "refrescos_anticipados": self.refrescos_anticipados,
+                "negativos": self.negativos
+            }
+        }
+
+
+# Instancia singleton (una por proceso)
+cache_aulas = CacheDosNiveles()
@@ -1,11 +1,32 @@
-import time
+import threading
 from pymongo import MongoClient, ReadPreference
-from pymongo.errors import ServerSelectionTimeoutError, ConnectionFailure
-from config import MONGO_URI, MONGO_DB_NAME
+from pymongo.read_preferences import SecondaryPreferred
+from pymongo.errors import PyMongoError
+from pymongo.write_concern import WriteConcern
+from config import (
+    MONGO_URI,
+    MONGO_DB_NAME,
+    MONGO_MAX_POOL_SIZE,
+    MONGO_MIN_POOL_SIZE,
+    MONGO_WAIT_QUEUE_TIMEOUT_MS,
+    MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    MONGO_MAX_STALENESS_S,
+)
 
 
 class MongoDB:
+    """
+    Conexión a MongoDB (replica set rs0) con pool configurable.
+
+    - El MongoClient se crea recién en el primer uso (no al importar).
+    - El calentamiento (ping + índices básicos) corre en un hilo aparte:
+      si Mongo todavía no está listo, el arranque no se bloquea.
+    - Escrituras y lecturas por defecto van al primario; los listados
+      pueden rutearse a secundarios con lectura_secundaria().
+    """
+
     _instance = None
+    _lock = threading.Lock()
 
     def __new__(cls):
         if cls._instance is None:
@@ -16,59 +37,124 @@ class MongoDB:
         if hasattr(self, "_initialized"):
             return
         self._initialized = True
-        self._connect_with_retry()
+        self._client = None
+        self._db = None
+
+        # Secundario si hay uno suficientemente al día; si no, primario
+        self.preferencia_listados = SecondaryPreferred(max_staleness=MONGO_MAX_STALENESS_S)
+
+    @property
+    def client(self) -> MongoClient:
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._crear_cliente()
+        return self._client
+
+    @property
+    def db(self):
+        if self._db is None:
+            self.client
+        return self._db
+
+    def _crear_cliente(self):
+        # MongoClient no bloquea: el descubrimiento del replica set es asíncrono
+        self._client = MongoClient(
+            MONGO_URI,
+            maxPoolSize=MONGO_MAX_POOL_SIZE,
+            minPoolSize=MONGO_MIN_POOL_SIZE,
+            waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+            serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+            connectTimeoutMS=10000,
+            socketTimeoutMS=10000,
+            retryWrites=True,
+            retryReads=True,
+            read_preference=ReadPreference.PRIMARY_PREFERRED,
+        )
+        self._db = self._client[MONGO_DB_NAME]
+
+        threading.Thread(target=self._calentar, name="mongo-warmup", daemon=True).start()
+
+    def _calentar(self):
+        """Ping + índices básicos en segundo plano (minPoolSize llena el pool solo)"""
+        try:
+            self._client.admin.command("ping")
+            self._db.aulas.create_index([("nro_aula", 1), ("piso", 1)], unique=True, name="idx_aula_unique")
+            print("✅ MongoDB conectado")
+        except PyMongoError as e:
+            print(f"⚠️ MongoDB todavía no disponible: {e} (se reintenta en cada operación)")
 
-    def _connect_with_retry(self):
-        max_retries = 10
-        base_delay = 2
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+
+
+_mongo = MongoDB()
 
-        for attempt in range(max_retries):
-            try:
-                print(f"🔄 Intento {attempt + 1}/{max_retries} de conexión a MongoDB...")
 
-                self.client = MongoClient(
-                    MONGO_URI,
-                    serverSelectionTimeoutMS=5000,
-                    connectTimeoutMS=10000,
-                    socketTimeoutMS=10000,
-                    retryWrites=True,
-                    read_preference=ReadPreference.PRIMARY_PREFERRED,
-                )
+def get_mongo_db():
+    return _mongo.db
 
-                admin_db = self.client.admin
-                admin_db.command("ping")
 
-                # Si quieres exigir replica set sí o sí, deja esto:
-                admin_db.command("replSetGetStatus")
+def get_mongo_client() -> MongoClient:
+    return _mongo.client
 
-                self.db = self.client[MONGO_DB_NAME]
 
-                # colecciones (si las usas en otros lados)
-                self.aulas = self.db.aulas
-                self.usuarios = self.db.usuarios
-                self.cronograma = self.db.cronograma
+def lectura_secundaria(coleccion):
+    """
+    Devuelve la colección configurada para leer de secundarios (secondaryPreferred
+    con staleness acotado). Usar solo en listados que toleran unos segundos de atraso
+    y que no rellenan una caché: lo leído de un secundario atrasado quedaría en la
+    caché hasta su TTL aunque la escritura ya la haya invalidado.
+    """
+    return coleccion.with_options(read_preference=_mongo.preferencia_listados)
 
-                # índices básicos
-                self.aulas.create_index([("nro_aula", 1), ("piso", 1)], unique=True, name="idx_aula_unique")
 
-                print("✅ MongoDB conectado")
-                return
+def ejecutar_transaccion(funcion):
+    """
+    Ejecuta funcion(session) dentro de una transacción multi-documento.
 
-            except (ServerSelectionTimeoutError, ConnectionFailure) as e:
-                if attempt < max_retries - 1:
-                    delay = base_delay * (2 ** attempt)
-                    print(f"⚠️ Error MongoDB: {e}")
-                    print(f"⏳ Reintentando en {delay} segundos...")
-                    time.sleep(delay)
-                else:
-                    raise RuntimeError(f"❌ No se pudo conectar a MongoDB: {e}")
+    with_transaction reintenta solo ante errores transitorios (TransientTransactionError,
+    UnknownTransactionCommitResult); cualquier otra excepción aborta y se propaga.
+    Lo registrado con al_confirmar() corre una sola vez, después del commit.
 
-    def close(self):
-        if hasattr(self, "client"):
-            self.client.close()
+    Args:
+        funcion: Callable que recibe la sesión y hace las escrituras con session=session
 
+    Returns:
+        Lo que devuelva funcion
+    """
+    with _mongo.client.start_session() as session:
+        def _intento(s):
+            # Cada reintento vuelve a ejecutar funcion: se descarta lo registrado antes
+            s.al_confirmar = []
+            return funcion(s)
 
-_mongo = MongoDB()
+        resultado = session.with_transaction(
+            _intento,
+            write_concern=WriteConcern("majority"),
+            read_preference=ReadPreference.PRIMARY
+        )
 
-def get_mongo_db():
-    return _mongo.db
+        for callback in session.al_confirmar:
+            try:
+                callback()
+            except Exception as e:
+                print(f"⚠️  Error después del commit: {e}")
+        return resultado
+
+
+def al_confirmar(session, callback):
+    """
+    Ejecuta callback después del commit de la transacción de 'session'
+    (o inmediatamente si no hay transacción). Para efectos fuera de MongoDB:
+    índices en memoria, contadores en Redis, invalidación de caché.
+
+    Args:
+        session: Sesión de ejecutar_transaccion o None
+        callback: Callable sin argumentos
+    """
+    if session is None:
+        callback()
+    else:
+        session.al_confirmar.append(callback)
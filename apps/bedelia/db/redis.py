@@ -2,20 +2,351 @@
 # =============================
 
 
+import random
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
 import redis 
-from redis.exceptions import RedisError
+from flask import g, has_request_context
+from redis.backoff import ExponentialBackoff
+from redis.client import Pipeline
+from redis.exceptions import RedisError, ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError
+from redis.retry import Retry
 from config import (
     REDIS_HOST,
     REDIS_PORT,
     REDIS_DB,
+    REDIS_MAX_CONEXIONES,
+    REDIS_POOL_TIMEOUT_S,
+    REDIS_CONNECT_TIMEOUT_S,
+    REDIS_SOCKET_TIMEOUT_S,
+    REDIS_HEALTH_CHECK_S,
+    REDIS_REINTENTOS,
+    REDIS_DEGRADADO_S,
     REDIS_TTL_AULA_CACHE,
     REDIS_TTL_SESION,
     REDIS_TTL_LOCK,
+    REDIS_LOCK_ESPERA_BASE_MS,
+    REDIS_LOCK_ESPERA_MAX_MS,
 )
 
 
 
 
+# -----------------------------
+# Agrupado y métricas por request
+# -----------------------------
+
+
+def _estado_request() -> Optional[Dict[str, Any]]:
+    """Estado de Redis del request de Flask en curso (None fuera de un request)"""
+    if not has_request_context():
+        return None
+    estado = g.get("_redis")
+    if estado is None:
+        estado = g._redis = {"comandos": 0, "round_trips": 0, "pendientes": {}}
+    return estado
+
+
+def _contar(comandos: int):
+    estado = _estado_request()
+    if estado is not None:
+        estado["comandos"] += comandos
+        estado["round_trips"] += 1
+
+
+def diferir_en_request(clave: str, aplicar: Callable[[Dict[str, set]], None], **grupos) -> bool:
+    """
+    Acumula valores (ej. keys a invalidar) hasta el final del request; ahí se llama
+    una sola vez aplicar({"grupo": set(valores), ...}) por clave.
+
+    Returns:
+        bool: False fuera de un request (quien llama debe aplicar en el momento)
+    """
+    estado = _estado_request()
+    if estado is None:
+        return False
+    _, acumulado = estado["pendientes"].setdefault(clave, (aplicar, {}))
+    for nombre, valores in grupos.items():
+        acumulado.setdefault(nombre, set()).update(valores)
+    return True
+
+
+def aplicar_pendientes_request():
+    """Aplica lo diferido en el request (llamado al final de cada request)"""
+    estado = _estado_request()
+    if not estado or not estado["pendientes"]:
+        return
+    pendientes, estado["pendientes"] = estado["pendientes"], {}
+    for aplicar, grupos in pendientes.values():
+        try:
+            aplicar(grupos)
+        except Exception as e:
+            print(f"⚠️  Error al aplicar operaciones diferidas de Redis: {e}")
+
+
+def estadisticas_request() -> Dict[str, int]:
+    """Comandos y round trips a Redis hechos por el request en curso"""
+    estado = _estado_request() or {}
+    return {"comandos": estado.get("comandos", 0), "round_trips": estado.get("round_trips", 0)}
+
+
+# -----------------------------
+# Modo degradado (circuit breaker)
+# -----------------------------
+
+
+class RedisNoDisponible(RedisConnectionError):
+    """Redis marcado como caído: el comando ni se intenta"""
+
+
+class CircuitoRedis:
+    """
+    Circuit breaker del cliente Redis.
+
+    Tras un error de conexión/timeout (ya reintentado por el pool) el circuito se
+    abre REDIS_DEGRADADO_S segundos: los comandos fallan al instante con
+    RedisNoDisponible y quien usa la caché va directo a MongoDB, sin pagar el
+    timeout de conexión en cada request. Vencido ese plazo, un solo comando
+    prueba la conexión (el resto sigue fallando rápido hasta que responda).
+    """
+
+    def __init__(self, degradado_s: float = REDIS_DEGRADADO_S):
+        self.degradado_s = degradado_s
+        self._lock = threading.Lock()
+        self._abierto_hasta = 0.0
+        self.abierto = False
+        self.aperturas = 0
+        self.rechazados = 0
+
+    def permitir(self) -> bool:
+        if not self.abierto:
+            return True
+        with self._lock:
+            ahora = time.monotonic()
+            if ahora < self._abierto_hasta:
+                self.rechazados += 1
+                return False
+            # Medio abierto: este comando prueba; los demás esperan otra ventana
+            self._abierto_hasta = ahora + self.degradado_s
+            return True
+
+    def fallo(self):
+        with self._lock:
+            self._abierto_hasta = time.monotonic() + self.degradado_s
+            if not self.abierto:
+                self.abierto = True
+                self.aperturas += 1
+                print(f"⚠️  Redis no disponible: modo degradado por {self.degradado_s}s")
+
+    def exito(self):
+        if self.abierto:
+            with self._lock:
+                self.abierto = False
+            print("✅ Redis disponible nuevamente")
+
+    def ejecutar(self, funcion, *args, **kwargs):
+        if not self.permitir():
+            raise RedisNoDisponible("Redis en modo degradado")
+        try:
+            resultado = funcion(*args, **kwargs)
+        except (RedisConnectionError, RedisTimeoutError):
+            self.fallo()
+            raise
+        self.exito()
+        return resultado
+
+    def estadisticas(self) -> Dict[str, Any]:
+        return {
+            "estado": "abierto" if self.abierto else "cerrado",
+            "aperturas": self.aperturas,
+            "rechazados": self.rechazados
+        }
+
+
+circuito_redis = CircuitoRedis()
+
+
+class PipelineContado(Pipeline):
+    """Pipeline que cuenta sus comandos como un solo round trip"""
+
+    def execute(self, raise_on_error=True):
+        _contar(len(self.command_stack))
+        return circuito_redis.ejecutar(super().execute, raise_on_error)
+
+
+class RedisContado(redis.Redis):
+    """Cliente Redis que lleva la cuenta de comandos por request (y pasa por el circuit breaker)"""
+
+    def execute_command(self, *args, **options):
+        _contar(1)
+        return circuito_redis.ejecutar(super().execute_command, *args, **options)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return PipelineContado(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+
+
+class LockRedis:
+    """
+    Lock distribuido sobre una o más keys, con dueño, lease renovable y fencing token.
+
+    - Cada adquisición guarda un token aleatorio: solo el dueño puede renovar o liberar
+      (compare-and-delete en Lua), así un lock vencido no borra el de otro proceso.
+    - Un hilo renueva el lease cada ttl/3 mientras el lock esté tomado; si el proceso
+      muere, el lock vence solo a los ttl segundos.
+    - perdido se marca si la renovación dice que el lock ya no es nuestro, y también
+      si Redis no responde y pasó el ttl (menos un margen) desde la última renovación
+      confirmada: sin respuesta no hay forma de saber si sigue vigente.
+    - Varias keys se toman todas o ninguna en un solo EVAL (sin orden ni deadlocks).
+    - fencing: número creciente (global) entregado en cada adquisición. Escribirlo en
+      los documentos permite a MongoDB rechazar escrituras de un dueño ya vencido.
+    """
+
+    KEY_FENCING = "lock:fencing"
+
+    # KEYS: keys del lock (n), key del contador de fencing
+    # ARGV: token, ttl en ms
+    _LUA_ADQUIRIR = """
+    local n = #KEYS - 1
+    for i = 1, n do
+        if redis.call('exists', KEYS[i]) == 1 then
+            return false
+        end
+    end
+    for i = 1, n do
+        redis.call('set', KEYS[i], ARGV[1], 'PX', ARGV[2])
+    end
+    return redis.call('incr', KEYS[#KEYS])
+    """
+
+    # ARGV: token, ttl en ms. Devuelve 0 si alguna key ya no es nuestra
+    _LUA_RENOVAR = """
+    for i = 1, #KEYS do
+        if redis.call('get', KEYS[i]) ~= ARGV[1] then
+            return 0
+        end
+    end
+    for i = 1, #KEYS do
+        redis.call('pexpire', KEYS[i], ARGV[2])
+    end
+    return 1
+    """
+
+    # ARGV: token. Borra solo las keys que siguen siendo nuestras
+    _LUA_LIBERAR = """
+    local borradas = 0
+    for i = 1, #KEYS do
+        if redis.call('get', KEYS[i]) == ARGV[1] then
+            borradas = borradas + redis.call('del', KEYS[i])
+        end
+    end
+    return borradas
+    """
+
+    def __init__(self, client, nombres: List[str], ttl: int = REDIS_TTL_LOCK, espera: float = 0):
+        self.client = client
+        self.keys = sorted({f"lock:{nombre}" for nombre in nombres})
+        self.ttl_ms = int(ttl * 1000)
+        self.espera = espera
+        self.token: Optional[str] = None
+        self.fencing: Optional[int] = None
+        self.perdido = threading.Event()
+        # Momento (monotonic) del último pedido que confirmó el lease
+        self._ultimo_ok = 0.0
+        self._detener = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+
+    def adquirir(self) -> bool:
+        """
+        Intenta tomar el lock; reintenta con backoff exponencial y jitter hasta 'espera' segundos
+
+        Returns:
+            bool: True si se adquirió
+        """
+        token = uuid.uuid4().hex
+        limite = time.monotonic() + self.espera
+        intento = 0
+
+        while True:
+            enviado = time.monotonic()
+            fencing = self.client.eval(
+                self._LUA_ADQUIRIR,
+                len(self.keys) + 1,
+                *self.keys, self.KEY_FENCING,
+                token, self.ttl_ms
+            )
+            if fencing:
+                self.token = token
+                self.fencing = int(fencing)
+                self._ultimo_ok = enviado
+                self.perdido.clear()
+                self._detener.clear()
+                self._hilo = threading.Thread(target=self._renovar, name="lock-renovacion", daemon=True)
+                self._hilo.start()
+                return True
+
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                return False
+
+            # Full jitter: evita que los que esperan reintenten todos a la vez
+            tope = min(REDIS_LOCK_ESPERA_MAX_MS, REDIS_LOCK_ESPERA_BASE_MS * (2 ** intento)) / 1000
+            time.sleep(min(restante, random.uniform(0, tope)))
+            intento += 1
+
+    def _renovar(self):
+        intervalo = self.ttl_ms / 3000
+        # El lease cuenta desde que Redis lo renovó: se da por vencido un poco antes
+        vence_en = self.ttl_ms / 1000 - self.ttl_ms / 10000
+        espera = intervalo
+        while not self._detener.wait(espera):
+            enviado = time.monotonic()
+            try:
+                vigente = self.client.eval(self._LUA_RENOVAR, len(self.keys), *self.keys, self.token, self.ttl_ms)
+            except RedisError as e:
+                restante = self._ultimo_ok + vence_en - time.monotonic()
+                if restante <= 0:
+                    print(f"⚠️  Lock perdido (Redis sin responder más que el lease): {self.keys}")
+                    self.perdido.set()
+                    return
+                print(f"⚠️  No se pudo renovar el lock {self.keys}: {e}")
+                espera = min(intervalo, restante)
+                continue
+            if not vigente:
+                print(f"⚠️  Lock perdido (vencido o tomado por otro): {self.keys}")
+                self.perdido.set()
+                return
+            self._ultimo_ok = enviado
+            espera = intervalo
+
+    def liberar(self):
+        """Libera el lock si sigue siendo nuestro y detiene la renovación"""
+        if self.token is None:
+            return
+        self._detener.set()
+        try:
+            self.client.eval(self._LUA_LIBERAR, len(self.keys), *self.keys, self.token)
+        except RedisError as e:
+            print(f"⚠️  No se pudo liberar el lock {self.keys}: {e}")
+        finally:
+            self.token = None
+
+    def __enter__(self):
+        if not self.adquirir():
+            raise ValueError("El recurso está siendo procesado por otra operación. Intente nuevamente.")
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.liberar()
+        return False
+
+
+
+
 class RedisClient:
     """
     Cliente Redis para cache, sesiones y locks distribuidos.
@@ -23,18 +354,31 @@ class RedisClient:
 
 
     def __init__(self):
-        try:
-            self.client = redis.Redis(
+        # Sin ping al importar: si Redis no está, la app levanta igual (modo degradado)
+        self.pool = redis.BlockingConnectionPool(
             host=REDIS_HOST,
             port=REDIS_PORT,
             db=REDIS_DB,
             decode_responses=True,
-            socket_connect_timeout=5,
-            )
-        # Validación de conexión
-            self.client.ping()
-        except RedisError as e:
-            raise RuntimeError(f"No se pudo conectar a Redis: {e}")
+            max_connections=REDIS_MAX_CONEXIONES,
+            timeout=REDIS_POOL_TIMEOUT_S,  # espera máxima por una conexión libre
+            socket_connect_timeout=REDIS_CONNECT_TIMEOUT_S,
+            socket_timeout=REDIS_SOCKET_TIMEOUT_S,
+            socket_keepalive=True,
+            health_check_interval=REDIS_HEALTH_CHECK_S,
+            retry=Retry(ExponentialBackoff(cap=0.5, base=0.05), REDIS_REINTENTOS),
+            retry_on_error=[RedisConnectionError, RedisTimeoutError],
+        )
+        self.client = RedisContado(connection_pool=self.pool)
+
+
+    def estado(self):
+        """ estado del pool y del circuit breaker (para /health) """
+        return {
+            **circuito_redis.estadisticas(),
+            "conexiones_max": REDIS_MAX_CONEXIONES,
+            "conexiones_abiertas": len(getattr(self.pool, "_connections", [])),
+        }
 
 
     # -----------------------------
@@ -61,13 +405,44 @@ class RedisClient:
     # -----------------------------
 
 
-    def set_sesion(self, session_id, value):
-        """ setea la sesion """
-        self.client.setex(
-            f"session:{session_id}",
-            REDIS_TTL_SESION,
-            value,
-    )
+    # KEYS: sesión, índice de sesiones del usuario.
+    # ARGV: hash del refresh anterior, hash nuevo, jti, exp del jti, ultimo_uso, ttl, id de sesión
+    # Devuelve 0 si la sesión no existe, -1 si el refresh no coincide (reuso), 1 si rotó.
+    # El índice se renueva con la sesión: si venciera antes, revocar_todas no la encontraría
+    _LUA_ROTAR_SESION = """
+    local valor = redis.call('get', KEYS[1])
+    if not valor then
+        return 0
+    end
+    local sesion = cjson.decode(valor)
+    if sesion['refresh_hash'] ~= ARGV[1] then
+        return -1
+    end
+    sesion['refresh_hash'] = ARGV[2]
+    sesion['jti'] = ARGV[3]
+    sesion['jti_exp'] = tonumber(ARGV[4])
+    sesion['ultimo_uso'] = ARGV[5]
+    redis.call('set', KEYS[1], cjson.encode(sesion), 'EX', ARGV[6])
+    redis.call('sadd', KEYS[2], ARGV[7])
+    redis.call('expire', KEYS[2], ARGV[6])
+    return 1
+    """
+
+
+    def set_sesion(self, session_id, value, id_usuario=None):
+        """ setea la sesion (y la anota en el índice del usuario) """
+        if id_usuario is None:
+            self.client.setex(
+                f"session:{session_id}",
+                REDIS_TTL_SESION,
+                value,
+            )
+            return
+        pipe = self.client.pipeline(transaction=False)
+        pipe.setex(f"session:{session_id}", REDIS_TTL_SESION, value)
+        pipe.sadd(f"sesiones_usuario:{id_usuario}", session_id)
+        pipe.expire(f"sesiones_usuario:{id_usuario}", REDIS_TTL_SESION)
+        pipe.execute()
 
 
     def get_sesion(self, session_id):
@@ -75,24 +450,61 @@ class RedisClient:
         return self.client.get(f"session:{session_id}")
 
 
+    def rotar_sesion(self, session_id, id_usuario, hash_anterior, hash_nuevo, jti, jti_exp, ultimo_uso):
+        """ cambia el refresh token de la sesion si el anterior coincide (atómico); renueva el índice del usuario """
+        return int(self.client.eval(
+            self._LUA_ROTAR_SESION, 2, f"session:{session_id}", f"sesiones_usuario:{id_usuario}",
+            hash_anterior, hash_nuevo, jti, jti_exp, ultimo_uso, REDIS_TTL_SESION, session_id,
+        ))
+
+
+    def borrar_sesion(self, session_id, id_usuario=None):
+        """ borra la sesion; devuelve True si existía """
+        pipe = self.client.pipeline(transaction=False)
+        pipe.delete(f"session:{session_id}")
+        if id_usuario is not None:
+            pipe.srem(f"sesiones_usuario:{id_usuario}", session_id)
+        return bool(pipe.execute()[0])
+
+
+    def sesiones_usuario(self, id_usuario):
+        """ sesiones vigentes del usuario {session_id: valor}; limpia las vencidas del índice """
+        indice = f"sesiones_usuario:{id_usuario}"
+        ids = sorted(self.client.smembers(indice))
+        if not ids:
+            return {}
+        valores = self.client.mget([f"session:{i}" for i in ids])
+        vencidas = [i for i, v in zip(ids, valores) if v is None]
+        if vencidas:
+            self.client.srem(indice, *vencidas)
+        return {i: v for i, v in zip(ids, valores) if v is not None}
+
+
     # -----------------------------
     # Locks Distribuidos
     # -----------------------------
 
 
-    def acquire_lock(self, lock_key):
-        """ adquiere el lock """
-        return self.client.set(
-            f"lock:{lock_key}",
-            "1",
-            nx=True,
-            ex=REDIS_TTL_LOCK,
-        )
+    def lock(self, *nombres, ttl=REDIS_TTL_LOCK, espera=0):
+        """
+        Lock con dueño sobre uno o más recursos (usar con 'with')
+
+        ttl es la duración del lease: se renueva solo mientras el lock esté tomado,
+        así que operaciones largas no necesitan un TTL largo.
+        """
+        return LockRedis(self.client, list(nombres), ttl=ttl, espera=espera)
+
+
+    def acquire_lock(self, lock_key, espera=0):
+        """ adquiere el lock; devuelve el LockRedis o None """
+        candado = self.lock(lock_key, espera=espera)
+        return candado if candado.adquirir() else None
 
 
-    def release_lock(self, lock_key):
-        """ libera el lock """
-        self.client.delete(f"lock:{lock_key}")
+    def release_lock(self, candado):
+        """ libera el lock (solo si sigue siendo del dueño) """
+        if candado is not None:
+            candado.liberar()
     # Instancia singleton
     
 redis_client = RedisClient()
@@ -8,11 +8,20 @@ from .usuario import UsuarioModel
 from .cronograma import CronogramaModel
 from .carrera_materia import CarreraMateriaModel
 from .asignacion import AsignacionModel
+from .cronograma_index import IntervalosDia
+from .batch_loader import BatchLoader, cargar_por_ids
+from .aula_contadores import ContadoresAula
+from .outbox import OutboxModel
 
 __all__ = [
     'AulaModel',
     'UsuarioModel',
     'CronogramaModel',
     'CarreraMateriaModel',
-    'AsignacionModel'
+    'AsignacionModel',
+    'IntervalosDia',
+    'BatchLoader',
+    'cargar_por_ids',
+    'ContadoresAula',
+    'OutboxModel'
 ]
@@ -4,7 +4,7 @@ Gestiona relaciones usuario-carrera y profesor-materia
 """
 
 from datetime import datetime, date
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Iterable, Set, Tuple
 from bson import ObjectId
 from pymongo.errors import DuplicateKeyError
 
@@ -331,7 +331,40 @@ class AsignacionModel:
             query["activa"] = True
         
         return list(coleccion.find(query))
-    
+
+    @staticmethod
+    def obtener_materias_profesor_detalle(coleccion, id_profesor: ObjectId, solo_activas: bool = True) -> List[Dict[str, Any]]:
+        """
+        Obtiene las asignaciones de un profesor junto con los datos de cada materia
+        (una sola agregación con $lookup sobre carrera_materias)
+
+        Args:
+            coleccion: Colección profesor_carrera_materia
+            id_profesor: ObjectId del profesor
+            solo_activas: Si True, solo devuelve asignaciones activas
+
+        Returns:
+            Lista de asignaciones con el documento de la materia en 'materia_doc'
+            (las asignaciones cuya materia no existe se omiten)
+        """
+        query = {"id_profesor": id_profesor}
+
+        if solo_activas:
+            query["activa"] = True
+
+        pipeline = [
+            {"$match": query},
+            {"$lookup": {
+                "from": "carrera_materias",
+                "localField": "id_materia",
+                "foreignField": "_id",
+                "as": "materia_doc"
+            }},
+            {"$unwind": "$materia_doc"}
+        ]
+
+        return list(coleccion.aggregate(pipeline))
+
     @staticmethod
     def verificar_profesor_en_carrera(coleccion, id_profesor: ObjectId, carrera: str) -> bool:
         """
@@ -353,6 +386,28 @@ class AsignacionModel:
         
         return resultado is not None
     
+    @staticmethod
+    def obtener_carreras_profesores(coleccion, ids_profesor: Iterable[ObjectId]) -> Set[Tuple[ObjectId, str]]:
+        """
+        Obtiene en una sola consulta las carreras activas de varios profesores (validación por lotes)
+        
+        Args:
+            coleccion: Colección profesor_carrera_materia
+            ids_profesor: ObjectIds de los profesores
+            
+        Returns:
+            Conjunto de pares (id_profesor, carrera) con al menos una materia activa
+        """
+        ids = list(set(ids_profesor))
+        if not ids:
+            return set()
+        
+        cursor = coleccion.find(
+            {"id_profesor": {"$in": ids}, "activa": True},
+            {"id_profesor": 1, "carrera": 1}
+        )
+        return {(doc["id_profesor"], doc["carrera"]) for doc in cursor}
+    
     @staticmethod
     def desactivar_asignacion(coleccion, id_profesor: ObjectId, id_materia: ObjectId) -> bool:
         """
@@ -4,10 +4,15 @@ Gestiona la validación y operaciones sobre la colección 'aulas'
 """
 
 from datetime import datetime
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Iterable, Tuple, Callable
 from bson import ObjectId
+from pymongo import UpdateOne, ReturnDocument
 from pymongo.errors import DuplicateKeyError
 
+from db.mongo import al_confirmar
+from .batch_loader import cargar_por_ids
+from .aula_contadores import contadores_aula
+
 
 class AulaModel:
     """
@@ -16,6 +21,48 @@ class AulaModel:
     
     ESTADOS_VALIDOS = ["disponible", "ocupada", "deshabilitada"]
     
+    # Funciones (ids_aula, estado_anterior, estado_nuevo) avisadas en cada cambio de estado
+    # (estado_anterior None = aula nueva). Ej: invalidación de cachés del aula y por estado
+    _oyentes_estado: List[Callable[[List[ObjectId], Optional[str], str], None]] = []
+    
+    @staticmethod
+    def suscribir_cambios_estado(oyente: Callable[[List[ObjectId], Optional[str], str], None]):
+        """
+        Registra una función a avisar en cada cambio de estado de aulas
+        
+        Args:
+            oyente: Función (ids_aula, estado_anterior, estado_nuevo)
+        """
+        if oyente not in AulaModel._oyentes_estado:
+            AulaModel._oyentes_estado.append(oyente)
+    
+    @staticmethod
+    def _notificar_estado(ids_aula: List[ObjectId], estado_anterior: Optional[str], estado_nuevo: str,
+                          cantidad: Optional[int] = None, session=None):
+        # cantidad: aulas que cambiaron de verdad (bulk), si es menor que len(ids_aula)
+        if cantidad is None:
+            cantidad = len(ids_aula)
+        if cantidad <= 0:
+            return
+        
+        # Dentro de una transacción se avisa recién después del commit
+        if session is not None:
+            al_confirmar(
+                session,
+                lambda: AulaModel._notificar_estado(ids_aula, estado_anterior, estado_nuevo, cantidad)
+            )
+            return
+        
+        # ocupada -> ocupada (cambió la asignación actual): solo invalida, no mueve contadores
+        if estado_anterior is not None and estado_anterior != estado_nuevo:
+            contadores_aula.registrar_cambio(estado_anterior, estado_nuevo, cantidad)
+        
+        for oyente in AulaModel._oyentes_estado:
+            try:
+                oyente(ids_aula, estado_anterior, estado_nuevo)
+            except Exception as e:
+                print(f"⚠️  Error al notificar cambio de estado de aula: {e}")
+    
     @staticmethod
     def validar_datos(data: Dict[str, Any], es_actualizacion: bool = False) -> Dict[str, Any]:
         """
@@ -147,9 +194,12 @@ class AulaModel:
         
         try:
             resultado = coleccion.insert_one(documento)
-            return resultado.inserted_id
         except DuplicateKeyError:
             raise ValueError(f"Ya existe un aula con número {data['nro_aula']} en el piso {data['piso']}")
+        
+        contadores_aula.registrar_alta(documento["estado"])
+        AulaModel._notificar_estado([resultado.inserted_id], None, documento["estado"])
+        return resultado.inserted_id
     
     @staticmethod
     def actualizar(coleccion, id_aula: ObjectId, data: Dict[str, Any]) -> bool:
@@ -169,6 +219,19 @@ class AulaModel:
         """
         documento = AulaModel.validar_datos(data, es_actualizacion=True)
         
+        if "estado" in documento:
+            # Se necesita el estado previo para mantener los contadores
+            anterior = coleccion.find_one_and_update(
+                {"_id": id_aula},
+                {"$set": documento},
+                projection={"estado": 1},
+                return_document=ReturnDocument.BEFORE
+            )
+            if anterior is None:
+                raise ValueError(f"No se encontró el aula con ID {id_aula}")
+            AulaModel._notificar_estado([id_aula], anterior.get("estado"), documento["estado"])
+            return True
+        
         resultado = coleccion.update_one(
             {"_id": id_aula},
             {"$set": documento}
@@ -193,6 +256,20 @@ class AulaModel:
         """
         return coleccion.find_one({"_id": id_aula})
     
+    @staticmethod
+    def obtener_por_ids(coleccion, ids_aula: Iterable[ObjectId]) -> Dict[ObjectId, Dict[str, Any]]:
+        """
+        Obtiene varias aulas en una sola consulta
+        
+        Args:
+            coleccion: Colección MongoDB
+            ids_aula: ObjectIds de las aulas
+            
+        Returns:
+            Diccionario id_aula -> documento (las inexistentes no aparecen)
+        """
+        return cargar_por_ids(coleccion, ids_aula)
+    
     @staticmethod
     def obtener_por_numero_piso(coleccion, nro_aula: int, piso: int) -> Optional[Dict[str, Any]]:
         """
@@ -223,6 +300,26 @@ class AulaModel:
         query = filtros if filtros else {}
         return list(coleccion.find(query).sort("nro_aula", 1))
     
+    @staticmethod
+    def contar_por_estado(coleccion) -> Dict[str, int]:
+        """
+        Cuenta aulas por estado en una sola agregación ($group)
+        
+        Args:
+            coleccion: Colección MongoDB
+            
+        Returns:
+            Diccionario estado -> cantidad, con todos los estados válidos y 'total'
+        """
+        conteos = {estado: 0 for estado in AulaModel.ESTADOS_VALIDOS}
+        total = 0
+        for grupo in coleccion.aggregate([{"$group": {"_id": "$estado", "cantidad": {"$sum": 1}}}]):
+            total += grupo["cantidad"]
+            if grupo["_id"] is not None:
+                conteos[grupo["_id"]] = grupo["cantidad"]
+        conteos["total"] = total
+        return conteos
+    
     @staticmethod
     def cambiar_estado(coleccion, id_aula: ObjectId, nuevo_estado: str) -> bool:
         """
@@ -242,30 +339,37 @@ class AulaModel:
         if nuevo_estado not in AulaModel.ESTADOS_VALIDOS:
             raise ValueError(f"Estado inválido. Debe ser uno de: {', '.join(AulaModel.ESTADOS_VALIDOS)}")
         
-        resultado = coleccion.update_one(
+        anterior = coleccion.find_one_and_update(
             {"_id": id_aula},
             {
                 "$set": {
                     "estado": nuevo_estado,
                     "updated_at": datetime.utcnow()
                 }
-            }
+            },
+            projection={"estado": 1},
+            return_document=ReturnDocument.BEFORE
         )
         
-        if resultado.matched_count == 0:
+        if anterior is None:
             raise ValueError(f"No se encontró el aula con ID {id_aula}")
         
-        return resultado.modified_count > 0
+        AulaModel._notificar_estado([id_aula], anterior.get("estado"), nuevo_estado)
+        return True
     
     @staticmethod
-    def asignar(coleccion, id_aula: ObjectId, id_cronograma: ObjectId) -> bool:
+    def asignar(coleccion, id_aula: ObjectId, id_cronograma: ObjectId, session=None) -> bool:
         """
         Marca un aula como ocupada y registra la asignación actual
         
+        El update condicional (estado "disponible") es atómico: de dos asignaciones
+        concurrentes sobre la misma aula solo una modifica el documento.
+        
         Args:
             coleccion: Colección MongoDB
             id_aula: ObjectId del aula
             id_cronograma: ObjectId del cronograma asignado
+            session: Sesión de una transacción (opcional)
             
         Returns:
             True si se actualizó correctamente
@@ -278,24 +382,143 @@ class AulaModel:
                     "id_asignacion_actual": id_cronograma,
                     "updated_at": datetime.utcnow()
                 }
-            }
+            },
+            session=session
         )
         
+        # El filtro garantiza que el estado previo era "disponible"
+        AulaModel._notificar_estado(
+            [id_aula], "disponible", "ocupada", resultado.modified_count, session=session
+        )
         return resultado.modified_count > 0
     
     @staticmethod
-    def liberar(coleccion, id_aula: ObjectId) -> bool:
+    def ocupar(coleccion, id_aula: ObjectId, id_cronograma: ObjectId, session=None) -> bool:
+        """
+        Ocupa un aula con un cronograma nuevo (mismo criterio que asignar_lote)
+        
+        Un aula puede tener varios cronogramas programados que no se superponen: si
+        estaba disponible pasa a ocupada con este cronograma como asignación actual;
+        si ya estaba ocupada conserva su asignación actual. El documento se escribe
+        siempre, así dos reservas concurrentes del aula chocan (WriteConflict) y la
+        reintentada ve el cronograma de la otra.
+        
+        Args:
+            coleccion: Colección MongoDB
+            id_aula: ObjectId del aula
+            id_cronograma: ObjectId del cronograma nuevo
+            session: Sesión de una transacción (opcional)
+            
+        Returns:
+            True si el aula se ocupó (False si no existe o está deshabilitada)
+        """
+        ahora = datetime.utcnow()
+        resultado = coleccion.update_one(
+            {"_id": id_aula, "estado": "disponible"},
+            {
+                "$set": {
+                    "estado": "ocupada",
+                    "id_asignacion_actual": id_cronograma,
+                    "updated_at": ahora
+                }
+            },
+            session=session
+        )
+        if resultado.modified_count:
+            AulaModel._notificar_estado([id_aula], "disponible", "ocupada", session=session)
+            return True
+        
+        resultado = coleccion.update_one(
+            {"_id": id_aula, "estado": "ocupada"},
+            {"$set": {"updated_at": ahora}},
+            session=session
+        )
+        return resultado.matched_count > 0
+    
+    @staticmethod
+    def asignar_lote(coleccion, asignaciones: List[Tuple[ObjectId, ObjectId]], session=None,
+                     fencing: Optional[int] = None) -> int:
+        """
+        Ocupa varias aulas en un solo bulk_write (misma regla que ocupar)
+        
+        Un lote puede traer varios cronogramas de la misma aula (horarios que no se
+        superponen): se escribe una sola vez cada aula. Las disponibles quedan con el
+        primero de la lista como asignación actual; las ya ocupadas conservan la suya.
+        
+        Args:
+            coleccion: Colección MongoDB
+            asignaciones: Lista de (id_aula, id_cronograma), el primero de cada aula
+                queda como asignación actual
+            session: Sesión de una transacción (opcional)
+            fencing: Fencing token del lock de las cargas masivas (opcional). Se guarda en
+                el aula y no se escribe sobre aulas con un token mayor (otra carga masiva
+                tomó el lock vencido). Solo ordena cargas masivas entre sí: ocupar no
+                toma el lock y queda excluida por la transacción, no por el token
+            
+        Returns:
+            Cantidad de aulas escritas (disponibles u ocupadas, sin deshabilitadas)
+        """
+        if not asignaciones:
+            return 0
+        
+        primera = {}
+        for id_aula, id_cronograma in asignaciones:
+            primera.setdefault(id_aula, id_cronograma)
+        
+        filtro_fencing = {} if fencing is None else {"fencing_lock": {"$not": {"$gt": fencing}}}
+        estados = {
+            aula["_id"]: aula["estado"]
+            for aula in coleccion.find(
+                {"_id": {"$in": list(primera)}, **filtro_fencing}, {"estado": 1}, session=session
+            )
+        }
+        libres = [id_aula for id_aula in primera if estados.get(id_aula) == "disponible"]
+        ocupadas = [id_aula for id_aula in primera if estados.get(id_aula) == "ocupada"]
+        
+        ahora = datetime.utcnow()
+        cambios_fencing = {} if fencing is None else {"fencing_lock": fencing}
+        operaciones = [
+            UpdateOne(
+                {"_id": id_aula, "estado": "disponible", **filtro_fencing},
+                {
+                    "$set": {
+                        "estado": "ocupada",
+                        "id_asignacion_actual": primera[id_aula],
+                        "updated_at": ahora,
+                        **cambios_fencing
+                    }
+                }
+            )
+            for id_aula in libres
+        ] + [
+            UpdateOne(
+                {"_id": id_aula, "estado": "ocupada", **filtro_fencing},
+                {"$set": {"updated_at": ahora, **cambios_fencing}}
+            )
+            for id_aula in ocupadas
+        ]
+        if not operaciones:
+            return 0
+        
+        resultado = coleccion.bulk_write(operaciones, ordered=False, session=session)
+        # Solo las que estaban disponibles cambian de estado
+        AulaModel._notificar_estado(libres, "disponible", "ocupada", session=session)
+        return resultado.matched_count
+    
+    @staticmethod
+    def liberar(coleccion, id_aula: ObjectId, session=None) -> bool:
         """
         Libera un aula (disponible, sin asignación)
         
         Args:
             coleccion: Colección MongoDB
             id_aula: ObjectId del aula
+            session: Sesión de una transacción (opcional)
             
         Returns:
             True si se actualizó correctamente
         """
-        resultado = coleccion.update_one(
+        anterior = coleccion.find_one_and_update(
             {"_id": id_aula},
             {
                 "$set": {
@@ -303,7 +526,60 @@ class AulaModel:
                     "id_asignacion_actual": None,
                     "updated_at": datetime.utcnow()
                 }
-            }
+            },
+            projection={"estado": 1},
+            return_document=ReturnDocument.BEFORE,
+            session=session
         )
         
-        return resultado.modified_count > 0
+        if anterior is None:
+            return False
+        
+        AulaModel._notificar_estado([id_aula], anterior.get("estado"), "disponible", session=session)
+        return True
+    
+    @staticmethod
+    def liberar_asignacion(coleccion, id_aula: ObjectId, id_cronograma: ObjectId,
+                           siguiente: Optional[ObjectId] = None, session=None) -> bool:
+        """
+        Libera un aula al terminar uno de sus cronogramas
+        
+        Solo actúa si id_cronograma es la asignación actual del aula: con otro
+        cronograma todavía programado o activo (siguiente), el aula sigue ocupada y
+        pasa a ese; sin ninguno, queda disponible. Si no era la asignación actual, el
+        aula no cambia pero el documento se escribe igual, así una liberación
+        concurrente de la asignación actual choca (WriteConflict) y ve este cambio.
+        
+        Args:
+            coleccion: Colección MongoDB
+            id_aula: ObjectId del aula
+            id_cronograma: ObjectId del cronograma que termina
+            siguiente: ObjectId del próximo cronograma vigente del aula (None si no hay)
+            session: Sesión de una transacción (opcional)
+            
+        Returns:
+            True si la asignación actual cambió
+        """
+        ahora = datetime.utcnow()
+        if siguiente is None:
+            cambios = {"estado": "disponible", "id_asignacion_actual": None, "updated_at": ahora}
+        else:
+            cambios = {"id_asignacion_actual": siguiente, "updated_at": ahora}
+        
+        anterior = coleccion.find_one_and_update(
+            {"_id": id_aula, "id_asignacion_actual": id_cronograma},
+            {"$set": cambios},
+            projection={"estado": 1},
+            return_document=ReturnDocument.BEFORE,
+            session=session
+        )
+        
+        if anterior is None:
+            coleccion.update_one({"_id": id_aula}, {"$set": {"updated_at": ahora}}, session=session)
+            return False
+        
+        # ocupada -> ocupada también avisa: invalida el aula cacheada con la asignación vieja
+        AulaModel._notificar_estado(
+            [id_aula], anterior.get("estado"), cambios.get("estado", anterior.get("estado")), session=session
+        )
+        return True
@@ -0,0 +1,174 @@
+"""
+Contadores de aulas por estado
+HASH en Redis mantenido por AulaModel en cada escritura; lectura O(1) de las métricas
+"""
+
+import time
+from typing import Dict, Any
+
+from config import AULAS_CONTADORES_RECONCILIAR_S
+
+
+class ContadoresAula:
+    """
+    Contadores incrementales de aulas por estado.
+
+    - AulaModel los actualiza (HINCRBY dentro de MULTI) después de cada escritura;
+      cada actualización incrementa además el campo _version.
+    - Cada AULAS_CONTADORES_RECONCILIAR_S (o si el hash no existe) un solo proceso,
+      bajo un SET NX, los recalcula desde MongoDB con un único $group, para
+      corregir desvíos (caídas de Redis, escrituras a mano).
+    - El resultado se escribe solo si _version no cambió mientras corría el $group
+      (compare-and-set en Lua): un HINCRBY concurrente nunca se pierde; si hubo uno,
+      la reconciliación se descarta y se reintenta en la próxima lectura.
+    - Si Redis no responde, las escrituras siguen y la lectura cae a MongoDB.
+    """
+
+    KEY = "aulas:contadores"
+    KEY_LOCK_RECONCILIAR = "aulas:contadores:reconciliando"
+    CAMPO_TOTAL = "total"
+    CAMPO_RECONCILIADO = "_reconciliado_at"
+    CAMPO_VERSION = "_version"
+    ESTADOS = ["disponible", "ocupada", "deshabilitada"]
+
+    # KEYS: hash de contadores. ARGV: versión leída antes del $group ("" si no había),
+    # luego pares campo, valor. Reemplaza el hash solo si la versión sigue igual
+    _LUA_REEMPLAZAR_SI_VERSION = """
+    local actual = redis.call('hget', KEYS[1], '_version') or ''
+    if actual ~= ARGV[1] then
+        return 0
+    end
+    redis.call('del', KEYS[1])
+    redis.call('hset', KEYS[1], unpack(ARGV, 2))
+    if ARGV[1] ~= '' then
+        redis.call('hset', KEYS[1], '_version', ARGV[1])
+    end
+    return 1
+    """
+
+    @staticmethod
+    def _redis():
+        # Import diferido: los modelos se pueden usar sin Redis (scripts, pruebas)
+        from db.redis import redis_client
+        return redis_client.client
+
+    @staticmethod
+    def _contar(coleccion) -> Dict[str, int]:
+        # Import diferido: aula.py importa este módulo
+        from .aula import AulaModel
+        return AulaModel.contar_por_estado(coleccion)
+
+    # -----------------------------
+    # Actualización (llamado desde AulaModel)
+    # -----------------------------
+
+    def registrar_alta(self, estado: str):
+        """Suma un aula nueva en su estado inicial"""
+        try:
+            pipe = self._redis().pipeline(transaction=True)
+            pipe.hincrby(self.KEY, self.CAMPO_TOTAL, 1)
+            pipe.hincrby(self.KEY, estado, 1)
+            pipe.hincrby(self.KEY, self.CAMPO_VERSION, 1)
+            pipe.execute()
+        except Exception as e:
+            print(f"⚠️  No se pudo actualizar contadores de aulas: {e}")
+
+    def registrar_cambio(self, estado_anterior: str, estado_nuevo: str, cantidad: int = 1):
+        """Mueve 'cantidad' aulas de un estado a otro"""
+        if cantidad <= 0 or estado_anterior == estado_nuevo:
+            return
+        try:
+            pipe = self._redis().pipeline(transaction=True)
+            pipe.hincrby(self.KEY, estado_anterior, -cantidad)
+            pipe.hincrby(self.KEY, estado_nuevo, cantidad)
+            pipe.hincrby(self.KEY, self.CAMPO_VERSION, 1)
+            pipe.execute()
+        except Exception as e:
+            print(f"⚠️  No se pudo actualizar contadores de aulas: {e}")
+
+    # -----------------------------
+    # Lectura y reconciliación
+    # -----------------------------
+
+    def reconciliar(self, coleccion) -> Dict[str, int]:
+        """
+        Recalcula los contadores desde MongoDB (un solo $group) y los reemplaza en Redis
+        si ninguna actualización incremental ocurrió mientras tanto.
+        Llamar con KEY_LOCK_RECONCILIAR tomado.
+
+        Args:
+            coleccion: Colección aulas
+
+        Returns:
+            Diccionario estado -> cantidad (incluye 'total'), según MongoDB
+        """
+        r = self._redis()
+        try:
+            version = r.hget(self.KEY, self.CAMPO_VERSION) or ""
+        except Exception as e:
+            print(f"⚠️  No se pudo leer contadores de aulas: {e}")
+            return self._contar(coleccion)
+
+        conteos = self._contar(coleccion)
+        campos = {**conteos, self.CAMPO_RECONCILIADO: int(time.time())}
+        try:
+            reemplazado = r.eval(
+                self._LUA_REEMPLAZAR_SI_VERSION,
+                1,
+                self.KEY,
+                version,
+                *(x for par in campos.items() for x in par)
+            )
+            if not reemplazado:
+                # Hubo un HINCRBY durante el $group: se reintenta en la próxima lectura
+                r.delete(self.KEY_LOCK_RECONCILIAR)
+        except Exception as e:
+            print(f"⚠️  No se pudo guardar contadores de aulas: {e}")
+        return conteos
+
+    def obtener(self, coleccion) -> Dict[str, int]:
+        """
+        Devuelve los contadores (HGETALL). Reconcilia si no existen o están vencidos.
+
+        Args:
+            coleccion: Colección aulas (para reconciliar)
+
+        Returns:
+            Diccionario estado -> cantidad (incluye 'total')
+        """
+        try:
+            r = self._redis()
+            datos: Dict[str, Any] = r.hgetall(self.KEY)
+        except Exception as e:
+            print(f"⚠️  Contadores de aulas no disponibles en Redis: {e}")
+            return self._contar(coleccion)
+
+        # Sin reconciliar nunca (hash ausente, o solo deltas sueltos): no sirve como total
+        sin_base = self.CAMPO_RECONCILIADO not in datos
+        vencido = sin_base or (
+            int(time.time()) - int(datos[self.CAMPO_RECONCILIADO]) >= AULAS_CONTADORES_RECONCILIAR_S
+        )
+
+        # Un solo proceso reconcilia; el resto sigue sirviendo los contadores actuales
+        # (o, si todavía no hay base, cuenta en MongoDB sin escribir)
+        if vencido:
+            try:
+                tomado = r.set(self.KEY_LOCK_RECONCILIAR, "1", nx=True, ex=AULAS_CONTADORES_RECONCILIAR_S)
+            except Exception as e:
+                print(f"⚠️  Contadores de aulas no disponibles en Redis: {e}")
+                tomado = False
+            if tomado:
+                return self.reconciliar(coleccion)
+            if sin_base:
+                return self._contar(coleccion)
+
+        conteos = {estado: 0 for estado in self.ESTADOS}
+        conteos[self.CAMPO_TOTAL] = 0
+        for campo, valor in datos.items():
+            if not campo.startswith("_"):
+                conteos[campo] = int(valor)
+        return conteos
+
+
+# Instancia singleton (una por proceso)
+contadores_aula = ContadoresAula()
@@ -0,0 +1,98 @@
+"""
+Carga por lotes
+Resuelve referencias (id_aula, id_materia, id_profesor...) con una consulta $in por colección
+en lugar de una consulta por fila (N+1)
+"""
+
+from typing import Optional, Dict, Any, List, Iterable
+from bson import ObjectId
+
+
+def cargar_por_ids(coleccion, ids: Iterable[ObjectId], proyeccion: Optional[Dict[str, int]] = None) -> Dict[ObjectId, Dict[str, Any]]:
+    """
+    Obtiene varios documentos en una sola consulta
+
+    Args:
+        coleccion: Colección MongoDB
+        ids: ObjectIds a buscar (se ignoran None y repetidos)
+        proyeccion: Campos a devolver (opcional)
+
+    Returns:
+        Diccionario _id -> documento (los inexistentes no aparecen)
+    """
+    ids = list({i for i in ids if i is not None})
+    if not ids:
+        return {}
+    return {doc["_id"]: doc for doc in coleccion.find({"_id": {"$in": ids}}, proyeccion)}
+
+
+class BatchLoader:
+    """
+    Cargador por lotes con memoria por instancia.
+
+    Pensado para vivir lo que dura un request: las referencias ya resueltas
+    no se vuelven a pedir y las nuevas se piden todas juntas.
+
+    Ejemplo:
+        materias = BatchLoader(db.carrera_materias, {"materia": 1, "codigo_materia": 1})
+        materias.cargar(c["id_materia"] for c in cronogramas)
+        for c in cronogramas:
+            c["materia"] = materias.obtener(c["id_materia"])
+    """
+
+    def __init__(self, coleccion, proyeccion: Optional[Dict[str, int]] = None):
+        self.coleccion = coleccion
+        self.proyeccion = proyeccion
+        self._cache: Dict[ObjectId, Optional[Dict[str, Any]]] = {}
+
+    def cargar(self, ids: Iterable[ObjectId]) -> Dict[ObjectId, Dict[str, Any]]:
+        """
+        Resuelve los ids pendientes en una sola consulta
+
+        Args:
+            ids: ObjectIds a resolver
+
+        Returns:
+            Diccionario _id -> documento con los ids pedidos que existen
+        """
+        ids = {i for i in ids if i is not None}
+        pendientes = [i for i in ids if i not in self._cache]
+        if pendientes:
+            encontrados = cargar_por_ids(self.coleccion, pendientes, self.proyeccion)
+            for i in pendientes:
+                self._cache[i] = encontrados.get(i)
+        return {i: self._cache[i] for i in ids if self._cache[i] is not None}
+
+    def obtener(self, id_doc: ObjectId) -> Optional[Dict[str, Any]]:
+        """
+        Devuelve un documento ya cargado (si no se cargó antes, hace una consulta)
+        """
+        if id_doc not in self._cache:
+            self.cargar([id_doc])
+        return self._cache.get(id_doc)
+
+    def enriquecer(self, documentos: List[Dict[str, Any]], campo_id: str, destino: str,
+                   campos: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        Agrega a cada documento los datos referenciados por 'campo_id' (una consulta para todos)
+
+        Args:
+            documentos: Documentos a enriquecer (se modifican en el lugar)
+            campo_id: Campo con el ObjectId referenciado
+            destino: Campo donde se guardan los datos referenciados (None si no existe)
+            campos: Campos del referenciado a copiar (default: todos menos _id)
+
+        Returns:
+            La misma lista de documentos
+        """
+        self.cargar(doc.get(campo_id) for doc in documentos)
+        for doc in documentos:
+            ref = self._cache.get(doc.get(campo_id))
+            if ref is None:
+                doc[destino] = None
+            else:
+                doc[destino] = {
+                    k: v for k, v in ref.items()
+                    if k != "_id" and (campos is None or k in campos)
+                }
+        return documentos
@@ -7,6 +7,8 @@ from datetime import datetime, date, time
 from typing import Optional, Dict, Any, List
 from bson import ObjectId
 
+from .cronograma_index import leer_intervalos, hora_a_minutos, normalizar_fecha, ESTADOS_OCUPAN
+
 
 class CronogramaModel:
     """
@@ -233,6 +235,12 @@ class CronogramaModel:
             name="idx_profesor"
         )
         
+        # Índice para el control de solapamientos: rango (aula, día) de los vigentes
+        coleccion.create_index(
+            [("id_aula", 1), ("fecha", 1), ("estado", 1)],
+            name="idx_aula_fecha_estado"
+        )
+        
         # Índice para búsquedas por fecha y estado
         coleccion.create_index(
             [("fecha", 1), ("estado", 1)],
@@ -258,13 +266,14 @@ class CronogramaModel:
         )
     
     @staticmethod
-    def crear(coleccion, data: Dict[str, Any]) -> ObjectId:
+    def crear(coleccion, data: Dict[str, Any], session=None) -> ObjectId:
         """
         Crea un cronograma en la base de datos
         
         Args:
             coleccion: Colección MongoDB
             data: Datos del cronograma
+            session: Sesión de una transacción (opcional)
             
         Returns:
             ObjectId del documento creado
@@ -276,27 +285,93 @@ class CronogramaModel:
         
         documento = CronogramaModel.validar_datos(data, es_actualizacion=False)
         
+        # Dentro de una transacción lee el mismo snapshot en el que se escribe
+        if CronogramaModel.hay_solapamiento(
+            coleccion,
+            documento["id_aula"],
+            documento["fecha"],
+            documento["hora_inicio"],
+            documento["hora_fin"],
+            session=session
+        ):
+            raise ValueError("El horario se superpone con otra asignación del aula en esa fecha")
+        
         try:
-            resultado = coleccion.insert_one(documento)
-            return resultado.inserted_id
+            resultado = coleccion.insert_one(documento, session=session)
         except DuplicateKeyError:
             raise ValueError(
                 f"Ya existe una asignación para el aula en esa fecha y hora"
             )
+        
+        return resultado.inserted_id
     
     @staticmethod
-    def obtener_por_id(coleccion, id_cronograma: ObjectId) -> Optional[Dict[str, Any]]:
+    def hay_solapamiento(coleccion, id_aula: ObjectId, fecha: Any, hora_inicio: str, hora_fin: str,
+                         excluir: Optional[ObjectId] = None, session=None) -> bool:
+        """
+        Verifica contra MongoDB si el horario se superpone con una asignación vigente del aula
+        
+        Args:
+            coleccion: Colección MongoDB
+            id_aula: ObjectId del aula
+            fecha: Fecha (date, datetime o "YYYY-MM-DD")
+            hora_inicio: Formato "HH:MM"
+            hora_fin: Formato "HH:MM"
+            excluir: ObjectId de un cronograma a ignorar (el que se está modificando)
+            session: Sesión de una transacción (opcional)
+            
+        Returns:
+            True si hay solapamiento
+        """
+        fecha = normalizar_fecha(fecha)
+        ocupados = leer_intervalos(coleccion, [id_aula], [fecha], session=session)[(id_aula, fecha)]
+        if excluir is not None:
+            ocupados.quitar(excluir)
+        return ocupados.hay_solapamiento(
+            hora_a_minutos(hora_inicio),
+            hora_a_minutos(hora_fin)
+        )
+    
+    @staticmethod
+    def siguiente_vigente(coleccion, id_aula: ObjectId, excluir: Optional[ObjectId] = None,
+                          session=None) -> Optional[ObjectId]:
+        """
+        Próximo cronograma programado o activo del aula (por fecha y hora de inicio)
+        
+        Args:
+            coleccion: Colección MongoDB
+            id_aula: ObjectId del aula
+            excluir: ObjectId de un cronograma a ignorar (el que se está liberando)
+            session: Sesión de una transacción (opcional)
+            
+        Returns:
+            ObjectId del cronograma o None si el aula no tiene otro vigente
+        """
+        filtro = {"id_aula": id_aula, "estado": {"$in": ESTADOS_OCUPAN}}
+        if excluir is not None:
+            filtro["_id"] = {"$ne": excluir}
+        documento = coleccion.find_one(
+            filtro,
+            {"_id": 1},
+            sort=[("fecha", 1), ("hora_inicio", 1)],
+            session=session
+        )
+        return documento["_id"] if documento else None
+    
+    @staticmethod
+    def obtener_por_id(coleccion, id_cronograma: ObjectId, session=None) -> Optional[Dict[str, Any]]:
         """
         Obtiene un cronograma por su ID
         
         Args:
             coleccion: Colección MongoDB
             id_cronograma: ObjectId del cronograma
+            session: Sesión de una transacción (opcional)
             
         Returns:
             Documento del cronograma o None si no existe
         """
-        return coleccion.find_one({"_id": id_cronograma})
+        return coleccion.find_one({"_id": id_cronograma}, session=session)
     
     @staticmethod
     def listar_por_aula(coleccion, id_aula: ObjectId, fecha_desde: Optional[date] = None) -> List[Dict[str, Any]]:
@@ -358,7 +433,7 @@ class CronogramaModel:
         }).sort("fecha", 1))
     
     @staticmethod
-    def actualizar(coleccion, id_cronograma: ObjectId, data: Dict[str, Any]) -> bool:
+    def actualizar(coleccion, id_cronograma: ObjectId, data: Dict[str, Any], session=None) -> bool:
         """
         Actualiza un cronograma existente
         
@@ -366,18 +441,38 @@ class CronogramaModel:
             coleccion: Colección MongoDB
             id_cronograma: ObjectId del cronograma
             data: Datos a actualizar
+            session: Sesión de una transacción (opcional)
             
         Returns:
             True si se actualizó correctamente
             
         Raises:
-            ValueError: Si los datos no son válidos o el cronograma no existe
+            ValueError: Si los datos no son válidos, el cronograma no existe o el
+                nuevo horario se superpone con otra asignación del aula
         """
         documento = CronogramaModel.validar_datos(data, es_actualizacion=True)
         
+        # Si cambia el horario, el aula o el estado, el resultado no puede pisar otra asignación
+        if any(campo in documento for campo in ("id_aula", "fecha", "hora_inicio", "hora_fin", "estado")):
+            actual = coleccion.find_one({"_id": id_cronograma}, session=session)
+            if actual is None:
+                raise ValueError(f"No se encontró el cronograma con ID {id_cronograma}")
+            final = {**actual, **documento}
+            if final["estado"] in ESTADOS_OCUPAN and CronogramaModel.hay_solapamiento(
+                coleccion,
+                final["id_aula"],
+                final["fecha"],
+                final["hora_inicio"],
+                final["hora_fin"],
+                excluir=id_cronograma,
+                session=session
+            ):
+                raise ValueError("El horario se superpone con otra asignación del aula en esa fecha")
+        
         resultado = coleccion.update_one(
             {"_id": id_cronograma},
-            {"$set": documento}
+            {"$set": documento},
+            session=session
         )
         
         if resultado.matched_count == 0:
@@ -386,7 +481,7 @@ class CronogramaModel:
         return resultado.modified_count > 0
     
     @staticmethod
-    def cambiar_estado(coleccion, id_cronograma: ObjectId, nuevo_estado: str) -> bool:
+    def cambiar_estado(coleccion, id_cronograma: ObjectId, nuevo_estado: str, session=None) -> bool:
         """
         Cambia el estado de un cronograma
         
@@ -394,6 +489,7 @@ class CronogramaModel:
             coleccion: Colección MongoDB
             id_cronograma: ObjectId del cronograma
             nuevo_estado: Nuevo estado
+            session: Sesión de una transacción (opcional)
             
         Returns:
             True si se actualizó correctamente
@@ -415,7 +511,8 @@ class CronogramaModel:
         
         resultado = coleccion.update_one(
             {"_id": id_cronograma},
-            {"$set": update_doc}
+            {"$set": update_doc},
+            session=session
         )
         
         if resultado.matched_count == 0:
@@ -0,0 +1,174 @@
+"""
+Intervalos de Cronograma
+Intervalos ocupados por (aula, fecha), leídos de MongoDB con una consulta de rango
+sobre el índice (id_aula, fecha, estado), para detectar solapamientos y huecos libres.
+
+No hay copia en memoria: la lectura que decide corre dentro de la transacción que
+escribe el cronograma, así que ve lo escrito por cualquier réplica o a mano.
+"""
+
+from bisect import bisect_left, bisect_right
+from datetime import datetime, date
+from typing import Dict, Any, List, Tuple, Iterable
+from bson import ObjectId
+
+
+def hora_a_minutos(hora: str) -> int:
+    """
+    Convierte "HH:MM" a minutos desde medianoche
+
+    Raises:
+        ValueError: Si el formato es inválido
+    """
+    h = datetime.strptime(hora, "%H:%M")
+    return h.hour * 60 + h.minute
+
+
+def minutos_a_hora(minutos: int) -> str:
+    """Convierte minutos desde medianoche a "HH:MM" """
+    return f"{minutos // 60:02d}:{minutos % 60:02d}"
+
+
+def normalizar_fecha(fecha: Any) -> date:
+    """
+    Normaliza una fecha (date, datetime o "YYYY-MM-DD") a date
+
+    Raises:
+        ValueError: Si el formato es inválido
+    """
+    if isinstance(fecha, datetime):
+        return fecha.date()
+    if isinstance(fecha, date):
+        return fecha
+    try:
+        return datetime.strptime(str(fecha), "%Y-%m-%d").date()
+    except ValueError:
+        raise ValueError("'fecha' debe estar en formato YYYY-MM-DD")
+
+
+class IntervalosDia:
+    """
+    Intervalos [inicio, fin) de un aula en un día, ordenados por inicio.
+
+    Mantiene el máximo acumulado de 'fin' para responder solapamientos
+    con una sola búsqueda binaria, aun si hubiera datos históricos superpuestos.
+    """
+
+    def __init__(self):
+        self._inicios: List[int] = []
+        self._items: List[Tuple[int, int, ObjectId]] = []
+        self._max_fin: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def _recalcular_desde(self, pos: int):
+        previo = self._max_fin[pos - 1] if pos > 0 else -1
+        del self._max_fin[pos:]
+        for _, fin, _ in self._items[pos:]:
+            previo = max(previo, fin)
+            self._max_fin.append(previo)
+
+    def agregar(self, inicio: int, fin: int, id_cronograma: ObjectId):
+        pos = bisect_right(self._inicios, inicio)
+        self._inicios.insert(pos, inicio)
+        self._items.insert(pos, (inicio, fin, id_cronograma))
+        self._recalcular_desde(pos)
+
+    def quitar(self, id_cronograma: ObjectId) -> bool:
+        for pos, (_, _, id_item) in enumerate(self._items):
+            if id_item == id_cronograma:
+                del self._inicios[pos]
+                del self._items[pos]
+                self._recalcular_desde(pos)
+                return True
+        return False
+
+    def hay_solapamiento(self, inicio: int, fin: int) -> bool:
+        # Candidatos: intervalos que empiezan antes de 'fin'
+        pos = bisect_left(self._inicios, fin)
+        return pos > 0 and self._max_fin[pos - 1] > inicio
+
+    def libres(self, desde: int, hasta: int) -> List[Tuple[int, int]]:
+        huecos = []
+        cursor = desde
+        for inicio, fin, _ in self._items:
+            if inicio >= hasta:
+                break
+            if inicio > cursor:
+                huecos.append((cursor, inicio))
+            cursor = max(cursor, fin)
+        if cursor < hasta:
+            huecos.append((cursor, hasta))
+        return huecos
+
+
+ESTADOS_OCUPAN = ["programada", "activa"]
+
+
+def leer_intervalos(coleccion, ids_aula: Iterable[ObjectId], fechas: Iterable[date],
+                    session=None) -> Dict[Tuple[ObjectId, date], IntervalosDia]:
+    """
+    Lee de MongoDB, en una sola consulta, los intervalos ocupados de varias aulas en varias fechas
+
+    Args:
+        coleccion: Colección cronograma
+        ids_aula: ObjectIds de aulas
+        fechas: Fechas (date)
+        session: Sesión de una transacción (opcional): la lectura ve el snapshot de la transacción
+
+    Returns:
+        Diccionario (id_aula, fecha) -> IntervalosDia, con todas las combinaciones pedidas
+    """
+    ids_aula = set(ids_aula)
+    fechas = set(fechas)
+    dias = {(id_aula, fecha): IntervalosDia() for id_aula in ids_aula for fecha in fechas}
+    if not dias:
+        return dias
+
+    cursor = coleccion.find(
+        {
+            "id_aula": {"$in": list(ids_aula)},
+            "fecha": {"$in": [datetime.combine(f, datetime.min.time()) for f in fechas]},
+            "estado": {"$in": ESTADOS_OCUPAN}
+        },
+        {"id_aula": 1, "fecha": 1, "hora_inicio": 1, "hora_fin": 1},
+        session=session
+    )
+    for doc in cursor:
+        dias[(doc["id_aula"], normalizar_fecha(doc["fecha"]))].agregar(
+            hora_a_minutos(doc["hora_inicio"]),
+            hora_a_minutos(doc["hora_fin"]),
+            doc["_id"]
+        )
+    return dias
+
+
+HORA_APERTURA = "06:00"
+HORA_CIERRE = "23:00"
+
+
+def horarios_libres(coleccion, ids_aula: List[ObjectId], fecha: Any,
+                    session=None) -> Dict[ObjectId, List[Dict[str, str]]]:
+    """
+    Devuelve los huecos libres de varias aulas en un día (una sola consulta)
+
+    Args:
+        coleccion: Colección cronograma
+        ids_aula: Lista de ObjectId de aulas
+        fecha: Fecha (date, datetime o "YYYY-MM-DD")
+        session: Sesión de una transacción (opcional)
+
+    Returns:
+        Diccionario id_aula -> lista de {"hora_inicio", "hora_fin"}
+    """
+    fecha = normalizar_fecha(fecha)
+    desde, hasta = hora_a_minutos(HORA_APERTURA), hora_a_minutos(HORA_CIERRE)
+    dias = leer_intervalos(coleccion, ids_aula, [fecha], session=session)
+    return {
+        id_aula: [
+            {"hora_inicio": minutos_a_hora(i), "hora_fin": minutos_a_hora(f)}
+            for i, f in dias[(id_aula, fecha)].libres(desde, hasta)
+        ]
+        for id_aula in ids_aula
+    }
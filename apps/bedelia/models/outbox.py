@@ -0,0 +1,155 @@
+"""
+Modelo: Outbox de eventos
+Eventos MQTT escritos en la misma transacción que el cambio de dominio;
+relay_outbox.py los publica (al menos una vez) y los marca como publicados
+"""
+
+import uuid
+from datetime import datetime
+from typing import Optional, Dict, Any, List, Tuple
+from bson import ObjectId
+
+
+class OutboxModel:
+    """
+    Modelo de la colección 'outbox_eventos'
+    """
+
+    ESTADOS_VALIDOS = ["pendiente", "publicado"]
+    RETENCION_PUBLICADOS_S = 7 * 24 * 3600  # 7 días
+
+    @staticmethod
+    def crear_indices(coleccion):
+        """
+        Crea los índices necesarios para la colección outbox_eventos
+
+        Args:
+            coleccion: Instancia de la colección MongoDB
+        """
+        # Clave de idempotencia (la reciben los consumidores como 'id_evento')
+        coleccion.create_index(
+            [("clave", 1)],
+            unique=True,
+            name="idx_clave_unique"
+        )
+
+        # Barrido de pendientes en orden de inserción
+        coleccion.create_index(
+            [("estado", 1), ("_id", 1)],
+            name="idx_estado_id"
+        )
+
+        # Los publicados se borran solos pasado el período de retención
+        coleccion.create_index(
+            [("publicado_at", 1)],
+            expireAfterSeconds=OutboxModel.RETENCION_PUBLICADOS_S,
+            name="idx_publicado_ttl"
+        )
+
+    @staticmethod
+    def _documento(topic: str, payload: Dict[str, Any], qos: int = 1) -> Dict[str, Any]:
+        return {
+            "clave": uuid.uuid4().hex,
+            "topic": topic,
+            "payload": payload,
+            "qos": qos,
+            "estado": "pendiente",
+            "intentos": 0,
+            "created_at": datetime.utcnow(),
+            "publicado_at": None
+        }
+
+    @staticmethod
+    def registrar(coleccion, evento: Tuple[str, Dict[str, Any], int], session=None) -> ObjectId:
+        """
+        Registra un evento a publicar
+
+        Args:
+            coleccion: Colección outbox_eventos
+            evento: (topic, payload, qos), ej. MQTTEventPublisher.evento_aula_asignada(...)
+            session: Sesión de la transacción del cambio de dominio
+
+        Returns:
+            ObjectId del evento
+        """
+        resultado = coleccion.insert_one(OutboxModel._documento(*evento), session=session)
+        return resultado.inserted_id
+
+    @staticmethod
+    def registrar_lote(coleccion, eventos: List[Tuple[str, Dict[str, Any], int]], session=None) -> List[ObjectId]:
+        """
+        Registra varios eventos en un solo insert_many
+
+        Args:
+            coleccion: Colección outbox_eventos
+            eventos: Lista de (topic, payload, qos)
+            session: Sesión de la transacción del cambio de dominio
+
+        Returns:
+            Lista de ObjectIds de los eventos
+        """
+        if not eventos:
+            return []
+        resultado = coleccion.insert_many(
+            [OutboxModel._documento(*evento) for evento in eventos],
+            session=session
+        )
+        return resultado.inserted_ids
+
+    @staticmethod
+    def listar_pendientes(coleccion, limite: int = 500, despues_de: Optional[ObjectId] = None) -> List[Dict[str, Any]]:
+        """
+        Lista eventos pendientes en orden de inserción
+
+        Args:
+            coleccion: Colección outbox_eventos
+            limite: Cantidad máxima
+            despues_de: Solo eventos con _id mayor (paginación)
+
+        Returns:
+            Lista de eventos
+        """
+        query = {"estado": "pendiente"}
+        if despues_de is not None:
+            query["_id"] = {"$gt": despues_de}
+        return list(coleccion.find(query).sort("_id", 1).limit(limite))
+
+    @staticmethod
+    def marcar_publicados(coleccion, ids: List[ObjectId]) -> int:
+        """
+        Marca eventos como publicados
+
+        Args:
+            coleccion: Colección outbox_eventos
+            ids: ObjectIds de los eventos
+
+        Returns:
+            Cantidad de eventos actualizados
+        """
+        if not ids:
+            return 0
+        resultado = coleccion.update_many(
+            {"_id": {"$in": ids}, "estado": "pendiente"},
+            {"$set": {"estado": "publicado", "publicado_at": datetime.utcnow()}}
+        )
+        return resultado.modified_count
+
+    @staticmethod
+    def registrar_intento_fallido(coleccion, ids: List[ObjectId]) -> int:
+        """
+        Suma un intento a eventos que no se pudieron publicar
+
+        Args:
+            coleccion: Colección outbox_eventos
+            ids: ObjectIds de los eventos
+
+        Returns:
+            Cantidad de eventos actualizados
+        """
+        if not ids:
+            return 0
+        resultado = coleccion.update_many(
+            {"_id": {"$in": ids}},
+            {"$inc": {"intentos": 1}}
+        )
+        return resultado.modified_count
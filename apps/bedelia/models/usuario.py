@@ -7,7 +7,7 @@ from datetime import datetime
 from typing import Optional, Dict, Any, List
 from bson import ObjectId
 from pymongo.errors import DuplicateKeyError
-import bcrypt
+from utils.hash_pool import pool_hash
 
 
 class UsuarioModel:
@@ -66,10 +66,7 @@ class UsuarioModel:
         
         if not es_actualizacion:
             # Hash de contraseña
-            password_hash = bcrypt.hashpw(
-                data["password"].encode('utf-8'),
-                bcrypt.gensalt()
-            ).decode('utf-8')
+            password_hash = pool_hash.generar(data["password"])
             
             documento = {
                 "usuario": data["usuario"].strip().lower(),
@@ -92,10 +89,7 @@ class UsuarioModel:
             if "password" in data:
                 if len(data["password"]) < 6:
                     raise ValueError("'password' debe tener al menos 6 caracteres")
-                documento["password_hash"] = bcrypt.hashpw(
-                    data["password"].encode('utf-8'),
-                    bcrypt.gensalt()
-                ).decode('utf-8')
+                documento["password_hash"] = pool_hash.generar(data["password"])
             if "rol" in data:
                 if data["rol"] not in UsuarioModel.ROLES_VALIDOS:
                     raise ValueError(f"'rol' debe ser uno de: {', '.join(UsuarioModel.ROLES_VALIDOS)}")
@@ -182,20 +176,34 @@ class UsuarioModel:
             
         Returns:
             Documento del usuario si las credenciales son correctas, None si no
+        
+        Raises:
+            AuthSaturado: Si el pool de verificación está saturado
         """
         user_doc = coleccion.find_one({
             "usuario": usuario.strip().lower(),
             "activo": True
         })
         
+        # Usuario inexistente: se rechaza sin encolar un bcrypt
         if not user_doc:
             return None
         
-        # Verificar contraseña
-        if bcrypt.checkpw(password.encode('utf-8'), user_doc["password_hash"].encode('utf-8')):
-            return user_doc
+        # Verificar contraseña (en el pool de procesos)
+        password_hash = user_doc.get("password_hash") or ""
+        if not pool_hash.verificar(user_doc["usuario"], password, password_hash):
+            return None
         
-        return None
+        # Hash con otro costo: se recalcula sin demorar la respuesta
+        pool_hash.rehash_en_segundo_plano(
+            password,
+            password_hash,
+            lambda nuevo: coleccion.update_one(
+                {"_id": user_doc["_id"], "password_hash": password_hash},
+                {"$set": {"password_hash": nuevo, "updated_at": datetime.utcnow()}}
+            )
+        )
+        return user_doc
     
     @staticmethod
     def obtener_por_id(coleccion, id_usuario: ObjectId) -> Optional[Dict[str, Any]]:
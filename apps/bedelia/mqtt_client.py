@@ -7,7 +7,17 @@ import json
 import uuid
 import time
 import os
+import random
+import threading
 import paho.mqtt.client as mqtt
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+
+from config import (
+    MQTT_RECONEXION_BASE_S, MQTT_RECONEXION_MAX_S, MQTT_PROTOCOLO,
+    MQTT_ALIAS_PREFIJOS, MQTT_ALIAS_MAX, MQTT_EXPIRACION_S
+)
+from utils.mqtt_protocolo import NegociacionMQTT, codigo
 
 
 def _env_bool(v: str, default: bool = False) -> bool:
@@ -24,8 +34,25 @@ class MQTTClient:
     mTLS:
     - Verifica el broker con CA
     - Presenta certificado de cliente (cert/key)
+
+    La conexión la maneja SupervisorMQTT en su propio hilo: construir el
+    cliente no conecta, y publish() nunca espera un connect.
+
+    MQTT 5 (MQTT_PROTOCOLO, ver utils/mqtt_protocolo.py), con 3.1.1 de respaldo:
+    - Alias de topic para los topics de MQTT_ALIAS_PREFIJOS: el primer publish
+      de la conexión manda topic + alias, los siguientes solo el alias (hasta
+      el mínimo entre MQTT_ALIAS_MAX y el TopicAliasMaximum del broker).
+    - Vencimiento (MessageExpiryInterval) según MQTT_EXPIRACION_S: el broker
+      descarta lo que no entregó a tiempo (ej. notificaciones de una clase
+      que ya empezó, para un alumno que se reconecta tarde).
     """
 
+    # Valores del gauge de estado (ver estado())
+    DESCONECTADO = 0
+    CONECTANDO = 1
+    CONECTADO = 2
+    NOMBRES_ESTADO = {0: "desconectado", 1: "conectando", 2: "conectado"}
+
     def __init__(
         self,
         host: str,
@@ -35,18 +62,15 @@ class MQTTClient:
         client_cert: str | None,
         client_key: str | None,
         app_name: str = "App_Bedelia",
+        protocolo: str = MQTT_PROTOCOLO,
     ):
         self.host = host
         self.port = int(port)
         self.tls_enabled = tls_enabled
+        self.app_name = app_name
+        self.negociacion = NegociacionMQTT(protocolo)
 
-        client_id = f"{app_name}-{uuid.uuid4()}"
-        self.client = mqtt.Client(client_id=client_id, protocol=mqtt.MQTTv311)
-
-        self.client.on_connect = self.on_connect
-        self.client.on_disconnect = self.on_disconnect
-        self.client.on_log = self.on_log
-
+        self._ctx_tls = None
         if self.tls_enabled:
             if not (ca_cert and client_cert and client_key):
                 raise RuntimeError(
@@ -56,80 +80,348 @@ class MQTTClient:
             ctx = ssl.create_default_context(ssl.Purpose.SERVER_AUTH, cafile=ca_cert)
             ctx.load_cert_chain(certfile=client_cert, keyfile=client_key)
             ctx.minimum_version = ssl.TLSVersion.TLSv1_2
-            self.client.tls_set_context(ctx)
-            self.client.tls_insecure_set(False)
+            self._ctx_tls = ctx
 
-        # Conectar + loop
-        # OJO: connect() no garantiza handshake completo hasta que corre el loop.
-        self.client.connect(self.host, self.port, keepalive=60)
-        self.client.loop_start()
+        # Alias de topic de la conexión actual (MQTT 5): topic -> (alias, qos del publish que lo definió)
+        self._lock_alias = threading.Lock()
+        self._aliases: dict[str, tuple[int, int]] = {}
+        self._alias_max = 0
+        self._alias_siguiente = 1
 
-        # Espera corta para estabilizar
-        for _ in range(30):
-            if self.client.is_connected():
-                break
-            time.sleep(0.1)
+        # Lo marca on_connect si el broker rechazó MQTT 5 (CONNACK 132)
+        self._bajar_version = False
+
+        self.client: mqtt.Client | None = None
+        self._crear_cliente()
+
+        self.estado_codigo = self.DESCONECTADO
+        self.conexiones = 0
+        self.intentos_fallidos = 0
+        self.ultimo_error: str | None = None
+        self.conectado_desde: float | None = None
+        self.proximo_intento: float | None = None
+
+        self.supervisor = SupervisorMQTT(self)
+
+    def _crear_cliente(self):
+        """
+        Construye el cliente paho con la versión negociada (no conecta).
+
+        Al bajar de versión, los mensajes QoS>0 sin PUBACK del cliente anterior
+        (la cola MQTT ya los dio por publicados) pasan al nuevo con el mismo mid:
+        paho los reenvía al conectar y completa los MQTTMessageInfo que esperan
+        el relay del outbox y la cola.
+        """
+        client_id = f"{self.app_name}-{uuid.uuid4()}"
+        client = mqtt.Client(client_id=client_id, protocol=self.negociacion.protocolo)
+
+        anterior = self.client
+        if anterior is not None:
+            with anterior._out_message_mutex:
+                client._out_messages.update(anterior._out_messages)
+                client._last_mid = anterior._last_mid
+                anterior._out_messages.clear()
+
+        client.on_connect = self.on_connect
+        client.on_disconnect = self.on_disconnect
+        client.on_log = self.on_log
+
+        if self._ctx_tls is not None:
+            client.tls_set_context(self._ctx_tls)
+            client.tls_insecure_set(False)
+
+        self.client = client
+
+    def is_connected(self) -> bool:
+        return self.client.is_connected()
 
     def on_log(self, client, userdata, level, buf):
         print(f"[MQTT LOG] {buf}")
 
-    def on_connect(self, client, userdata, flags, rc):
+    # properties: solo en MQTT 5 (paho llama a los callbacks con otra firma en 3.1.1)
+    def on_connect(self, client, userdata, flags, rc, properties=None):
+        rc = codigo(rc)
+        if self.negociacion.connack(rc):
+            self._bajar_version = True
         if rc != 0:
             print(f"❌ MQTT CONNACK rc={rc}")
+            self.ultimo_error = f"CONNACK rc={rc}"
         else:
-            print("✅ MQTT conectado")
+            with self._lock_alias:
+                self._alias_max = min(MQTT_ALIAS_MAX, getattr(properties, "TopicAliasMaximum", 0) or 0)
+            print(f"✅ MQTT conectado (MQTT {self.negociacion.version})")
+            self.estado_codigo = self.CONECTADO
+            self.conexiones += 1
+            self.conectado_desde = time.time()
 
-    def on_disconnect(self, client, userdata, rc):
+    def on_disconnect(self, client, userdata, rc, properties=None):
+        rc = codigo(rc)
+        self.estado_codigo = self.DESCONECTADO
+        self.conectado_desde = None
         if rc != 0:
             print(f"⚠️ MQTT desconectado inesperadamente rc={rc}")
+            self.ultimo_error = f"desconexión rc={rc}"
+
+    # -----------------------------
+    # MQTT 5: vencimiento y alias
+    # -----------------------------
+
+    @staticmethod
+    def expiracion(topic: str) -> int | None:
+        """Segundos de vida de un mensaje del topic (None: no vence)"""
+        for prefijo, segundos in MQTT_EXPIRACION_S.items():
+            if segundos and topic.startswith(prefijo):
+                return segundos
+        return None
+
+    def vencido(self, topic: str, antiguedad_s: float) -> bool:
+        """True si el mensaje ya venció esperando en la cola (no tiene sentido publicarlo)"""
+        expira = self.expiracion(topic)
+        return self.negociacion.v5 and expira is not None and antiguedad_s >= expira
+
+    def _aplicar_alias(self, topic: str, qos: int, propiedades: Properties) -> tuple[str, bool]:
+        """
+        Decide el alias de un publish (llamar con _lock_alias tomado)
+
+        Returns:
+            (topic a enviar, True si este publish define un alias nuevo)
+        """
+        if not self._alias_max or not topic.startswith(tuple(MQTT_ALIAS_PREFIJOS)) or not self.client.is_connected():
+            return topic, False
+
+        definido = self._aliases.get(topic)
+        if definido is not None:
+            alias, qos_definicion = definido
+            # Un QoS 0 sale enseguida y podría adelantarse a la definición QoS>0
+            # todavía en la cola de paho (max_inflight): ese va con el topic completo
+            if qos_definicion == 0 or qos > 0:
+                propiedades.TopicAlias = alias
+                return "", False
+            return topic, False
+
+        if self._alias_siguiente > self._alias_max:
+            # Tabla llena: no se reasignan alias, el resto viaja con el topic completo
+            return topic, False
+        alias = self._alias_siguiente
+        self._alias_siguiente += 1
+        self._aliases[topic] = (alias, qos)
+        propiedades.TopicAlias = alias
+        return topic, True
+
+    def _olvidar_aliases(self):
+        """
+        Descarta los alias al cortarse la conexión (valen solo dentro de ella).
+
+        Los mensajes QoS>0 sin PUBACK que paho reenvía al reconectar vuelven a
+        llevar el topic completo y sin alias: paho 1.6.1 (fijado en
+        requirements.txt) los reenvía tal cual estaban guardados.
+        """
+        with self._lock_alias:
+            if self._aliases:
+                topics = {alias: topic for topic, (alias, _) in self._aliases.items()}
+                with self.client._out_message_mutex:
+                    for m in self.client._out_messages.values():
+                        alias = getattr(m.properties, "TopicAlias", None)
+                        if alias is None:
+                            continue
+                        if not m._topic:
+                            m._topic = topics[alias].encode("utf-8")
+                        del m.properties.TopicAlias
+                self._aliases.clear()
+            self._alias_max = 0
+            self._alias_siguiente = 1
+
+    def publish(self, topic: str, payload: dict | None, qos: int = 1, retain: bool = False,
+                expira_s: int | None = None, antiguedad_s: float = 0.0):
+        """
+        Publica un mensaje sin esperar confirmación
+
+        Args:
+            topic: Topic completo
+            payload: Diccionario (None: mensaje vacío; con retain borra el retenido)
+            qos: Quality of Service
+            retain: Mensaje retenido
+            expira_s: Vencimiento en segundos (MQTT 5); None usa MQTT_EXPIRACION_S
+            antiguedad_s: Cuánto esperó el mensaje antes de salir (se descuenta del vencimiento)
+
+        Returns:
+            MQTTMessageInfo: quien necesite confirmación usa wait_for_publish()
+
+        Raises:
+            RuntimeError: Si paho no aceptó el mensaje (ej. sin conexión)
+        """
+        message = b"" if payload is None else json.dumps(payload, default=str)
+
+        if not self.negociacion.v5:
+            result = self.client.publish(topic, message, qos=qos, retain=retain)
+        else:
+            propiedades = Properties(PacketTypes.PUBLISH)
+            expira = self.expiracion(topic) if expira_s is None else expira_s
+            if expira:
+                propiedades.MessageExpiryInterval = max(1, int(expira - antiguedad_s))
+            # El lock cubre el publish: un alias se usa recién después de la definición
+            with self._lock_alias:
+                enviado, nuevo = self._aplicar_alias(topic, qos, propiedades)
+                result = self.client.publish(enviado, message, qos=qos, retain=retain, properties=propiedades)
+                if nuevo and result.rc != mqtt.MQTT_ERR_SUCCESS:
+                    del self._aliases[topic]
 
-    def publish(self, topic: str, payload: dict):
-        message = json.dumps(payload, default=str)
-        result = self.client.publish(topic, message, qos=1)
         if result.rc != mqtt.MQTT_ERR_SUCCESS:
             raise RuntimeError(f"Error publicando mensaje en {topic}: rc={result.rc}")
+        return result
+
+    def estado(self) -> dict:
+        """Gauge de conexión para /health (estado_codigo: 0 desconectado, 1 conectando, 2 conectado)"""
+        espera = None
+        if self.proximo_intento is not None:
+            espera = round(max(0.0, self.proximo_intento - time.monotonic()), 2)
+        return {
+            "estado": self.NOMBRES_ESTADO[self.estado_codigo],
+            "estado_codigo": self.estado_codigo,
+            "conectado_hace_s": round(time.time() - self.conectado_desde, 1) if self.conectado_desde else None,
+            "conexiones": self.conexiones,
+            "reconexiones": max(0, self.conexiones - 1),
+            "intentos_fallidos": self.intentos_fallidos,
+            "proximo_intento_s": espera,
+            "ultimo_error": self.ultimo_error,
+            "protocolo": self.negociacion.version,
+            "alias": len(self._aliases),
+            "alias_max": self._alias_max,
+        }
+
+
+class SupervisorMQTT:
+    """
+    Hilo dueño de la conexión: conecta, corre el loop de red y reconecta.
+
+    - El connect (TCP + handshake TLS) ocurre solo acá, nunca en un request
+      ni en el hilo publicador.
+    - Reintentos con backoff exponencial y jitter completo
+      (random(0, min(max, base * 2^n))), así varias réplicas no reconectan
+      todas juntas cuando EMQX vuelve.
+    - Mientras está desconectado, publish() falla enseguida (la cola MQTT y el
+      relay del outbox reintentan por su cuenta).
+    - Si la negociación baja a MQTT 3.1.1, recrea el cliente y reintenta sin esperar.
+    """
+
+    def __init__(self, mqtt_client: "MQTTClient",
+                 base_s: float = MQTT_RECONEXION_BASE_S, max_s: float = MQTT_RECONEXION_MAX_S):
+        self.mqtt_client = mqtt_client
+        self.base_s = base_s
+        self.max_s = max_s
+        self._detener = threading.Event()
+        self._hilo: threading.Thread | None = None
+
+    def iniciar(self):
+        if self._hilo is None or not self._hilo.is_alive():
+            self._detener.clear()
+            self._hilo = threading.Thread(target=self._ejecutar, name="mqtt-supervisor", daemon=True)
+            self._hilo.start()
+
+    def detener(self):
+        self._detener.set()
+        try:
+            self.mqtt_client.client.disconnect()
+        except Exception:
+            pass
+
+    def _espera(self, intento: int) -> float:
+        return random.uniform(0, min(self.max_s, self.base_s * (2 ** intento)))
+
+    def _ejecutar(self):
+        c = self.mqtt_client
+        intento = 0
+        while not self._detener.is_set():
+            c.estado_codigo = MQTTClient.CONECTANDO
+            try:
+                c.client.connect(c.host, c.port, keepalive=60)
+                c.proximo_intento = None
+                # Loop de red en este hilo hasta que se corte la conexión
+                while not self._detener.is_set():
+                    rc = c.client.loop(timeout=1.0)
+                    # El backoff vuelve a cero recién con un CONNACK aceptado: un broker
+                    # que arranca acepta el TCP y corta antes de responder
+                    if c.estado_codigo == MQTTClient.CONECTADO:
+                        intento = 0
+                    if rc != mqtt.MQTT_ERR_SUCCESS:
+                        break
+            except Exception as e:
+                c.intentos_fallidos += 1
+                c.ultimo_error = str(e)
+                if intento == 0:
+                    print(f"❌ No se pudo conectar a MQTT: {e}")
+
+            c.estado_codigo = MQTTClient.DESCONECTADO
+            c._olvidar_aliases()
+            if self._detener.is_set():
+                break
+            if c._bajar_version:
+                c._bajar_version = False
+                c._crear_cliente()
+                intento = 0
+                continue
+            espera = self._espera(intento)
+            intento += 1
+            c.proximo_intento = time.monotonic() + espera
+            self._detener.wait(espera)
 
 
 # ---------- Lazy init (clave para que NO muera el contenedor) ----------
 _mqtt_client: MQTTClient | None = None
+_lock_init = threading.Lock()
 
 
 def get_mqtt_client() -> MQTTClient | None:
     """
-    Devuelve el cliente si pudo conectarse. Si no, devuelve None.
-    No mata el proceso: la app puede levantar igual y reintentar luego.
+    Devuelve el cliente (conectado o no: ver is_connected()) sin bloquear.
+    La primera llamada lo crea y arranca el supervisor que conecta en segundo plano.
+    Devuelve None solo si el cliente no se puede construir (ej. faltan certificados).
     """
     global _mqtt_client
     if _mqtt_client is not None:
         return _mqtt_client
 
-    host = os.getenv("MQTT_BROKER_HOST", "emqx")
-    port = int(os.getenv("MQTT_BROKER_PORT", "8883"))
-    tls_enabled = _env_bool(os.getenv("MQTT_TLS_ENABLED", "true"))
-
-    ca_cert = os.getenv("MQTT_TLS_CA_CERT")
-    client_cert = os.getenv("MQTT_TLS_CERT")
-    client_key = os.getenv("MQTT_TLS_KEY")
-    app_name = os.getenv("APP_NAME", "App_Bedelia")
-
-    print("[MQTT INIT] host=", host)
-    print("[MQTT INIT] port=", port)
-    print("[MQTT INIT] tls_enabled=", tls_enabled)
-    print("[MQTT INIT] ca_cert=", ca_cert)
-    print("[MQTT INIT] client_cert=", client_cert)
-    print("[MQTT INIT] client_key=", client_key)
-
-    try:
-        _mqtt_client = MQTTClient(
-            host=host,
-            port=port,
-            tls_enabled=tls_enabled,
-            ca_cert=ca_cert,
-            client_cert=client_cert,
-            client_key=client_key,
-            app_name=app_name,
-        )
+    with _lock_init:
+        if _mqtt_client is not None:
+            return _mqtt_client
+
+        host = os.getenv("MQTT_BROKER_HOST", "emqx")
+        port = int(os.getenv("MQTT_BROKER_PORT", "8883"))
+        tls_enabled = _env_bool(os.getenv("MQTT_TLS_ENABLED", "true"))
+
+        ca_cert = os.getenv("MQTT_TLS_CA_CERT")
+        client_cert = os.getenv("MQTT_TLS_CERT")
+        client_key = os.getenv("MQTT_TLS_KEY")
+        app_name = os.getenv("APP_NAME", "App_Bedelia")
+
+        print("[MQTT INIT] host=", host)
+        print("[MQTT INIT] port=", port)
+        print("[MQTT INIT] tls_enabled=", tls_enabled)
+        print("[MQTT INIT] ca_cert=", ca_cert)
+        print("[MQTT INIT] client_cert=", client_cert)
+        print("[MQTT INIT] client_key=", client_key)
+
+        try:
+            cliente = MQTTClient(
+                host=host,
+                port=port,
+                tls_enabled=tls_enabled,
+                ca_cert=ca_cert,
+                client_cert=client_cert,
+                client_key=client_key,
+                app_name=app_name,
+            )
+        except Exception as e:
+            print(f"❌ No se pudo inicializar MQTT: {e}")
+            return None
+
+        cliente.supervisor.iniciar()
+        _mqtt_client = cliente
         return _mqtt_client
-    except Exception as e:
-        print(f"❌ No se pudo inicializar MQTT: {e}")
-        return None
+
+
+def estado_mqtt() -> dict:
+    """Gauge de conexión sin crear el cliente (para /health)"""
+    if _mqtt_client is None:
+        return {"estado": "sin_iniciar", "estado_codigo": MQTTClient.DESCONECTADO}
+    return _mqtt_client.estado()
@@ -0,0 +1,256 @@
+# =============================
+# App_Bedelia – Relay de estado retenido
+# =============================
+"""
+Mantiene en el broker un mensaje retenido por aula y por cronograma del día:
+
+- universidad/aulas/estado/{id_aula}
+- universidad/cronogramas/{YYYY-MM-DD}/{id_cronograma}
+
+Un cliente nuevo (dashboard, App_Alumno) se suscribe a
+'universidad/aulas/estado/+' o 'universidad/cronogramas/<hoy>/#' y recibe el
+estado completo del broker, sin listar por REST.
+
+- Sigue un change stream sobre 'aulas' y 'cronograma' con el documento
+  completo (updateLookup): cualquier escritura (asignar, liberar,
+  cambiar_estado, cargas masivas, ediciones a mano) actualiza el retenido,
+  en orden de commit.
+- Varios cambios del mismo documento dentro de un lote se publican una vez.
+- Publica el estado completo al arrancar y cada vez que se reconecta al
+  broker (los retenidos pueden haberse perdido si EMQX reinició).
+- Al cambiar el día borra los retenidos de los días anteriores.
+- Es estado, no eventos: republicar es idempotente. El resume token se
+  guarda recién con los PUBACK del lote.
+
+Corre como hilo dentro del proceso de relay_outbox.py (o solo: python relay_estado.py).
+"""
+
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Optional
+
+from pymongo.errors import PyMongoError, OperationFailure
+
+from config import OUTBOX_LOTE_MAX, OUTBOX_PUBACK_TIMEOUT_S
+from db.mongo import get_mongo_db
+from mqtt_client import get_mqtt_client
+from utils.mqtt_events import MQTTEventPublisher
+
+
+# topic -> payload (None = borrar el retenido)
+Mensajes = Dict[str, Optional[Dict[str, Any]]]
+
+
+class RelayEstado:
+    """
+    Relay aulas / cronogramas -> retenidos MQTT
+    """
+
+    ID_ESTADO = "relay_estado"
+    ESPERA_REINTENTO_MAX = 30  # segundos
+    CODIGO_HISTORIAL_PERDIDO = 286  # ChangeStreamHistoryLost
+    DIAS_LIMPIEZA_MAX = 31
+
+    def __init__(self):
+        self.db = get_mongo_db()
+        self.aulas = self.db.aulas
+        self.cronogramas = self.db.cronograma
+        # Misma colección de estado que el relay del outbox (otro _id)
+        self.estado = self.db.outbox_relay
+        self.espera = 0.5
+        self.dia: Optional[date] = None
+        self.conexion_sincronizada: Optional[int] = None
+
+    # -----------------------------
+    # Estado persistido
+    # -----------------------------
+
+    def _leer_estado(self) -> Dict[str, Any]:
+        return self.estado.find_one({"_id": self.ID_ESTADO}) or {}
+
+    def _guardar(self, **campos):
+        self.estado.update_one({"_id": self.ID_ESTADO}, {"$set": campos}, upsert=True)
+
+    @staticmethod
+    def _hoy() -> date:
+        return date.today()
+
+    @staticmethod
+    def _medianoche(dia: date) -> datetime:
+        return datetime.combine(dia, datetime.min.time())
+
+    # -----------------------------
+    # Armado de mensajes
+    # -----------------------------
+
+    @staticmethod
+    def _agregar(mensajes: Mensajes, evento):
+        topic, payload, _ = evento
+        mensajes[topic] = payload
+
+    def _es_de_hoy(self, cronograma: Dict[str, Any]) -> bool:
+        fecha = cronograma.get("fecha")
+        return isinstance(fecha, datetime) and fecha.date() == self.dia
+
+    def _aplicar(self, cambio: Dict[str, Any], mensajes: Mensajes):
+        """Traduce un evento del change stream al retenido que corresponde"""
+        tipo = cambio["operationType"]
+        documento = cambio.get("fullDocument")
+        id_documento = str(cambio["documentKey"]["_id"])
+
+        if cambio["ns"]["coll"] == "aulas":
+            if documento is not None:
+                self._agregar(mensajes, MQTTEventPublisher.evento_estado_aula(documento))
+            elif tipo == "delete":
+                mensajes[MQTTEventPublisher.topic_estado_aula(id_documento)] = None
+            # update sin documento: lo borraron después, llega su delete
+            return
+
+        topic_hoy = MQTTEventPublisher.topic_cronograma_dia(self.dia.isoformat(), id_documento)
+        if documento is not None and self._es_de_hoy(documento):
+            self._agregar(mensajes, MQTTEventPublisher.evento_cronograma_dia(documento))
+        elif tipo == "delete":
+            mensajes[topic_hoy] = None
+        elif tipo in ("update", "replace") and documento is not None:
+            cambios = (cambio.get("updateDescription") or {}).get("updatedFields") or {}
+            # Se movió a otro día: sale del topic de hoy
+            if tipo == "replace" or "fecha" in cambios:
+                mensajes[topic_hoy] = None
+
+    def _limpiar_dias(self, desde: date, hasta: date, mensajes: Mensajes):
+        """Borra los retenidos de cronogramas de los días [desde, hasta)"""
+        dia = max(desde, hasta - timedelta(days=self.DIAS_LIMPIEZA_MAX))
+        while dia < hasta:
+            for cronograma in self.cronogramas.find({"fecha": self._medianoche(dia)}, {"_id": 1}):
+                mensajes[MQTTEventPublisher.topic_cronograma_dia(dia.isoformat(), str(cronograma["_id"]))] = None
+            dia += timedelta(days=1)
+
+    # -----------------------------
+    # Publicación
+    # -----------------------------
+
+    @staticmethod
+    def _publicar(mensajes: Mensajes):
+        """
+        Publica retenidos (QoS 1) y espera los PUBACK
+
+        Raises:
+            RuntimeError: Si el broker no está disponible o no confirmó algún mensaje
+        """
+        if not mensajes:
+            return
+        mqtt_client = get_mqtt_client()
+        if not mqtt_client or not mqtt_client.client.is_connected():
+            raise RuntimeError("Broker MQTT no disponible")
+
+        items = list(mensajes.items())
+        try:
+            for i in range(0, len(items), OUTBOX_LOTE_MAX):
+                enviados = [
+                    mqtt_client.publish(topic, payload, qos=1, retain=True)
+                    for topic, payload in items[i:i + OUTBOX_LOTE_MAX]
+                ]
+                for info in enviados:
+                    info.wait_for_publish(timeout=OUTBOX_PUBACK_TIMEOUT_S)
+                    if not info.is_published():
+                        raise RuntimeError("El broker no confirmó el estado retenido")
+        except (RuntimeError, ValueError) as e:
+            raise RuntimeError(f"Error al publicar estado retenido: {e}")
+
+    def sincronizar(self, completo: bool = True):
+        """
+        Publica el estado del día (y, si completo, el de todas las aulas) y
+        borra los retenidos de días anteriores
+        """
+        hoy = self._hoy()
+        mensajes: Mensajes = {}
+
+        if completo:
+            for aula in self.aulas.find({}):
+                self._agregar(mensajes, MQTTEventPublisher.evento_estado_aula(aula))
+
+        anterior = self.dia
+        if anterior is None:
+            guardado = self._leer_estado().get("dia")
+            anterior = date.fromisoformat(guardado) if guardado else hoy - timedelta(days=1)
+        self._limpiar_dias(anterior, hoy, mensajes)
+
+        self.dia = hoy
+        for cronograma in self.cronogramas.find({"fecha": self._medianoche(hoy)}):
+            self._agregar(mensajes, MQTTEventPublisher.evento_cronograma_dia(cronograma))
+
+        self._publicar(mensajes)
+        self._guardar(dia=hoy.isoformat())
+        if completo:
+            mqtt_client = get_mqtt_client()
+            self.conexion_sincronizada = mqtt_client.conexiones if mqtt_client else None
+            print(f"✅ Estado retenido sincronizado ({len(mensajes)} topics)")
+
+    def _requiere_sincronizar(self) -> bool:
+        # Reconexión al broker: los retenidos pueden no estar (EMQX reiniciado)
+        mqtt_client = get_mqtt_client()
+        return mqtt_client is not None and mqtt_client.conexiones != self.conexion_sincronizada
+
+    # -----------------------------
+    # Change stream
+    # -----------------------------
+
+    def escuchar(self):
+        """Sincroniza y después publica los cambios a medida que se confirman"""
+        pipeline = [{"$match": {
+            "ns.coll": {"$in": [self.aulas.name, self.cronogramas.name]},
+            "operationType": {"$in": ["insert", "update", "replace", "delete"]}
+        }}]
+        resume_token = self._leer_estado().get("resume_token")
+
+        with self.db.watch(pipeline, full_document="updateLookup",
+                           resume_after=resume_token, max_await_time_ms=1000) as stream:
+            # El stream ya está abierto: lo que cambie durante la sincronización llega después
+            self.sincronizar(completo=True)
+            self.espera = 0.5
+            print("✅ Relay de estado escuchando cambios")
+
+            mensajes: Mensajes = {}
+            cambios = 0
+            while stream.alive:
+                cambio = stream.try_next()
+                if cambio is not None:
+                    self._aplicar(cambio, mensajes)
+                    cambios += 1
+
+                if cambios and (cambio is None or cambios >= OUTBOX_LOTE_MAX):
+                    self._publicar(mensajes)
+                    self._guardar(resume_token=stream.resume_token)
+                    mensajes = {}
+                    cambios = 0
+
+                if cambio is None:
+                    if self._requiere_sincronizar():
+                        self.sincronizar(completo=True)
+                    elif self._hoy() != self.dia:
+                        self.sincronizar(completo=False)
+
+    def ejecutar(self):
+        """Loop principal con reintentos"""
+        while True:
+            try:
+                self.escuchar()
+            except OperationFailure as e:
+                if e.code == self.CODIGO_HISTORIAL_PERDIDO:
+                    # La sincronización completa cubre lo que el stream ya no puede reanudar
+                    print("⚠️  Resume token de estado vencido, se reinicia el change stream")
+                    self._guardar(resume_token=None)
+                else:
+                    print(f"❌ Error de MongoDB en el relay de estado: {e}")
+                    self._esperar()
+            except (PyMongoError, RuntimeError) as e:
+                print(f"❌ Error en el relay de estado: {e}")
+                self._esperar()
+
+    def _esperar(self):
+        time.sleep(self.espera)
+        self.espera = min(self.espera * 2, self.ESPERA_REINTENTO_MAX)
+
+
+if __name__ == "__main__":
+    RelayEstado().ejecutar()
@@ -0,0 +1,182 @@
+# =============================
+# App_Bedelia – Relay del outbox de eventos
+# =============================
+"""
+Proceso aparte que publica en MQTT los eventos de la colección outbox_eventos.
+
+- Los servicios escriben el evento en la misma transacción que el cambio de
+  dominio (ver OutboxModel); este proceso los publica al menos una vez.
+- Escucha inserts con un change stream (el resume token se guarda en
+  'outbox_relay') y cada OUTBOX_BARRIDO_S barre los pendientes que hayan
+  quedado (caídas del broker, del relay o historial de oplog perdido).
+- Cada payload lleva 'id_evento' para que los consumidores descarten duplicados.
+- En un hilo aparte corre RelayEstado (retenidos por aula y cronograma del día).
+"""
+
+import threading
+import time
+from datetime import datetime
+from typing import List, Dict, Any
+
+from pymongo.errors import PyMongoError, OperationFailure
+
+from config import OUTBOX_LOTE_MAX, OUTBOX_BARRIDO_S, OUTBOX_PUBACK_TIMEOUT_S
+from db.mongo import get_mongo_db
+from models.outbox import OutboxModel
+from mqtt_client import get_mqtt_client
+from relay_estado import RelayEstado
+
+
+class RelayOutbox:
+    """
+    Relay outbox -> MQTT
+    """
+
+    ID_ESTADO = "relay_outbox"
+    ESPERA_REINTENTO_MAX = 30  # segundos
+    CODIGO_HISTORIAL_PERDIDO = 286  # ChangeStreamHistoryLost
+
+    def __init__(self):
+        self.db = get_mongo_db()
+        self.outbox = self.db.outbox_eventos
+        self.estado = self.db.outbox_relay
+        self.espera = 0.5
+
+    # -----------------------------
+    # Resume token
+    # -----------------------------
+
+    def _resume_token(self):
+        doc = self.estado.find_one({"_id": self.ID_ESTADO})
+        return doc.get("resume_token") if doc else None
+
+    def _guardar_token(self, token):
+        self.estado.update_one(
+            {"_id": self.ID_ESTADO},
+            {"$set": {"resume_token": token}},
+            upsert=True
+        )
+
+    # -----------------------------
+    # Publicación
+    # -----------------------------
+
+    @staticmethod
+    def _publicar(eventos: List[Dict[str, Any]]) -> List[Any]:
+        """
+        Publica un lote y espera los PUBACK
+
+        Returns:
+            _id de los eventos confirmados por el broker (prefijo del lote, en orden)
+        """
+        mqtt_client = get_mqtt_client()
+        if not mqtt_client or not mqtt_client.client.is_connected():
+            raise RuntimeError("Broker MQTT no disponible")
+
+        enviados = []
+        for evento in eventos:
+            payload = dict(evento["payload"])
+            payload["id_evento"] = evento["clave"]
+            payload.setdefault("timestamp", evento["created_at"].isoformat())
+            # El vencimiento (MQTT 5) corre desde que se escribió el evento
+            antiguedad = (datetime.utcnow() - evento["created_at"]).total_seconds()
+            info = mqtt_client.publish(evento["topic"], payload, qos=evento.get("qos", 1), antiguedad_s=antiguedad)
+            enviados.append((evento["_id"], info))
+
+        confirmados = []
+        for id_evento, info in enviados:
+            info.wait_for_publish(timeout=OUTBOX_PUBACK_TIMEOUT_S)
+            if not info.is_published():
+                break
+            confirmados.append(id_evento)
+        return confirmados
+
+    def procesar(self, eventos: List[Dict[str, Any]]):
+        """
+        Publica eventos en lotes y los marca como publicados
+
+        Raises:
+            RuntimeError: Si algún evento no se pudo publicar (queda pendiente)
+        """
+        for i in range(0, len(eventos), OUTBOX_LOTE_MAX):
+            lote = eventos[i:i + OUTBOX_LOTE_MAX]
+            try:
+                confirmados = self._publicar(lote)
+            except Exception as e:
+                print(f"❌ Error al publicar lote del outbox: {e}")
+                confirmados = []
+
+            OutboxModel.marcar_publicados(self.outbox, confirmados)
+
+            fallidos = [evento["_id"] for evento in lote[len(confirmados):]]
+            if fallidos:
+                OutboxModel.registrar_intento_fallido(self.outbox, fallidos)
+                raise RuntimeError(f"{len(fallidos)} eventos sin confirmar")
+
+        self.espera = 0.5
+
+    def barrer(self):
+        """Publica todos los eventos pendientes en orden de inserción"""
+        ultimo = None
+        while True:
+            pendientes = OutboxModel.listar_pendientes(self.outbox, OUTBOX_LOTE_MAX, despues_de=ultimo)
+            if not pendientes:
+                return
+            self.procesar(pendientes)
+            ultimo = pendientes[-1]["_id"]
+
+    # -----------------------------
+    # Change stream
+    # -----------------------------
+
+    def escuchar(self):
+        """Publica los inserts del outbox a medida que se confirman las transacciones"""
+        pipeline = [{"$match": {"operationType": "insert"}}]
+        ultimo_barrido = time.monotonic()
+
+        with self.outbox.watch(pipeline, resume_after=self._resume_token(), max_await_time_ms=1000) as stream:
+            print("✅ Relay del outbox escuchando cambios")
+            lote = []
+            while stream.alive:
+                cambio = stream.try_next()
+                if cambio is not None:
+                    lote.append(cambio["fullDocument"])
+
+                if lote and (cambio is None or len(lote) >= OUTBOX_LOTE_MAX):
+                    self.procesar(lote)
+                    lote = []
+                    self._guardar_token(stream.resume_token)
+
+                if time.monotonic() - ultimo_barrido >= OUTBOX_BARRIDO_S:
+                    self.barrer()
+                    ultimo_barrido = time.monotonic()
+
+    def ejecutar(self):
+        """Loop principal con reintentos"""
+        OutboxModel.crear_indices(self.outbox)
+
+        while True:
+            try:
+                self.barrer()
+                self.escuchar()
+            except OperationFailure as e:
+                if e.code == self.CODIGO_HISTORIAL_PERDIDO:
+                    # El barrido recupera lo que el change stream ya no puede reanudar
+                    print("⚠️  Resume token vencido, se reinicia el change stream")
+                    self._guardar_token(None)
+                else:
+                    print(f"❌ Error de MongoDB en el relay: {e}")
+                    self._esperar()
+            except (PyMongoError, RuntimeError) as e:
+                print(f"❌ Error en el relay del outbox: {e}")
+                self._esperar()
+
+    def _esperar(self):
+        time.sleep(self.espera)
+        self.espera = min(self.espera * 2, self.ESPERA_REINTENTO_MAX)
+
+
+if __name__ == "__main__":
+    # Estado retenido de aulas/cronogramas (relay_estado.py) en el mismo proceso
+    threading.Thread(target=RelayEstado().ejecutar, name="relay-estado", daemon=True).start()
+    RelayOutbox().ejecutar()
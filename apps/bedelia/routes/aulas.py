@@ -247,3 +247,20 @@ def obtener_metricas(jwt_payload):
     
     except Exception as e:
         return jsonify({"error": f"Error interno: {str(e)}"}), 500
+
+
+@aulas_bp.route('/cache/estadisticas', methods=['GET'])
+@require_jwt
+@require_roles(["administrador"])
+def obtener_estadisticas_cache(jwt_payload):
+    """
+    GET /aulas/cache/estadisticas
+    Hits/misses de la caché de aulas (memoria local + Redis) del worker que responde
+    
+    Requiere: JWT con rol administrador
+    """
+    try:
+        return jsonify(aula_service.obtener_estadisticas_cache()), 200
+    
+    except Exception as e:
+        return jsonify({"error": f"Error interno: {str(e)}"}), 500
@@ -6,6 +6,7 @@ Endpoints para gestión de carreras, materias y asignaciones
 from flask import request, jsonify
 from middleware.auth import require_jwt, require_roles
 from services.carrera_service import CarreraService
+from utils.validators import Validators
 from . import carreras_bp
 
 # Instanciar service
@@ -292,6 +293,9 @@ def obtener_carreras_alumno(jwt_payload, id_usuario):
     
     Requiere: JWT válido
     Restricción: Un alumno solo puede ver sus propias carreras
+    
+    Query params:
+    - expand: (opcional) materias (agrega materias_suscritas_detalle)
     """
     try:
         # Validar que solo pueda ver sus propias carreras (excepto admin)
@@ -300,13 +304,17 @@ def obtener_carreras_alumno(jwt_payload, id_usuario):
                 "error": "Solo puedes ver tus propias carreras"
             }), 403
         
-        carreras = carrera_service.obtener_carreras_alumno(id_usuario)
+        expandir = Validators.parsear_expand(request.args.get('expand'), ["materias"])
+        
+        carreras = carrera_service.obtener_carreras_alumno(id_usuario, con_materias="materias" in expandir)
         
         return jsonify({
             "total": len(carreras),
             "carreras": carreras
         }), 200
     
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": f"Error interno: {str(e)}"}), 500
 
@@ -7,6 +7,7 @@ from flask import request, jsonify
 from datetime import date
 from middleware.auth import require_jwt, require_roles
 from services.cronograma_service import CronogramaService
+from utils.validators import Validators
 from . import cronograma_bp
 
 # Instanciar service
@@ -68,6 +69,55 @@ def crear_cronograma(jwt_payload):
         return jsonify({"error": f"Error interno: {str(e)}"}), 500
 
 
+@cronograma_bp.route('/bulk', methods=['POST'])
+@require_jwt
+@require_roles(["administrador", "profesor"])
+def crear_cronogramas_bulk(jwt_payload):
+    """
+    POST /cronograma/bulk
+    Crea un lote de cronogramas (carga de inicio de cuatrimestre)
+    
+    Requiere: JWT con rol administrador o profesor
+    
+    Body:
+    {
+        "cronogramas": [
+            { ...mismo formato que POST /cronograma... },
+            ...
+        ]
+    }
+    
+    Respuesta: creados, ids por índice y errores por índice de fila
+    """
+    try:
+        data = request.get_json()
+        
+        if not data:
+            return jsonify({"error": "No se proporcionaron datos"}), 400
+        
+        items = data.get("cronogramas") if isinstance(data, dict) else data
+        
+        if not isinstance(items, list) or not items:
+            return jsonify({"error": "Campo 'cronogramas' debe ser una lista no vacía"}), 400
+        
+        if len(items) > CronogramaService.BULK_MAX_ITEMS:
+            return jsonify({
+                "error": f"Máximo {CronogramaService.BULK_MAX_ITEMS} cronogramas por lote"
+            }), 400
+        
+        # Si es profesor, solo puede cargar cronogramas propios
+        id_profesor_propio = jwt_payload["id_usuario"] if jwt_payload["rol"] == "profesor" else None
+        
+        resultado = cronograma_service.crear_cronogramas_bulk(items, id_profesor_propio)
+        
+        return jsonify(resultado), 201 if resultado["creados"] > 0 else 400
+    
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": f"Error interno: {str(e)}"}), 500
+
+
 @cronograma_bp.route('/<id_cronograma>', methods=['GET'])
 @require_jwt
 def obtener_cronograma(jwt_payload, id_cronograma):
@@ -102,8 +152,10 @@ def listar_por_aula(jwt_payload, id_aula):
     
     Query params:
     - fecha_desde: (opcional) formato YYYY-MM-DD
+    - expand: (opcional) aula,materia,profesor
     """
     try:
+        expandir = Validators.parsear_expand(request.args.get('expand'), CronogramaService.EXPANSIONES)
         fecha_desde = None
         fecha_param = request.args.get('fecha_desde')
         
@@ -115,13 +167,54 @@ def listar_por_aula(jwt_payload, id_aula):
                     "error": "Formato de fecha inválido. Use YYYY-MM-DD"
                 }), 400
         
-        cronogramas = cronograma_service.listar_por_aula(id_aula, fecha_desde)
+        cronogramas = cronograma_service.listar_por_aula(id_aula, fecha_desde, expandir)
         
         return jsonify({
             "total": len(cronogramas),
             "cronogramas": cronogramas
         }), 200
     
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": f"Error interno: {str(e)}"}), 500
+
+
+@cronograma_bp.route('/aula/<id_aula>/libres', methods=['GET'])
+@require_jwt
+def listar_horarios_libres(jwt_payload, id_aula):
+    """
+    GET /cronograma/aula/{id_aula}/libres?fecha=2026-01-30
+    Lista los horarios libres de un aula en una fecha
+    
+    Requiere: JWT válido
+    
+    Query params:
+    - fecha: formato YYYY-MM-DD
+    """
+    try:
+        fecha_param = request.args.get('fecha')
+        
+        if not fecha_param:
+            return jsonify({"error": "Parámetro 'fecha' es requerido"}), 400
+        
+        try:
+            fecha = date.fromisoformat(fecha_param)
+        except ValueError:
+            return jsonify({
+                "error": "Formato de fecha inválido. Use YYYY-MM-DD"
+            }), 400
+        
+        libres = cronograma_service.listar_horarios_libres(id_aula, fecha)
+        
+        return jsonify({
+            "id_aula": id_aula,
+            "fecha": fecha.isoformat(),
+            "libres": libres
+        }), 200
+    
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": f"Error interno: {str(e)}"}), 500
 
@@ -138,6 +231,7 @@ def listar_por_profesor(jwt_payload, id_profesor):
     
     Query params:
     - activos: (opcional) true/false (default: true)
+    - expand: (opcional) aula,materia,profesor
     """
     try:
         # Validar que solo pueda ver sus propios cronogramas (excepto admin)
@@ -147,14 +241,17 @@ def listar_por_profesor(jwt_payload, id_profesor):
             }), 403
         
         solo_activos = request.args.get('activos', 'true').lower() == 'true'
+        expandir = Validators.parsear_expand(request.args.get('expand'), CronogramaService.EXPANSIONES)
         
-        cronogramas = cronograma_service.listar_por_profesor(id_profesor, solo_activos)
+        cronogramas = cronograma_service.listar_por_profesor(id_profesor, solo_activos, expandir)
         
         return jsonify({
             "total": len(cronogramas),
             "cronogramas": cronogramas
         }), 200
     
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": f"Error interno: {str(e)}"}), 500
 
@@ -167,15 +264,21 @@ def listar_por_carrera_materia(jwt_payload, id_carrera, id_materia):
     Lista cronogramas por carrera y materia (para alumnos)
     
     Requiere: JWT válido
+    
+    Query params:
+    - expand: (opcional) aula,materia,profesor
     """
     try:
-        cronogramas = cronograma_service.listar_por_carrera_materia(id_carrera, id_materia)
+        expandir = Validators.parsear_expand(request.args.get('expand'), CronogramaService.EXPANSIONES)
+        cronogramas = cronograma_service.listar_por_carrera_materia(id_carrera, id_materia, expandir)
         
         return jsonify({
             "total": len(cronogramas),
             "cronogramas": cronogramas
         }), 200
     
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": f"Error interno: {str(e)}"}), 500
 
@@ -6,10 +6,13 @@ Endpoints para gestión de usuarios y autenticación
 from flask import request, jsonify
 from middleware.auth import require_jwt, require_roles
 from services.usuario_service import UsuarioService
+from utils.hash_pool import AuthSaturado
+from utils.jwt_helper import JWTHelper
 from . import usuarios_bp
 
 # Instanciar service
 usuario_service = UsuarioService()
+sesion_service = usuario_service.sesiones
 
 
 @usuarios_bp.route('/login', methods=['POST'])
@@ -38,7 +41,46 @@ def login():
                 "error": "Campos 'usuario' y 'password' son requeridos"
             }), 400
         
-        resultado = usuario_service.autenticar(data['usuario'], data['password'])
+        resultado = usuario_service.autenticar(
+            data['usuario'],
+            data['password'],
+            user_agent=request.headers.get("User-Agent", ""),
+            ip=request.remote_addr or ""
+        )
+        
+        return jsonify(resultado), 200
+    
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 401
+    except AuthSaturado as e:
+        # Ráfaga de logins: se rechaza antes de gastar CPU en bcrypt
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "2"}
+    except Exception as e:
+        return jsonify({"error": f"Error interno: {str(e)}"}), 500
+
+
+@usuarios_bp.route('/refresh', methods=['POST'])
+def refresh():
+    """
+    POST /usuarios/refresh
+    Emite un JWT nuevo a partir del refresh token (sin contraseña)
+    
+    No requiere JWT (el access token puede estar vencido)
+    
+    Body:
+    {
+        "refresh_token": "<id_sesion>.<secreto>"
+    }
+    
+    El refresh token se rota: usar el que viene en la respuesta.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        
+        if not data.get('refresh_token'):
+            return jsonify({"error": "Campo 'refresh_token' es requerido"}), 400
+        
+        resultado = sesion_service.refrescar(data['refresh_token'])
         
         return jsonify(resultado), 200
     
@@ -48,6 +90,68 @@ def login():
         return jsonify({"error": f"Error interno: {str(e)}"}), 500
 
 
+@usuarios_bp.route('/logout', methods=['POST'])
+@require_jwt
+def logout(jwt_payload):
+    """
+    POST /usuarios/logout
+    Cierra la sesión del token actual (refresh y access token)
+    
+    Requiere: JWT válido
+    """
+    try:
+        if jwt_payload.get("sid"):
+            sesion_service.revocar(jwt_payload["sid"], jwt_payload["id_usuario"])
+        
+        # El access token actual deja de valer aunque no tenga sesión
+        JWTHelper.revocar_claims(jwt_payload)
+        
+        return jsonify({"mensaje": "Sesión cerrada"}), 200
+    
+    except Exception as e:
+        return jsonify({"error": f"Error interno: {str(e)}"}), 500
+
+
+@usuarios_bp.route('/me/sesiones', methods=['GET'])
+@require_jwt
+def listar_sesiones(jwt_payload):
+    """
+    GET /usuarios/me/sesiones
+    Lista las sesiones abiertas del usuario actual
+    
+    Requiere: JWT válido
+    """
+    try:
+        sesiones = sesion_service.listar(jwt_payload["id_usuario"], actual=jwt_payload.get("sid"))
+        
+        return jsonify({
+            "sesiones": sesiones,
+            "total": len(sesiones)
+        }), 200
+    
+    except Exception as e:
+        return jsonify({"error": f"Error interno: {str(e)}"}), 500
+
+
+@usuarios_bp.route('/me/sesiones/<id_sesion>', methods=['DELETE'])
+@require_jwt
+def cerrar_sesion(jwt_payload, id_sesion):
+    """
+    DELETE /usuarios/me/sesiones/{id_sesion}
+    Cierra una sesión del usuario actual (ej. otro dispositivo)
+    
+    Requiere: JWT válido
+    """
+    try:
+        if not sesion_service.revocar(id_sesion, jwt_payload["id_usuario"]):
+            return jsonify({"error": "Sesión no encontrada"}), 404
+        
+        return jsonify({"mensaje": "Sesión cerrada"}), 200
+    
+    except Exception as e:
+        return jsonify({"error": f"Error interno: {str(e)}"}), 500
+
+
 @usuarios_bp.route('/', methods=['POST'])
 @require_jwt
 @require_roles(["administrador"])
@@ -243,13 +347,16 @@ def cambiar_password(jwt_payload, id_usuario):
         resultado = usuario_service.cambiar_password(
             id_usuario,
             data['password_actual'],
-            data['password_nueva']
+            data['password_nueva'],
+            id_sesion_actual=jwt_payload.get("sid")
         )
         
         return jsonify(resultado), 200
     
     except ValueError as e:
         return jsonify({"error": str(e)}), 400
+    except AuthSaturado as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "2"}
     except Exception as e:
         return jsonify({"error": f"Error interno: {str(e)}"}), 500
 
@@ -6,10 +6,12 @@ from .aula_service import AulaService
 from .usuario_service import UsuarioService
 from .cronograma_service import CronogramaService
 from .carrera_service import CarreraService
+from .sesion_service import SesionService
 
 __all__ = [
     'AulaService',
     'UsuarioService',
     'CronogramaService',
-    'CarreraService'
+    'CarreraService',
+    'SesionService'
 ]
@@ -3,16 +3,19 @@ AulaService - Lógica de negocio para gestión de aulas
 Incluye: CRUD, asignación, liberación, caché Redis, eventos MQTT
 """
 
+import hashlib
 import json
 from typing import List, Dict, Any, Optional
 from bson import ObjectId
 from datetime import datetime
 
 from db.mongo import get_mongo_db
-from db.redis import redis_client
+from db.cache import cache_aulas
 from models.aula import AulaModel
+from models.aula_contadores import contadores_aula
 from utils.validators import Validators
 from utils.mqtt_events import MQTTEventPublisher
+from services.metricas_publicador import publicador_metricas
 
 
 class AulaService:
@@ -23,11 +26,14 @@ class AulaService:
     CACHE_KEY_PREFIX = "aula:"
     CACHE_KEY_ALL = "aulas:all"
     CACHE_TTL = 300  # 5 minutos
-    LOCK_KEY_PREFIX = "lock:aula:"
-    LOCK_TTL = 30  # 30 segundos
+    CACHE_KEY_FILTRO_PREFIX = "aulas:q:"
+    CACHE_TAG_ESTADO_PREFIX = "aulas:estado:"
+    CACHE_TAG_FILTRADOS = "aulas:filtradas"
     
     def __init__(self):
         self.db = get_mongo_db()
+        # Todas las lecturas van al primario: rellenan la caché, y una copia atrasada
+        # de un secundario quedaría servida hasta el TTL aunque ya se haya invalidado
         self.collection = self.db.aulas
     
     def crear_aula(self, data: Dict[str, Any]) -> Dict[str, Any]:
@@ -47,8 +53,8 @@ class AulaService:
             # Crear aula en MongoDB
             id_aula = AulaModel.crear(self.collection, data)
             
-            # Invalidar caché de lista de aulas
-            redis_client.client.delete(self.CACHE_KEY_ALL)
+            # Invalidar caché de lista de aulas (y una posible entrada negativa del ID)
+            cache_aulas.invalidar(f"{self.CACHE_KEY_PREFIX}{id_aula}", self.CACHE_KEY_ALL)
             
             # Obtener aula creada
             aula = AulaModel.obtener_por_id(self.collection, id_aula)
@@ -77,6 +83,45 @@ class AulaService:
         except Exception as e:
             raise Exception(f"Error al crear aula: {e}")
     
+    @staticmethod
+    def _serializar(aula: Dict[str, Any]) -> Dict[str, Any]:
+        # Convertir ObjectIds a strings para JSON
+        aula["_id"] = str(aula["_id"])
+        if aula.get("id_asignacion_actual"):
+            aula["id_asignacion_actual"] = str(aula["id_asignacion_actual"])
+        return aula
+    
+    @classmethod
+    def _key_filtros(cls, filtros: Dict[str, Any]) -> str:
+        """Key de caché de un listado filtrado: hash del filtro en forma canónica"""
+        canonico = json.dumps(filtros, sort_keys=True, separators=(",", ":"), default=str)
+        return f"{cls.CACHE_KEY_FILTRO_PREFIX}{hashlib.sha1(canonico.encode('utf-8')).hexdigest()}"
+    
+    @classmethod
+    def _tags_filtros(cls, filtros: Dict[str, Any]) -> List[str]:
+        """
+        Tags de invalidación de un listado filtrado: el del estado filtrado, o
+        el genérico si el filtro no fija un estado (cualquier cambio lo afecta)
+        """
+        if isinstance(filtros.get("estado"), str):
+            return [f"{cls.CACHE_TAG_ESTADO_PREFIX}{filtros['estado']}"]
+        return [cls.CACHE_TAG_FILTRADOS]
+    
+    @classmethod
+    def _invalidar_listados_filtrados(cls, *estados: Optional[str]):
+        """Invalida los listados filtrados afectados por cambios en aulas de esos estados"""
+        tags = [f"{cls.CACHE_TAG_ESTADO_PREFIX}{e}" for e in estados if e] + [cls.CACHE_TAG_FILTRADOS]
+        cache_aulas.invalidar_tags(*tags)
+    
+    def _cargar_aula(self, obj_id: ObjectId) -> Optional[Dict[str, Any]]:
+        """Lee un aula de MongoDB (None si no existe)"""
+        aula = AulaModel.obtener_por_id(self.collection, obj_id)
+        return self._serializar(aula) if aula else None
+    
+    def _cargar_listado(self, filtros: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Lista aulas desde MongoDB (primario)"""
+        return [self._serializar(aula) for aula in AulaModel.listar(self.collection, filtros)]
+    
     def obtener_aula(self, id_aula: str) -> Optional[Dict[str, Any]]:
         """
         Obtiene un aula por ID (con caché Redis)
@@ -88,31 +133,14 @@ class AulaService:
             Diccionario con datos del aula o None si no existe
         """
         try:
-            # Intentar obtener de caché
-            cache_key = f"{self.CACHE_KEY_PREFIX}{id_aula}"
-            cached = redis_client.client.get(cache_key)
-            
-            if cached:
-                return json.loads(cached)
-            
-            # Si no está en caché, consultar MongoDB
             obj_id = Validators.convertir_a_objectid(id_aula)
-            aula = AulaModel.obtener_por_id(self.collection, obj_id)
             
-            if aula:
-                # Convertir ObjectId a string para JSON
-                aula["_id"] = str(aula["_id"])
-                if aula.get("id_asignacion_actual"):
-                    aula["id_asignacion_actual"] = str(aula["id_asignacion_actual"])
-                
-                # Guardar en caché
-                redis_client.client.setex(
-                    cache_key,
-                    self.CACHE_TTL,
-                    json.dumps(aula, default=str)
-                )
-            
-            return aula
+            # Caché con relleno único; los IDs inexistentes también se cachean (TTL corto)
+            return cache_aulas.obtener_o_calcular(
+                f"{self.CACHE_KEY_PREFIX}{id_aula}",
+                lambda: self._cargar_aula(obj_id),
+                self.CACHE_TTL
+            )
         
         except Exception as e:
             print(f"Error al obtener aula: {e}")
@@ -129,31 +157,21 @@ class AulaService:
             Lista de aulas
         """
         try:
-            # Si no hay filtros, intentar obtener de caché
-            if not filtros:
-                cached = redis_client.client.get(self.CACHE_KEY_ALL)
-                
-                if cached:
-                    return json.loads(cached)
-            
-            # Consultar MongoDB
-            aulas = AulaModel.listar(self.collection, filtros)
-            
-            # Convertir ObjectIds a strings
-            for aula in aulas:
-                aula["_id"] = str(aula["_id"])
-                if aula.get("id_asignacion_actual"):
-                    aula["id_asignacion_actual"] = str(aula["id_asignacion_actual"])
-            
-            # Si no hay filtros, guardar en caché
+            # Sin filtros: caché con relleno único
             if not filtros:
-                redis_client.client.setex(
+                return cache_aulas.obtener_o_calcular(
                     self.CACHE_KEY_ALL,
-                    self.CACHE_TTL,
-                    json.dumps(aulas, default=str)
+                    lambda: self._cargar_listado(None),
+                    self.CACHE_TTL
                 )
             
-            return aulas
+            # Con filtros: una entrada por filtro (hash canónico), etiquetada por estado
+            return cache_aulas.obtener_o_calcular(
+                self._key_filtros(filtros),
+                lambda: self._cargar_listado(filtros),
+                self.CACHE_TTL,
+                tags=self._tags_filtros(filtros)
+            )
         
         except Exception as e:
             print(f"Error al listar aulas: {e}")
@@ -176,12 +194,15 @@ class AulaService:
         try:
             obj_id = Validators.convertir_a_objectid(id_aula)
             
-            # Actualizar en MongoDB
+            # Actualizar en MongoDB (un cambio de estado invalida sus tags vía AulaModel)
             AulaModel.actualizar(self.collection, obj_id, data)
             
+            # Otros campos (cupo, descripción...) pueden figurar en cualquier listado filtrado
+            if any(campo != "estado" for campo in data):
+                self._invalidar_listados_filtrados(*AulaModel.ESTADOS_VALIDOS)
+            
             # Invalidar caché
-            redis_client.client.delete(f"{self.CACHE_KEY_PREFIX}{id_aula}")
-            redis_client.client.delete(self.CACHE_KEY_ALL)
+            cache_aulas.invalidar(f"{self.CACHE_KEY_PREFIX}{id_aula}", self.CACHE_KEY_ALL)
             
             return {"mensaje": "Aula actualizada correctamente"}
         
@@ -211,8 +232,7 @@ class AulaService:
             AulaModel.cambiar_estado(self.collection, obj_id, nuevo_estado)
             
             # Invalidar caché
-            redis_client.client.delete(f"{self.CACHE_KEY_PREFIX}{id_aula}")
-            redis_client.client.delete(self.CACHE_KEY_ALL)
+            cache_aulas.invalidar(f"{self.CACHE_KEY_PREFIX}{id_aula}", self.CACHE_KEY_ALL)
             
             return {
                 "mensaje": f"Estado del aula cambiado a '{nuevo_estado}'"
@@ -225,7 +245,10 @@ class AulaService:
     
     def asignar_aula(self, id_aula: str, id_cronograma: str) -> Dict[str, Any]:
         """
-        Asigna un aula a un cronograma (con lock distribuido)
+        Asigna un aula a un cronograma
+        
+        Sin lock distribuido: el update condicional de AulaModel.asignar es atómico
+        y ante asignaciones concurrentes solo una encuentra el aula "disponible".
         
         Args:
             id_aula: ID del aula
@@ -237,15 +260,7 @@ class AulaService:
         Raises:
             ValueError: Si el aula no está disponible o hay conflicto
         """
-        lock_key = f"{self.LOCK_KEY_PREFIX}{id_aula}"
-        
         try:
-            # Intentar adquirir lock
-            lock_adquirido = redis_client.acquire_lock(lock_key)
-            
-            if not lock_adquirido:
-                raise ValueError("El aula está siendo procesada por otra operación. Intente nuevamente.")
-            
             # Convertir IDs
             obj_id_aula = Validators.convertir_a_objectid(id_aula)
             obj_id_cronograma = Validators.convertir_a_objectid(id_cronograma)
@@ -257,8 +272,7 @@ class AulaService:
                 raise ValueError("El aula no está disponible para asignación")
             
             # Invalidar caché
-            redis_client.client.delete(f"{self.CACHE_KEY_PREFIX}{id_aula}")
-            redis_client.client.delete(self.CACHE_KEY_ALL)
+            cache_aulas.invalidar(f"{self.CACHE_KEY_PREFIX}{id_aula}", self.CACHE_KEY_ALL)
             
             return {"mensaje": "Aula asignada correctamente"}
         
@@ -266,9 +280,6 @@ class AulaService:
             raise ValueError(str(e))
         except Exception as e:
             raise Exception(f"Error al asignar aula: {e}")
-        finally:
-            # Liberar lock
-            redis_client.release_lock(lock_key)
     
     def liberar_aula(self, id_aula: str, publicar_evento: bool = True) -> Dict[str, Any]:
         """
@@ -280,16 +291,19 @@ class AulaService:
         
         Returns:
             Diccionario con mensaje de éxito
+        
+        Raises:
+            ValueError: Si el aula no existe
         """
         try:
             obj_id = Validators.convertir_a_objectid(id_aula)
             
             # Liberar en MongoDB
-            AulaModel.liberar(self.collection, obj_id)
+            if not AulaModel.liberar(self.collection, obj_id):
+                raise ValueError(f"No se encontró el aula con ID {id_aula}")
             
             # Invalidar caché
-            redis_client.client.delete(f"{self.CACHE_KEY_PREFIX}{id_aula}")
-            redis_client.client.delete(self.CACHE_KEY_ALL)
+            cache_aulas.invalidar(f"{self.CACHE_KEY_PREFIX}{id_aula}", self.CACHE_KEY_ALL)
             
             # Publicar evento MQTT (si se solicita)
             if publicar_evento:
@@ -302,38 +316,43 @@ class AulaService:
             
             return {"mensaje": "Aula liberada correctamente"}
         
+        except ValueError as e:
+            raise ValueError(str(e))
         except Exception as e:
             raise Exception(f"Error al liberar aula: {e}")
     
-    def obtener_metricas(self) -> Dict[str, int]:
+    def obtener_estadisticas_cache(self) -> Dict[str, Any]:
+        """
+        Estadísticas de la caché de aulas de este worker (hits/misses por nivel)
+        
+        Returns:
+            Diccionario con estadísticas del nivel local y de Redis
+        """
+        return cache_aulas.estadisticas()
+    
+    def obtener_metricas(self) -> Dict[str, Any]:
         """
         Obtiene métricas de estado de aulas
         
+        Lee la última foto del publicador de métricas (services/metricas_publicador.py);
+        la publicación MQTT la hace solo la réplica líder, no cada request.
+        
         Returns:
-            Diccionario con total, disponibles, ocupadas, deshabilitadas
+            Diccionario con total, disponibles, ocupadas, deshabilitadas (y actualizado_at)
         """
         try:
-            total = self.collection.count_documents({})
-            disponibles = self.collection.count_documents({"estado": "disponible"})
-            ocupadas = self.collection.count_documents({"estado": "ocupada"})
-            deshabilitadas = self.collection.count_documents({"estado": "deshabilitada"})
+            foto = publicador_metricas.foto()
+            if foto:
+                return foto
             
-            metricas = {
-                "total_aulas": total,
-                "disponibles": disponibles,
-                "ocupadas": ocupadas,
-                "deshabilitadas": deshabilitadas
+            # Todavía no hay foto (sin líder o Redis caído): contadores directos
+            conteos = contadores_aula.obtener(self.collection)
+            return {
+                "total_aulas": conteos["total"],
+                "disponibles": conteos["disponible"],
+                "ocupadas": conteos["ocupada"],
+                "deshabilitadas": conteos["deshabilitada"]
             }
-            
-            # Publicar métricas a MQTT (opcional)
-            try:
-                MQTTEventPublisher.publicar_metricas_aulas(
-                    total, disponibles, ocupadas, deshabilitadas
-                )
-            except Exception as e:
-                print(f"⚠️  Error al publicar métricas MQTT: {e}")
-            
-            return metricas
         
         except Exception as e:
             print(f"Error al obtener métricas: {e}")
@@ -343,3 +362,16 @@ class AulaService:
                 "ocupadas": 0,
                 "deshabilitadas": 0
             }
+
+
+def _al_cambiar_estado(ids_aula: List[ObjectId], estado_anterior: Optional[str], estado_nuevo: str):
+    # Cualquier transición (también las hechas desde CronogramaService) invalida el
+    # aula, el listado completo y los listados filtrados de los dos estados involucrados
+    cache_aulas.invalidar(
+        *(f"{AulaService.CACHE_KEY_PREFIX}{id_aula}" for id_aula in ids_aula),
+        AulaService.CACHE_KEY_ALL
+    )
+    AulaService._invalidar_listados_filtrados(estado_anterior, estado_nuevo)
+
+
+AulaModel.suscribir_cambios_estado(_al_cambiar_estado)
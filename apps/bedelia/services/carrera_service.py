@@ -6,11 +6,13 @@ Incluye: CRUD carreras/materias, asignaciones profesor-materia, inscripciones al
 import json
 from typing import List, Dict, Any, Optional
 from bson import ObjectId
+from redis.exceptions import RedisError
 
-from db.mongo import get_mongo_db
+from db.mongo import get_mongo_db, lectura_secundaria
 from db.redis import redis_client
 from models.carrera_materia import CarreraMateriaModel
 from models.asignacion import AsignacionModel
+from models.batch_loader import BatchLoader
 from utils.validators import Validators
 
 
@@ -26,9 +28,19 @@ class CarreraService:
     def __init__(self):
         self.db = get_mongo_db()
         self.materias_collection = self.db.carrera_materias
+        # Listados: secundarios del replica set (staleness acotado)
+        self.materias_lectura = lectura_secundaria(self.materias_collection)
         self.usuario_carrera_collection = self.db.usuario_carrera
         self.profesor_materia_collection = self.db.profesor_carrera_materia
     
+    @staticmethod
+    def _invalidar_cache(*keys: str):
+        """Borra keys de caché en un solo UNLINK (si Redis no responde, vencen por TTL)"""
+        try:
+            redis_client.client.unlink(*keys)
+        except RedisError as e:
+            print(f"⚠️  No se pudo invalidar caché de carreras: {e}")
+    
     # ========== GESTIÓN DE MATERIAS ==========
     
     def crear_materia(self, data: Dict[str, Any]) -> Dict[str, Any]:
@@ -49,7 +61,7 @@ class CarreraService:
             id_materia = CarreraMateriaModel.crear(self.materias_collection, data)
             
             # Invalidar caché de carreras
-            redis_client.client.delete(self.CACHE_KEY_CARRERAS)
+            self._invalidar_cache(self.CACHE_KEY_CARRERAS)
             
             return {
                 "id": str(id_materia),
@@ -74,7 +86,10 @@ class CarreraService:
         try:
             # Intentar obtener de caché
             cache_key = f"{self.CACHE_KEY_PREFIX_MATERIA}{id_materia}"
-            cached = redis_client.client.get(cache_key)
+            try:
+                cached = redis_client.client.get(cache_key)
+            except RedisError:
+                cached = None  # Redis caído: se lee de MongoDB
             
             if cached:
                 return json.loads(cached)
@@ -88,11 +103,14 @@ class CarreraService:
                 materia["_id"] = str(materia["_id"])
                 
                 # Guardar en caché
-                redis_client.client.setex(
-                    cache_key,
-                    self.CACHE_TTL,
-                    json.dumps(materia, default=str)
-                )
+                try:
+                    redis_client.client.setex(
+                        cache_key,
+                        self.CACHE_TTL,
+                        json.dumps(materia, default=str)
+                    )
+                except RedisError:
+                    pass
             
             return materia
         
@@ -113,7 +131,7 @@ class CarreraService:
         """
         try:
             materias = CarreraMateriaModel.listar_por_carrera(
-                self.materias_collection,
+                self.materias_lectura,
                 carrera,
                 solo_activas
             )
@@ -149,8 +167,7 @@ class CarreraService:
             CarreraMateriaModel.actualizar(self.materias_collection, obj_id, data)
             
             # Invalidar caché
-            redis_client.client.delete(f"{self.CACHE_KEY_PREFIX_MATERIA}{id_materia}")
-            redis_client.client.delete(self.CACHE_KEY_CARRERAS)
+            self._invalidar_cache(f"{self.CACHE_KEY_PREFIX_MATERIA}{id_materia}", self.CACHE_KEY_CARRERAS)
             
             return {"mensaje": "Materia actualizada correctamente"}
         
@@ -204,32 +221,27 @@ class CarreraService:
         try:
             obj_id = Validators.convertir_a_objectid(id_profesor)
             
-            asignaciones = AsignacionModel.obtener_materias_profesor(
+            # Una sola agregación ($lookup) en lugar de una consulta por materia
+            asignaciones = AsignacionModel.obtener_materias_profesor_detalle(
                 self.profesor_materia_collection,
                 obj_id,
                 solo_activas
             )
             
-            # Enriquecer con datos de materias
             resultado = []
             for asig in asignaciones:
-                materia = CarreraMateriaModel.obtener_por_id(
-                    self.materias_collection,
-                    asig["id_materia"]
-                )
-                
-                if materia:
-                    resultado.append({
-                        "id_asignacion": str(asig["_id"]),
-                        "id_materia": str(materia["_id"]),
-                        "codigo_materia": materia["codigo_materia"],
-                        "materia": materia["materia"],
-                        "carrera": materia["carrera"],
-                        "anio": materia["anio"],
-                        "cuatrimestre": materia["cuatrimestre"],
-                        "carga_horaria": materia["carga_horaria"],
-                        "fecha_asignacion": str(asig["fecha_asignacion"])
-                    })
+                materia = asig["materia_doc"]
+                resultado.append({
+                    "id_asignacion": str(asig["_id"]),
+                    "id_materia": str(materia["_id"]),
+                    "codigo_materia": materia["codigo_materia"],
+                    "materia": materia["materia"],
+                    "carrera": materia["carrera"],
+                    "anio": materia["anio"],
+                    "cuatrimestre": materia["cuatrimestre"],
+                    "carga_horaria": materia["carga_horaria"],
+                    "fecha_asignacion": str(asig["fecha_asignacion"])
+                })
             
             return resultado
         
@@ -325,12 +337,13 @@ class CarreraService:
         except Exception as e:
             raise Exception(f"Error al agregar materia suscrita: {e}")
     
-    def obtener_carreras_alumno(self, id_usuario: str) -> List[Dict[str, Any]]:
+    def obtener_carreras_alumno(self, id_usuario: str, con_materias: bool = False) -> List[Dict[str, Any]]:
         """
         Obtiene las carreras en las que está inscrito un alumno
         
         Args:
             id_usuario: ID del usuario (alumno)
+            con_materias: Si True, agrega materias_suscritas_detalle (una sola consulta)
         
         Returns:
             Lista de inscripciones
@@ -343,12 +356,31 @@ class CarreraService:
                 obj_id
             )
             
+            # Datos de todas las materias suscritas en una sola consulta (si se piden)
+            materias = None
+            if con_materias:
+                materias = BatchLoader(
+                    self.materias_lectura,
+                    {"codigo_materia": 1, "materia": 1, "anio": 1, "cuatrimestre": 1}
+                )
+                materias.cargar(
+                    id_materia
+                    for insc in inscripciones
+                    for id_materia in insc.get("materias_suscritas", [])
+                )
+            
             # Convertir ObjectIds a strings
             for insc in inscripciones:
                 insc["_id"] = str(insc["_id"])
                 insc["id_usuario"] = str(insc["id_usuario"])
                 # Convertir lista de materias suscritas
                 if "materias_suscritas" in insc:
+                    if materias is not None:
+                        insc["materias_suscritas_detalle"] = [
+                            {**materia, "_id": str(materia["_id"])}
+                            for materia in (materias.obtener(m) for m in insc["materias_suscritas"])
+                            if materia
+                        ]
                     insc["materias_suscritas"] = [str(m) for m in insc["materias_suscritas"]]
             
             return inscripciones
@@ -6,11 +6,16 @@ Incluye: CRUD, validaciones de horario/cupo/profesor, eventos MQTT
 from typing import List, Dict, Any, Optional
 from bson import ObjectId
 from datetime import date, datetime
+from redis.exceptions import RedisError
 
-from db.mongo import get_mongo_db
+from db.mongo import get_mongo_db, lectura_secundaria, ejecutar_transaccion
+from db.redis import redis_client, RedisNoDisponible
 from models.cronograma import CronogramaModel
+from models.cronograma_index import leer_intervalos, horarios_libres, IntervalosDia, hora_a_minutos, normalizar_fecha
 from models.aula import AulaModel
 from models.asignacion import AsignacionModel
+from models.batch_loader import BatchLoader
+from models.outbox import OutboxModel
 from utils.validators import Validators
 from utils.mqtt_events import MQTTEventPublisher
 
@@ -20,11 +25,27 @@ class CronogramaService:
     Service para gestión de cronogramas con validaciones del Rules Engine
     """
     
+    BULK_MAX_ITEMS = 5000
+    # Datos relacionados que un listado puede incluir (?expand=): campo -> (id, proyección)
+    EXPANSIONES = {
+        "aula": ("id_aula", {"nro_aula": 1, "piso": 1}),
+        "materia": ("id_materia", {"codigo_materia": 1, "materia": 1}),
+        "profesor": ("id_profesor", {"usuario": 1, "nombre": 1}),
+    }
+    BULK_LOCK_ESPERA = 10  # segundos esperando el lock de las aulas del lote
+    
     def __init__(self):
         self.db = get_mongo_db()
         self.collection = self.db.cronograma
+        # Listados: secundarios del replica set (staleness acotado)
+        self.collection_lectura = lectura_secundaria(self.collection)
         self.aulas_collection = self.db.aulas
+        self.aulas_lectura = lectura_secundaria(self.aulas_collection)
+        self.materias_lectura = lectura_secundaria(self.db.carrera_materias)
+        self.usuarios_lectura = lectura_secundaria(self.db.usuarios)
         self.profesor_materia_collection = self.db.profesor_carrera_materia
+        # Eventos MQTT escritos en la misma transacción que el cronograma (ver relay_outbox.py)
+        self.outbox_collection = self.db.outbox_eventos
     
     def crear_cronograma(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -34,8 +55,9 @@ class CronogramaService:
         - Horario permitido (06:00 - 23:00)
         - Duración (45min - 4h)
         - Profesor pertenece a la carrera
-        - Aula disponible
-        - No hay conflicto de horario
+        - Aula no deshabilitada (una ocupada admite otros horarios del día)
+        - No hay conflicto de horario (consulta de rango dentro de la transacción,
+          ver CronogramaModel.crear)
         
         Args:
             data: Datos del cronograma
@@ -82,34 +104,29 @@ class CronogramaService:
             if aula["estado"] == "deshabilitada":
                 raise ValueError("El aula está deshabilitada y no puede ser asignada")
             
-            if aula["estado"] == "ocupada":
-                raise ValueError("El aula está ocupada actualmente")
-            
-            # Crear cronograma en MongoDB
-            id_cronograma = CronogramaModel.crear(self.collection, data)
-            
-            # Marcar aula como ocupada
-            AulaModel.asignar(self.aulas_collection, id_aula, id_cronograma)
-            
-            # Publicar evento MQTT (aula asignada)
-            try:
-                cronograma = CronogramaModel.obtener_por_id(self.collection, id_cronograma)
-                
-                MQTTEventPublisher.publicar_aula_asignada(
-                    str(id_aula),
-                    data.get("id_carrera"),
-                    str(data.get("id_materia")),
-                    {
-                        "id_cronograma": str(id_cronograma),
-                        "id_profesor": str(id_profesor),
-                        "fecha": str(cronograma["fecha"]),
-                        "hora_inicio": cronograma["hora_inicio"],
-                        "hora_fin": cronograma["hora_fin"],
-                        "tipo": cronograma["tipo"]
-                    }
+            # Validación 5 + crear cronograma + ocupar el aula + evento (outbox) en una sola
+            # transacción. CronogramaModel.crear controla el solapamiento con una consulta de
+            # rango en el snapshot de la transacción. Dos reservas concurrentes escriben el
+            # mismo documento de aula (AulaModel.ocupar lo escribe aunque ya esté ocupada):
+            # una recibe un WriteConflict, ejecutar_transaccion la reintenta y en el
+            # reintento ya ve el cronograma de la otra.
+            def _crear(session):
+                id_nuevo = CronogramaModel.crear(self.collection, data, session=session)
+                if not AulaModel.ocupar(self.aulas_collection, id_aula, id_nuevo, session=session):
+                    raise ValueError("El aula no está disponible para asignación")
+                cronograma = CronogramaModel.obtener_por_id(self.collection, id_nuevo, session=session)
+                OutboxModel.registrar(
+                    self.outbox_collection,
+                    MQTTEventPublisher.evento_aula_asignada(
+                        str(id_aula),
+                        str(id_nuevo),
+                        self._datos_evento(cronograma)
+                    ),
+                    session=session
                 )
-            except Exception as e:
-                print(f"⚠️  Error al publicar evento MQTT: {e}")
+                return cronograma
+            
+            id_cronograma = ejecutar_transaccion(_crear)["_id"]
             
             return {
                 "id": str(id_cronograma),
@@ -121,6 +138,276 @@ class CronogramaService:
         except Exception as e:
             raise Exception(f"Error al crear cronograma: {e}")
     
+    def crear_cronogramas_bulk(self, items: List[Dict[str, Any]], id_profesor_propio: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Crea un lote de cronogramas validándolo en una sola pasada
+        
+        Aplica las mismas reglas que crear_cronograma, fila por fila y en orden,
+        pero con las lecturas agrupadas: una consulta $in para aulas, una para
+        profesor_carrera_materia y una para los cronogramas existentes de esos días.
+        Escribe cronogramas, aulas (bulk_write) y eventos (outbox) en una sola
+        transacción, que repite los controles contra MongoDB y es la que decide.
+        
+        El lock de Redis sobre las aulas del lote solo serializa cargas masivas
+        entre sí (el alta individual no lo toma). Si Redis no está disponible la
+        carga sigue sin lock: la transacción alcanza para no pisar reservas.
+        
+        Args:
+            items: Lista de cronogramas (mismo formato que POST /cronograma)
+            id_profesor_propio: Si se indica, solo se aceptan filas de ese profesor
+        
+        Returns:
+            Diccionario con creados, ids ({"indice", "id"}) y errores ({"indice", "error"})
+        
+        Raises:
+            ValueError: Si otra carga masiva retiene las aulas más de BULK_LOCK_ESPERA
+        """
+        errores = []
+        candidatos = []  # (indice, documento)
+        
+        # Paso 1: validaciones sin I/O (horario, duración, formato)
+        for indice, item in enumerate(items):
+            try:
+                if not isinstance(item, dict):
+                    raise ValueError("Cada cronograma debe ser un objeto JSON")
+                
+                data = dict(item)
+                
+                if id_profesor_propio is not None and str(data.get("id_profesor")) != id_profesor_propio:
+                    raise ValueError("Un profesor solo puede crear cronogramas para sí mismo")
+                
+                if not Validators.validar_horario_permitido(data.get("hora_inicio", "")):
+                    raise ValueError("Horario no permitido. Solo se permiten asignaciones entre 06:00 y 23:00")
+                
+                valido, duracion, error = Validators.validar_duracion(
+                    data.get("hora_inicio", ""),
+                    data.get("hora_fin", "")
+                )
+                if not valido:
+                    raise ValueError(error)
+                
+                documento = CronogramaModel.validar_datos(data, es_actualizacion=False)
+                candidatos.append((indice, documento))
+            
+            except (ValueError, AttributeError, TypeError) as e:
+                errores.append({"indice": indice, "error": str(e)})
+        
+        # Lock sobre las aulas del lote mientras se valida y escribe (lease renovable):
+        # dos cargas masivas sobre las mismas aulas se serializan en vez de pisarse
+        creados = []
+        if candidatos:
+            candado = redis_client.lock(
+                *(f"aula:{doc['id_aula']}" for _, doc in candidatos),
+                espera=self.BULK_LOCK_ESPERA
+            )
+            try:
+                adquirido = candado.adquirir()
+            except RedisError as e:
+                if not isinstance(e, RedisNoDisponible):
+                    print(f"⚠️  Redis no disponible, carga masiva sin lock: {e}")
+                creados = self._validar_y_escribir_lote(candidatos, errores, None)
+            else:
+                if not adquirido:
+                    raise ValueError("El recurso está siendo procesado por otra operación. Intente nuevamente.")
+                try:
+                    creados = self._validar_y_escribir_lote(candidatos, errores, candado)
+                finally:
+                    candado.liberar()
+        
+        errores.sort(key=lambda err: err["indice"])
+        
+        return {
+            "total": len(items),
+            "creados": len(creados),
+            "ids": [{"indice": indice, "id": str(doc["_id"])} for indice, doc in creados],
+            "errores": errores
+        }
+    
+    def _validar_y_escribir_lote(self, candidatos: List[tuple], errores: List[Dict[str, Any]], candado) -> List[tuple]:
+        """
+        Pasos 2 a 4 de crear_cronogramas_bulk (con el lock de las aulas tomado)
+        
+        Args:
+            candidatos: Lista de (indice, documento) que pasaron las validaciones sin I/O
+            errores: Lista donde se agregan los errores por fila
+            candado: LockRedis de las aulas del lote (su fencing se escribe en las aulas),
+                o None si la carga sigue sin lock (Redis no disponible)
+        
+        Returns:
+            Lista de (indice, documento) creados
+        """
+        # Paso 2: precarga de todo lo referenciado por el lote
+        aulas = AulaModel.obtener_por_ids(
+            self.aulas_collection,
+            (doc["id_aula"] for _, doc in candidatos)
+        )
+        profesor_carreras = AsignacionModel.obtener_carreras_profesores(
+            self.profesor_materia_collection,
+            (doc["id_profesor"] for _, doc in candidatos)
+        )
+        # Intervalos ocupados de esos días; las filas aceptadas se agregan a medida que pasan
+        intervalos_lote: Dict[Any, IntervalosDia] = leer_intervalos(
+            self.collection,
+            {doc["id_aula"] for _, doc in candidatos},
+            {normalizar_fecha(doc["fecha"]) for _, doc in candidatos}
+        )
+        
+        # Paso 3: reglas de negocio en memoria, en el orden del lote.
+        # El estado del aula es el que tenía en MongoDB antes del lote (se mira una vez);
+        # una fila no puede superponerse con lo que ya había ni con las anteriores del lote
+        estado_aulas = {id_aula: aula["estado"] for id_aula, aula in aulas.items()}
+        aceptados = []  # (indice, documento)
+        
+        for indice, documento in candidatos:
+            try:
+                if (documento["id_profesor"], documento["id_carrera"]) not in profesor_carreras:
+                    raise ValueError(f"El profesor no está asignado a la carrera '{documento['id_carrera']}'")
+                
+                id_aula = documento["id_aula"]
+                
+                if id_aula not in estado_aulas:
+                    raise ValueError("Aula no encontrada")
+                
+                if estado_aulas[id_aula] == "deshabilitada":
+                    raise ValueError("El aula está deshabilitada y no puede ser asignada")
+                
+                clave = (id_aula, normalizar_fecha(documento["fecha"]))
+                inicio = hora_a_minutos(documento["hora_inicio"])
+                fin = hora_a_minutos(documento["hora_fin"])
+                
+                if intervalos_lote[clave].hay_solapamiento(inicio, fin):
+                    raise ValueError("El horario se superpone con otra asignación del aula en esa fecha")
+                
+                intervalos_lote[clave].agregar(inicio, fin, indice)
+                aceptados.append((indice, documento))
+            
+            except ValueError as e:
+                errores.append({"indice": indice, "error": str(e)})
+        
+        # Paso 4: escritura masiva (cronogramas + aulas + eventos del outbox en una transacción).
+        # Las filas que ya no entran se descartan dentro de la transacción: un solo commit
+        if candado is not None and candado.perdido.is_set():
+            raise ValueError("Se perdió el lock de la carga masiva. Intente nuevamente.")
+        
+        rechazos = {}
+        if aceptados:
+            rechazos = ejecutar_transaccion(lambda session: self._insertar_lote(
+                [doc for _, doc in aceptados], session, candado.fencing if candado else None
+            ))
+        
+        creados = []
+        for pos, (indice, documento) in enumerate(aceptados):
+            if pos in rechazos:
+                errores.append({"indice": indice, "error": rechazos[pos]})
+            else:
+                creados.append((indice, documento))
+        
+        return creados
+    
+    @staticmethod
+    def _datos_evento(cronograma: Dict[str, Any]) -> Dict[str, Any]:
+        """Datos del cronograma que viajan en el evento de aula asignada"""
+        return {
+            "id_carrera": cronograma["id_carrera"],
+            "id_materia": str(cronograma["id_materia"]),
+            "id_profesor": str(cronograma["id_profesor"]),
+            "fecha": str(cronograma["fecha"]),
+            "hora_inicio": cronograma["hora_inicio"],
+            "hora_fin": cronograma["hora_fin"],
+            "tipo": cronograma["tipo"]
+        }
+    
+    def _insertar_lote(self, documentos: List[Dict[str, Any]], session, fencing: Optional[int] = None) -> Dict[int, str]:
+        """
+        Inserta cronogramas, ocupa sus aulas y registra los eventos dentro de una transacción
+        
+        Antes de escribir descarta, con una consulta por regla y en el snapshot de la
+        transacción, las filas que se superponen con lo que hay en MongoDB, las que
+        repiten (aula, fecha, hora_inicio) y las de aulas que dejaron de estar
+        disponibles (deshabilitadas). Con fencing, las aulas que ya recibieron un
+        fencing mayor (lock vencido y tomado por otra carga) se descartan igual.
+        
+        Returns:
+            Diccionario posición en 'documentos' -> motivo, de las filas descartadas
+        
+        Raises:
+            ValueError: Si un aula cambió entre la verificación y la escritura
+        """
+        rechazos = {}
+        ids_aula = {doc["id_aula"] for doc in documentos}
+        fechas = {normalizar_fecha(doc["fecha"]) for doc in documentos}
+        
+        # Aulas que se pueden ocupar (disponibles u ocupadas, sin un fencing mayor)
+        filtro_aulas = {"_id": {"$in": list(ids_aula)}, "estado": {"$in": ["disponible", "ocupada"]}}
+        if fencing is not None:
+            filtro_aulas["fencing_lock"] = {"$not": {"$gt": fencing}}
+        disponibles = {
+            aula["_id"] for aula in self.aulas_collection.find(filtro_aulas, {"_id": 1}, session=session)
+        }
+        
+        # Claves del índice único ya usadas (cualquier estado, también canceladas)
+        existentes = {
+            (doc["id_aula"], normalizar_fecha(doc["fecha"]), doc["hora_inicio"])
+            for doc in self.collection.find(
+                {
+                    "id_aula": {"$in": list(ids_aula)},
+                    "fecha": {"$in": [doc["fecha"] for doc in documentos]},
+                    "hora_inicio": {"$in": list({doc["hora_inicio"] for doc in documentos})}
+                },
+                {"id_aula": 1, "fecha": 1, "hora_inicio": 1},
+                session=session
+            )
+        }
+        
+        # Verificación que decide: solapamientos contra lo que hay en MongoDB
+        ocupados = leer_intervalos(self.collection, ids_aula, fechas, session=session)
+        
+        for pos, doc in enumerate(documentos):
+            fecha = normalizar_fecha(doc["fecha"])
+            if doc["id_aula"] not in disponibles:
+                rechazos[pos] = "El aula no está disponible para asignación"
+            elif (doc["id_aula"], fecha, doc["hora_inicio"]) in existentes:
+                rechazos[pos] = "Ya existe una asignación para el aula en esa fecha y hora"
+            elif ocupados[(doc["id_aula"], fecha)].hay_solapamiento(
+                hora_a_minutos(doc["hora_inicio"]), hora_a_minutos(doc["hora_fin"])
+            ):
+                rechazos[pos] = "El horario se superpone con otra asignación del aula en esa fecha"
+        
+        documentos = [doc for pos, doc in enumerate(documentos) if pos not in rechazos]
+        if not documentos:
+            return rechazos
+        
+        self.collection.insert_many(documentos, session=session)
+        
+        # Una escritura por aula; una disponible queda con su cronograma más temprano
+        en_orden = sorted(
+            documentos,
+            key=lambda doc: (normalizar_fecha(doc["fecha"]), hora_a_minutos(doc["hora_inicio"]))
+        )
+        asignadas = AulaModel.asignar_lote(
+            self.aulas_collection,
+            [(doc["id_aula"], doc["_id"]) for doc in en_orden],
+            session=session,
+            fencing=fencing
+        )
+        if asignadas < len({doc["id_aula"] for doc in documentos}):
+            raise ValueError("Las aulas del lote cambiaron durante la carga. Intente nuevamente.")
+        
+        OutboxModel.registrar_lote(
+            self.outbox_collection,
+            [
+                MQTTEventPublisher.evento_aula_asignada(
+                    str(doc["id_aula"]),
+                    str(doc["_id"]),
+                    self._datos_evento(doc)
+                )
+                for doc in documentos
+            ],
+            session=session
+        )
+        
+        return rechazos
+    
     def obtener_cronograma(self, id_cronograma: str) -> Optional[Dict[str, Any]]:
         """
         Obtiene un cronograma por ID
@@ -148,69 +435,110 @@ class CronogramaService:
             print(f"Error al obtener cronograma: {e}")
             return None
     
-    def listar_por_aula(self, id_aula: str, fecha_desde: Optional[date] = None) -> List[Dict[str, Any]]:
+    def _preparar_listado(self, cronogramas: List[Dict[str, Any]],
+                          expandir: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        Convierte los ObjectIds de un listado a strings y, si se piden, agrega los
+        datos de aula, materia y/o profesor (una consulta por colección)
+        
+        Args:
+            cronogramas: Documentos de cronograma
+            expandir: Claves de EXPANSIONES a incluir (default: ninguna)
+        
+        Returns:
+            La misma lista, lista para serializar
+        """
+        colecciones = {
+            "aula": self.aulas_lectura,
+            "materia": self.materias_lectura,
+            "profesor": self.usuarios_lectura,
+        }
+        for campo in expandir or []:
+            campo_id, proyeccion = self.EXPANSIONES[campo]
+            BatchLoader(colecciones[campo], proyeccion).enriquecer(cronogramas, campo_id, campo)
+        
+        # Convertir ObjectIds a strings
+        for crono in cronogramas:
+            crono["_id"] = str(crono["_id"])
+            crono["id_aula"] = str(crono["id_aula"])
+            crono["id_materia"] = str(crono["id_materia"])
+            crono["id_profesor"] = str(crono["id_profesor"])
+        
+        return cronogramas
+    
+    def listar_por_aula(self, id_aula: str, fecha_desde: Optional[date] = None,
+                        expandir: Optional[List[str]] = None) -> List[Dict[str, Any]]:
         """
         Lista cronogramas de un aula
         
         Args:
             id_aula: ID del aula
             fecha_desde: Fecha desde la cual buscar (opcional)
+            expandir: Datos relacionados a incluir (ver EXPANSIONES)
         
         Returns:
             Lista de cronogramas
         """
         try:
             obj_id = Validators.convertir_a_objectid(id_aula)
-            cronogramas = CronogramaModel.listar_por_aula(self.collection, obj_id, fecha_desde)
-            
-            # Convertir ObjectIds a strings
-            for crono in cronogramas:
-                crono["_id"] = str(crono["_id"])
-                crono["id_aula"] = str(crono["id_aula"])
-                crono["id_materia"] = str(crono["id_materia"])
-                crono["id_profesor"] = str(crono["id_profesor"])
+            cronogramas = CronogramaModel.listar_por_aula(self.collection_lectura, obj_id, fecha_desde)
             
-            return cronogramas
+            return self._preparar_listado(cronogramas, expandir)
         
         except Exception as e:
             print(f"Error al listar cronogramas por aula: {e}")
             return []
     
-    def listar_por_profesor(self, id_profesor: str, solo_activos: bool = True) -> List[Dict[str, Any]]:
+    def listar_horarios_libres(self, id_aula: str, fecha: date) -> List[Dict[str, str]]:
+        """
+        Lista los horarios libres de un aula en una fecha (06:00 - 23:00)
+        
+        Args:
+            id_aula: ID del aula
+            fecha: Fecha a consultar
+        
+        Returns:
+            Lista de huecos libres ({"hora_inicio", "hora_fin"})
+        
+        Raises:
+            ValueError: Si el ID es inválido
+        """
+        obj_id = Validators.convertir_a_objectid(id_aula)
+        libres = horarios_libres(self.collection, [obj_id], fecha)
+        return libres[obj_id]
+    
+    def listar_por_profesor(self, id_profesor: str, solo_activos: bool = True,
+                            expandir: Optional[List[str]] = None) -> List[Dict[str, Any]]:
         """
         Lista cronogramas de un profesor
         
         Args:
             id_profesor: ID del profesor
             solo_activos: Si True, solo devuelve cronogramas activos
+            expandir: Datos relacionados a incluir (ver EXPANSIONES)
         
         Returns:
             Lista de cronogramas
         """
         try:
             obj_id = Validators.convertir_a_objectid(id_profesor)
-            cronogramas = CronogramaModel.listar_por_profesor(self.collection, obj_id, solo_activos)
-            
-            # Convertir ObjectIds a strings
-            for crono in cronogramas:
-                crono["_id"] = str(crono["_id"])
-                crono["id_aula"] = str(crono["id_aula"])
-                crono["id_materia"] = str(crono["id_materia"])
-                crono["id_profesor"] = str(crono["id_profesor"])
+            cronogramas = CronogramaModel.listar_por_profesor(self.collection_lectura, obj_id, solo_activos)
             
-            return cronogramas
+            return self._preparar_listado(cronogramas, expandir)
         
         except Exception as e:
             print(f"Error al listar cronogramas por profesor: {e}")
             return []
     
-    def listar_por_carrera_materia(self, id_carrera: str, id_materia: str) -> List[Dict[str, Any]]:
+    def listar_por_carrera_materia(self, id_carrera: str, id_materia: str,
+                                   expandir: Optional[List[str]] = None) -> List[Dict[str, Any]]:
         """
         Lista cronogramas por carrera y materia (para alumnos)
         
         Args:
             id_carrera: Nombre de la carrera
             id_materia: ID de la materia
+            expandir: Datos relacionados a incluir (ver EXPANSIONES)
         
         Returns:
             Lista de cronogramas
@@ -218,24 +546,31 @@ class CronogramaService:
         try:
             obj_id_materia = Validators.convertir_a_objectid(id_materia)
             cronogramas = CronogramaModel.listar_por_carrera_materia(
-                self.collection,
+                self.collection_lectura,
                 id_carrera,
                 obj_id_materia
             )
             
-            # Convertir ObjectIds a strings
-            for crono in cronogramas:
-                crono["_id"] = str(crono["_id"])
-                crono["id_aula"] = str(crono["id_aula"])
-                crono["id_materia"] = str(crono["id_materia"])
-                crono["id_profesor"] = str(crono["id_profesor"])
-            
-            return cronogramas
+            return self._preparar_listado(cronogramas, expandir)
         
         except Exception as e:
             print(f"Error al listar cronogramas por carrera/materia: {e}")
             return []
     
+    def _liberar_aula(self, id_aula, id_cronograma, session):
+        """
+        Libera el aula de un cronograma que terminó, dentro de la transacción
+        
+        El aula sigue ocupada (con el próximo como asignación actual) mientras le
+        quede otro cronograma programado o activo; ver AulaModel.liberar_asignacion.
+        """
+        siguiente = CronogramaModel.siguiente_vigente(
+            self.collection, id_aula, excluir=id_cronograma, session=session
+        )
+        AulaModel.liberar_asignacion(
+            self.aulas_collection, id_aula, id_cronograma, siguiente, session=session
+        )
+    
     def finalizar_cronograma(self, id_cronograma: str) -> Dict[str, Any]:
         """
         Finaliza un cronograma y libera el aula
@@ -255,22 +590,21 @@ class CronogramaService:
             if not cronograma:
                 raise ValueError("Cronograma no encontrado")
             
-            # Cambiar estado a finalizada
-            CronogramaModel.cambiar_estado(self.collection, obj_id, "finalizada")
-            
-            # Liberar aula
-            AulaModel.liberar(self.aulas_collection, cronograma["id_aula"])
-            
-            # Publicar evento MQTT (aula liberada)
-            try:
-                MQTTEventPublisher.publicar_aula_liberada(
-                    str(cronograma["id_aula"]),
-                    cronograma["id_carrera"],
-                    str(cronograma["id_materia"]),
-                    str(id_cronograma)
+            # Cambiar estado a finalizada + liberar aula + evento (outbox) en una transacción
+            def _finalizar(session):
+                CronogramaModel.cambiar_estado(self.collection, obj_id, "finalizada", session=session)
+                self._liberar_aula(cronograma["id_aula"], obj_id, session)
+                OutboxModel.registrar(
+                    self.outbox_collection,
+                    MQTTEventPublisher.evento_aula_liberada(
+                        str(cronograma["id_aula"]),
+                        str(obj_id),
+                        "finalizado"
+                    ),
+                    session=session
                 )
-            except Exception as e:
-                print(f"⚠️  Error al publicar evento MQTT: {e}")
+            
+            ejecutar_transaccion(_finalizar)
             
             return {"mensaje": "Cronograma finalizado y aula liberada"}
         
@@ -299,26 +633,33 @@ class CronogramaService:
             if not cronograma:
                 raise ValueError("Cronograma no encontrado")
             
-            # Cambiar estado a cancelada
-            CronogramaModel.cambiar_estado(self.collection, obj_id, "cancelada")
-            
-            # Liberar aula
-            AulaModel.liberar(self.aulas_collection, cronograma["id_aula"])
-            
-            # Notificar a alumnos suscritos
-            try:
-                mensaje = f"La clase ha sido cancelada"
-                if motivo:
-                    mensaje += f". Motivo: {motivo}"
-                
-                MQTTEventPublisher.publicar_notificacion_aula(
-                    cronograma["id_carrera"],
-                    str(cronograma["id_materia"]),
-                    mensaje,
-                    "warning"
+            mensaje = f"La clase ha sido cancelada"
+            if motivo:
+                mensaje += f". Motivo: {motivo}"
+            
+            # Cambiar estado a cancelada + liberar aula + eventos (outbox) en una transacción
+            def _cancelar(session):
+                CronogramaModel.cambiar_estado(self.collection, obj_id, "cancelada", session=session)
+                self._liberar_aula(cronograma["id_aula"], obj_id, session)
+                OutboxModel.registrar_lote(
+                    self.outbox_collection,
+                    [
+                        MQTTEventPublisher.evento_aula_liberada(
+                            str(cronograma["id_aula"]),
+                            str(obj_id),
+                            "cancelado"
+                        ),
+                        MQTTEventPublisher.evento_notificacion_alumnos(
+                            cronograma["id_carrera"],
+                            str(cronograma["id_materia"]),
+                            mensaje,
+                            {"id_cronograma": str(obj_id), "nivel": "warning"}
+                        )
+                    ],
+                    session=session
                 )
-            except Exception as e:
-                print(f"⚠️  Error al publicar notificación MQTT: {e}")
+            
+            ejecutar_transaccion(_cancelar)
             
             return {"mensaje": "Cronograma cancelado y aula liberada"}
         
@@ -0,0 +1,189 @@
+"""
+Publicador de métricas de aulas
+Una sola réplica de Bedelia (líder elegido en Redis) publica la ocupación de
+aulas como mensaje retenido; GET /aulas/metricas solo lee la última foto
+"""
+
+import json
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from config import (
+    METRICAS_MUESTREO_S, METRICAS_DEBOUNCE_S,
+    METRICAS_INTERVALO_S, METRICAS_LIDER_TTL_S
+)
+from db.mongo import get_mongo_db
+from db.redis import redis_client, LockRedis
+from models.aula import AulaModel
+from models.aula_contadores import contadores_aula
+from mqtt_client import get_mqtt_client
+from utils.mqtt_events import MQTTEventPublisher
+
+
+class PublicadorMetricas:
+    """
+    Emisor de métricas de aulas en segundo plano.
+
+    - Líder: lock de Redis con lease renovable (LockRedis) sobre
+      'metricas_aulas:lider'. Las otras réplicas reintentan tomarlo cada
+      METRICAS_LIDER_TTL_S / 3; si el líder muere, el lease vence solo.
+    - El líder lee los contadores (HGETALL) cada METRICAS_MUESTREO_S y publica
+      cuando cambian, con al menos METRICAS_DEBOUNCE_S entre publicaciones
+      (una ráfaga de asignaciones sale como un solo mensaje), y además cada
+      METRICAS_INTERVALO_S aunque no cambien.
+    - Mensaje retenido: quien se suscribe recibe la última foto enseguida.
+    - Cada publicación deja la foto en Redis (KEY_FOTO, vence si no hay líder
+      que la renueve); el endpoint HTTP la lee sin tocar MongoDB ni MQTT.
+    - Un cambio de estado hecho en este proceso despierta el muestreo enseguida.
+    """
+
+    NOMBRE_LIDER = "metricas_aulas:lider"
+    KEY_FOTO = "metricas:aulas"
+
+    def __init__(self, muestreo_s: float = METRICAS_MUESTREO_S, debounce_s: float = METRICAS_DEBOUNCE_S,
+                 intervalo_s: float = METRICAS_INTERVALO_S, lider_ttl_s: int = METRICAS_LIDER_TTL_S):
+        self.muestreo_s = muestreo_s
+        self.debounce_s = debounce_s
+        self.intervalo_s = intervalo_s
+        self.lider_ttl_s = lider_ttl_s
+
+        self._despertar = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+        self._lock: Optional[LockRedis] = None
+        self._ultima: Optional[Dict[str, int]] = None
+        self._emitida_at = 0.0
+        # Mensaje que no se pudo publicar (broker caído): se reintenta en cada muestreo
+        self._sin_publicar: Optional[Tuple[str, Dict[str, Any], int]] = None
+
+        self.publicados = 0
+        self.fallidos = 0
+        self.elecciones = 0
+
+    def iniciar(self):
+        """Arranca el hilo del publicador (idempotente)"""
+        if self._hilo is None or not self._hilo.is_alive():
+            self._hilo = threading.Thread(target=self._ejecutar, name="metricas-aulas", daemon=True)
+            self._hilo.start()
+
+    def notificar_cambio(self, ids_aula: Optional[list] = None, estado_anterior: Optional[str] = None, estado_nuevo: Optional[str] = None):
+        self._despertar.set()
+
+    def es_lider(self) -> bool:
+        return self._lock is not None and self._lock.token is not None and not self._lock.perdido.is_set()
+
+    # -----------------------------
+    # Hilo
+    # -----------------------------
+
+    def _ejecutar(self):
+        while True:
+            try:
+                espera = self._ciclo() if self._liderar() else self.lider_ttl_s / 3
+            except Exception as e:
+                print(f"⚠️  Error en el publicador de métricas: {e}")
+                espera = self.lider_ttl_s / 3
+            self._despertar.wait(espera)
+            self._despertar.clear()
+
+    def _liderar(self) -> bool:
+        if self._lock is not None and self._lock.token is not None:
+            if not self._lock.perdido.is_set():
+                return True
+            print("⚠️  Publicador de métricas: se perdió el liderazgo")
+            self._lock.liberar()
+
+        self._lock = redis_client.lock(self.NOMBRE_LIDER, ttl=self.lider_ttl_s)
+        if not self._lock.adquirir():
+            return False
+        self.elecciones += 1
+        # Al asumir se publica enseguida
+        self._ultima = None
+        self._emitida_at = 0.0
+        print("👑 Publicador de métricas: esta réplica es la líder")
+        return True
+
+    def _ciclo(self) -> float:
+        """Muestrea los contadores y emite si corresponde; devuelve cuánto esperar"""
+        conteos = contadores_aula.obtener(get_mongo_db().aulas)
+        metricas = {
+            "total_aulas": conteos["total"],
+            "disponibles": conteos["disponible"],
+            "ocupadas": conteos["ocupada"],
+            "deshabilitadas": conteos["deshabilitada"]
+        }
+
+        ahora = time.monotonic()
+        desde = ahora - self._emitida_at
+        cambio = metricas != self._ultima
+        if cambio and desde < self.debounce_s:
+            return self.debounce_s - desde
+        if cambio or desde >= self.intervalo_s:
+            self._emitir(metricas, ahora)
+        elif self._sin_publicar is not None:
+            self._publicar()
+        return self.muestreo_s
+
+    def _emitir(self, metricas: Dict[str, int], ahora: float):
+        actualizado_at = datetime.utcnow().isoformat()
+        foto = {**metricas, "actualizado_at": actualizado_at}
+        try:
+            redis_client.client.set(self.KEY_FOTO, json.dumps(foto), ex=int(self.intervalo_s * 3))
+        except Exception as e:
+            print(f"⚠️  No se pudo guardar la foto de métricas: {e}")
+
+        self._ultima = metricas
+        self._emitida_at = ahora
+        topic, payload, _ = MQTTEventPublisher.evento_metricas_aulas(
+            metricas["total_aulas"], metricas["disponibles"],
+            metricas["ocupadas"], metricas["deshabilitadas"]
+        )
+        payload["timestamp"] = actualizado_at
+        # Retenido con QoS 1: el broker tiene que quedarse con este valor
+        self._sin_publicar = (topic, payload, 1)
+        self._publicar()
+
+    def _publicar(self):
+        topic, payload, qos = self._sin_publicar
+        mqtt_client = get_mqtt_client()
+        if not mqtt_client or not mqtt_client.client.is_connected():
+            return
+        try:
+            # Vence con la foto de Redis: sin líder no queda un retenido viejo (MQTT 5)
+            mqtt_client.publish(topic, payload, qos=qos, retain=True, expira_s=int(self.intervalo_s * 3))
+        except Exception as e:
+            self.fallidos += 1
+            print(f"⚠️  Error al publicar métricas MQTT: {e}")
+            return
+        self._sin_publicar = None
+        self.publicados += 1
+
+    # -----------------------------
+    # Lectura (endpoint HTTP)
+    # -----------------------------
+
+    def foto(self) -> Optional[Dict[str, Any]]:
+        """Última foto emitida por el líder (None si no hay o Redis no responde)"""
+        try:
+            valor = redis_client.client.get(self.KEY_FOTO)
+        except Exception as e:
+            print(f"⚠️  Foto de métricas no disponible en Redis: {e}")
+            return None
+        return json.loads(valor) if valor else None
+
+    def estadisticas(self) -> Dict[str, Any]:
+        return {
+            "lider": self.es_lider(),
+            "elecciones": self.elecciones,
+            "publicados": self.publicados,
+            "fallidos": self.fallidos,
+            "pendiente": self._sin_publicar is not None,
+            "ultima": self._ultima,
+        }
+
+
+# Instancia singleton (una por proceso)
+publicador_metricas = PublicadorMetricas()
+
+AulaModel.suscribir_cambios_estado(publicador_metricas.notificar_cambio)
@@ -0,0 +1,236 @@
+"""
+SesionService - Sesiones de refresh guardadas en Redis
+El access token (JWT, 15 min) se renueva con un refresh token sin bcrypt ni Mongo
+"""
+
+import hashlib
+import hmac
+import json
+import secrets
+import uuid
+from datetime import datetime
+from typing import List, Dict, Any, Optional
+
+from config import REDIS_TTL_SESION
+from db.redis import redis_client
+from utils.jwt_helper import JWTHelper
+
+
+class SesionService:
+    """
+    Service para sesiones de refresh
+
+    - Refresh token opaco "<id_sesion>.<secreto>"; en Redis solo se guarda el
+      SHA-256 del secreto (session:<id_sesion>, TTL REDIS_TTL_SESION que se
+      renueva con cada uso).
+    - Rotación: cada refresh entrega un refresh token nuevo. Presentar uno ya
+      usado (robado o duplicado) revoca la sesión completa.
+    - Revocar una sesión también revoca su último access token (lista de
+      revocados de utils/jwt_cache.py), así no sigue vivo hasta su exp.
+    """
+
+    @staticmethod
+    def _hash(secreto: str) -> str:
+        return hashlib.sha256(secreto.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _partir(refresh_token: str):
+        id_sesion, _, secreto = (refresh_token or "").partition(".")
+        if not id_sesion or not secreto:
+            raise ValueError("Refresh token inválido o vencido")
+        return id_sesion, secreto
+
+    @staticmethod
+    def _emitir(sesion: Dict[str, Any], id_sesion: str) -> Dict[str, Any]:
+        """Genera access token + secreto de refresh nuevos para la sesión"""
+        token = JWTHelper.generar_token({
+            "_id": sesion["id_usuario"],
+            "usuario": sesion["usuario"],
+            "rol": sesion["rol"],
+            "nombre": sesion.get("nombre")
+        }, id_sesion=id_sesion)
+        # Valida el token recién emitido: deja los claims en el cache de JWT
+        claims = JWTHelper.validar_token(token) or {}
+        return {
+            "token": token,
+            "jti": claims.get("jti"),
+            "jti_exp": claims.get("exp"),
+            "secreto": secrets.token_urlsafe(32)
+        }
+
+    def crear(self, user_doc: Dict[str, Any], user_agent: str = "", ip: str = "") -> Dict[str, Any]:
+        """
+        Abre una sesión después de un login correcto
+
+        Args:
+            user_doc: Documento del usuario autenticado
+            user_agent: User-Agent del cliente (para el listado de sesiones)
+            ip: IP del cliente
+
+        Returns:
+            Diccionario con token, refresh_token e id_sesion
+        """
+        try:
+            id_sesion = uuid.uuid4().hex
+            ahora = datetime.utcnow().isoformat()
+            sesion = {
+                "id_usuario": str(user_doc["_id"]),
+                "usuario": user_doc["usuario"],
+                "rol": user_doc["rol"],
+                "nombre": user_doc.get("nombre"),
+                "user_agent": (user_agent or "")[:200],
+                "ip": ip or "",
+                "creada_at": ahora,
+                "ultimo_uso": ahora
+            }
+            emitido = self._emitir(sesion, id_sesion)
+            sesion.update({
+                "refresh_hash": self._hash(emitido["secreto"]),
+                "jti": emitido["jti"],
+                "jti_exp": emitido["jti_exp"]
+            })
+            redis_client.set_sesion(id_sesion, json.dumps(sesion), id_usuario=sesion["id_usuario"])
+
+            return {
+                "token": emitido["token"],
+                "refresh_token": f"{id_sesion}.{emitido['secreto']}",
+                "id_sesion": id_sesion,
+                "refresh_expira_en": f"{REDIS_TTL_SESION // 3600} horas"
+            }
+
+        except ValueError as e:
+            raise ValueError(str(e))
+        except Exception as e:
+            raise Exception(f"Error al crear sesión: {e}")
+
+    def refrescar(self, refresh_token: str) -> Dict[str, Any]:
+        """
+        Emite un access token nuevo y rota el refresh token
+
+        Args:
+            refresh_token: Refresh token recibido en el login o en el último refresh
+
+        Returns:
+            Diccionario con token y refresh_token nuevos
+
+        Raises:
+            ValueError: Si el refresh token no es válido, venció o ya fue usado
+        """
+        try:
+            id_sesion, secreto = self._partir(refresh_token)
+            valor = redis_client.get_sesion(id_sesion)
+            if not valor:
+                raise ValueError("Refresh token inválido o vencido")
+
+            sesion = json.loads(valor)
+            hash_anterior = self._hash(secreto)
+            if not hmac.compare_digest(hash_anterior, sesion.get("refresh_hash", "")):
+                # Reuso de un refresh ya rotado: se corta la sesión
+                self._cerrar(id_sesion, sesion)
+                raise ValueError("Refresh token ya utilizado: la sesión fue revocada")
+
+            emitido = self._emitir(sesion, id_sesion)
+            resultado = redis_client.rotar_sesion(
+                id_sesion,
+                sesion["id_usuario"],
+                hash_anterior,
+                self._hash(emitido["secreto"]),
+                emitido["jti"],
+                emitido["jti_exp"],
+                datetime.utcnow().isoformat()
+            )
+            if resultado != 1:
+                # Otro refresh concurrente ganó la rotación
+                JWTHelper.revocar_claims({"jti": emitido["jti"], "exp": emitido["jti_exp"]})
+                raise ValueError("Refresh token inválido o vencido")
+
+            return {
+                "token": emitido["token"],
+                "refresh_token": f"{id_sesion}.{emitido['secreto']}",
+                "expira_en": f"{JWTHelper.EXPIRATION_MINUTES} minutos"
+            }
+
+        except ValueError as e:
+            raise ValueError(str(e))
+        except Exception as e:
+            raise Exception(f"Error al refrescar sesión: {e}")
+
+    def _cerrar(self, id_sesion: str, sesion: Dict[str, Any]):
+        redis_client.borrar_sesion(id_sesion, sesion.get("id_usuario"))
+        JWTHelper.revocar_claims({"jti": sesion.get("jti"), "exp": sesion.get("jti_exp")})
+
+    def revocar(self, id_sesion: str, id_usuario: str) -> bool:
+        """
+        Cierra una sesión del usuario
+
+        Args:
+            id_sesion: ID de la sesión
+            id_usuario: Dueño (no se pueden cerrar sesiones de otro usuario)
+
+        Returns:
+            True si la sesión existía
+        """
+        try:
+            valor = redis_client.get_sesion(id_sesion)
+            if not valor:
+                return False
+            sesion = json.loads(valor)
+            if sesion.get("id_usuario") != str(id_usuario):
+                return False
+            self._cerrar(id_sesion, sesion)
+            return True
+
+        except ValueError as e:
+            raise ValueError(str(e))
+        except Exception as e:
+            raise Exception(f"Error al revocar sesión: {e}")
+
+    def revocar_todas(self, id_usuario: str, excepto: Optional[str] = None) -> int:
+        """
+        Cierra todas las sesiones del usuario (desactivación, cambio de contraseña)
+
+        Returns:
+            Cantidad de sesiones cerradas
+        """
+        try:
+            cerradas = 0
+            for id_sesion, valor in redis_client.sesiones_usuario(str(id_usuario)).items():
+                if id_sesion == excepto:
+                    continue
+                self._cerrar(id_sesion, json.loads(valor))
+                cerradas += 1
+            return cerradas
+
+        except ValueError as e:
+            raise ValueError(str(e))
+        except Exception as e:
+            raise Exception(f"Error al revocar sesiones: {e}")
+
+    def listar(self, id_usuario: str, actual: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Lista las sesiones vigentes del usuario (sin datos secretos)
+
+        Args:
+            id_usuario: ID del usuario
+            actual: id_sesion del token con que se consulta (se marca)
+        """
+        try:
+            sesiones = []
+            for id_sesion, valor in redis_client.sesiones_usuario(str(id_usuario)).items():
+                sesion = json.loads(valor)
+                sesiones.append({
+                    "id_sesion": id_sesion,
+                    "creada_at": sesion.get("creada_at"),
+                    "ultimo_uso": sesion.get("ultimo_uso"),
+                    "user_agent": sesion.get("user_agent"),
+                    "ip": sesion.get("ip"),
+                    "actual": id_sesion == actual
+                })
+            sesiones.sort(key=lambda s: s["ultimo_uso"] or "", reverse=True)
+            return sesiones
+
+        except ValueError as e:
+            raise ValueError(str(e))
+        except Exception as e:
+            raise Exception(f"Error al listar sesiones: {e}")
+
@@ -6,10 +6,12 @@ Incluye: CRUD, autenticación, generación JWT
 from typing import List, Dict, Any, Optional
 from bson import ObjectId
 
-from db.mongo import get_mongo_db
+from db.mongo import get_mongo_db, lectura_secundaria
 from models.usuario import UsuarioModel
 from utils.validators import Validators
 from utils.jwt_helper import JWTHelper
+from utils.hash_pool import pool_hash, AuthSaturado
+from services.sesion_service import SesionService
 
 
 class UsuarioService:
@@ -17,9 +19,16 @@ class UsuarioService:
     Service para gestión de usuarios y autenticación
     """
     
+    # Campos que cambian lo que puede hacer una sesión abierta: al tocarlos se cierran todas
+    # (el refresh reemite el rol guardado en la sesión, sin volver a MongoDB)
+    CAMPOS_CIERRAN_SESIONES = ("rol", "activo", "password")
+    
     def __init__(self):
         self.db = get_mongo_db()
         self.collection = self.db.usuarios
+        # Listados: secundarios del replica set (staleness acotado)
+        self.collection_lectura = lectura_secundaria(self.collection)
+        self.sesiones = SesionService()
     
     def crear_usuario(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -56,19 +65,22 @@ class UsuarioService:
         except Exception as e:
             raise Exception(f"Error al crear usuario: {e}")
     
-    def autenticar(self, usuario: str, password: str) -> Dict[str, Any]:
+    def autenticar(self, usuario: str, password: str, user_agent: str = "", ip: str = "") -> Dict[str, Any]:
         """
-        Autentica un usuario y genera JWT
+        Autentica un usuario, genera JWT y abre una sesión de refresh
         
         Args:
             usuario: Nombre de usuario
             password: Contraseña en texto plano
+            user_agent: User-Agent del cliente (listado de sesiones)
+            ip: IP del cliente
         
         Returns:
-            Diccionario con token JWT y datos del usuario
+            Diccionario con token JWT, refresh token y datos del usuario
         
         Raises:
             ValueError: Si las credenciales son incorrectas
+            AuthSaturado: Si hay demasiados logins en curso
         """
         try:
             # Autenticar
@@ -77,11 +89,15 @@ class UsuarioService:
             if not user_doc:
                 raise ValueError("Credenciales incorrectas")
             
-            # Generar JWT
-            token = JWTHelper.generar_token(user_doc)
+            # Generar JWT + refresh (si Redis no responde: solo JWT, sin refresh)
+            try:
+                sesion = self.sesiones.crear(user_doc, user_agent, ip)
+            except Exception as e:
+                print(f"⚠️  Login sin sesión de refresh: {e}")
+                sesion = {"token": JWTHelper.generar_token(user_doc)}
             
             return {
-                "token": token,
+                **sesion,
                 "usuario": {
                     "id": str(user_doc["_id"]),
                     "usuario": user_doc["usuario"],
@@ -92,11 +108,18 @@ class UsuarioService:
                 "expira_en": f"{JWTHelper.EXPIRATION_MINUTES} minutos"
             }
         
-        except ValueError as e:
-            raise ValueError(str(e))
+        except (ValueError, AuthSaturado):
+            raise
         except Exception as e:
             raise Exception(f"Error al autenticar: {e}")
     
+    def _cerrar_sesiones(self, id_usuario: str, excepto: Optional[str] = None):
+        """El cambio en MongoDB ya se hizo: si Redis no responde solo se avisa"""
+        try:
+            self.sesiones.revocar_todas(id_usuario, excepto=excepto)
+        except Exception as e:
+            print(f"⚠️  No se pudieron cerrar las sesiones de {id_usuario}: {e}")
+    
     def obtener_usuario(self, id_usuario: str) -> Optional[Dict[str, Any]]:
         """
         Obtiene un usuario por ID (sin password_hash)
@@ -132,7 +155,7 @@ class UsuarioService:
             Lista de usuarios
         """
         try:
-            usuarios = UsuarioModel.listar_por_rol(self.collection, rol, solo_activos)
+            usuarios = UsuarioModel.listar_por_rol(self.collection_lectura, rol, solo_activos)
             
             # Convertir ObjectIds a strings
             for usuario in usuarios:
@@ -146,7 +169,8 @@ class UsuarioService:
     
     def actualizar_usuario(self, id_usuario: str, data: Dict[str, Any]) -> Dict[str, Any]:
         """
-        Actualiza un usuario existente
+        Actualiza un usuario existente. Si cambia rol, activo o password,
+        cierra sus sesiones de refresh (y revoca sus últimos access tokens)
         
         Args:
             id_usuario: ID del usuario
@@ -172,6 +196,9 @@ class UsuarioService:
             # Actualizar en MongoDB
             UsuarioModel.actualizar(self.collection, obj_id, data)
             
+            if any(campo in data for campo in self.CAMPOS_CIERRAN_SESIONES):
+                self._cerrar_sesiones(id_usuario)
+            
             return {"mensaje": "Usuario actualizado correctamente"}
         
         except ValueError as e:
@@ -195,19 +222,24 @@ class UsuarioService:
             # Desactivar en MongoDB
             UsuarioModel.desactivar(self.collection, obj_id)
             
+            # Sin sesiones abiertas (deja de poder refrescar)
+            self._cerrar_sesiones(id_usuario)
+            
             return {"mensaje": "Usuario desactivado correctamente"}
         
         except Exception as e:
             raise Exception(f"Error al desactivar usuario: {e}")
     
-    def cambiar_password(self, id_usuario: str, password_actual: str, password_nueva: str) -> Dict[str, Any]:
+    def cambiar_password(self, id_usuario: str, password_actual: str, password_nueva: str,
+                         id_sesion_actual: Optional[str] = None) -> Dict[str, Any]:
         """
-        Cambia la contraseña de un usuario
+        Cambia la contraseña de un usuario y cierra sus otras sesiones
         
         Args:
             id_usuario: ID del usuario
             password_actual: Contraseña actual
             password_nueva: Contraseña nueva
+            id_sesion_actual: Sesión desde la que se hace el cambio (no se cierra)
         
         Returns:
             Diccionario con mensaje de éxito
@@ -224,9 +256,8 @@ class UsuarioService:
             if not usuario:
                 raise ValueError("Usuario no encontrado")
             
-            # Verificar contraseña actual
-            import bcrypt
-            if not bcrypt.checkpw(password_actual.encode('utf-8'), usuario["password_hash"].encode('utf-8')):
+            # Verificar contraseña actual (en el pool de procesos)
+            if not pool_hash.verificar(usuario["usuario"], password_actual, usuario.get("password_hash") or ""):
                 raise ValueError("Contraseña actual incorrecta")
             
             # Validar nueva contraseña
@@ -235,10 +266,11 @@ class UsuarioService:
             
             # Actualizar contraseña
             UsuarioModel.actualizar(self.collection, obj_id, {"password": password_nueva})
+            self._cerrar_sesiones(id_usuario, excepto=id_sesion_actual)
             
             return {"mensaje": "Contraseña actualizada correctamente"}
         
-        except ValueError as e:
-            raise ValueError(str(e))
+        except (ValueError, AuthSaturado):
+            raise
         except Exception as e:
             raise Exception(f"Error al cambiar contraseña: {e}")
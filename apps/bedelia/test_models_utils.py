@@ -23,7 +23,7 @@ print("=" * 60)
 db = get_mongo_db()
 
 # ========== PRUEBA 1: CREAR ÍNDICES ==========
-print("\n[1/10] Creando índices en MongoDB...")
+print("\n[1/11] Creando índices en MongoDB...")
 try:
     AulaModel.crear_indices(db.aulas)
     UsuarioModel.crear_indices(db.usuarios)
@@ -36,7 +36,7 @@ except Exception as e:
     print(f"❌ Error al crear índices: {e}")
 
 # ========== PRUEBA 2: CREAR AULA ==========
-print("\n[2/10] Creando aula de prueba...")
+print("\n[2/11] Creando aula de prueba...")
 try:
     id_aula = AulaModel.crear(db.aulas, {
         "nro_aula": 101,
@@ -50,7 +50,7 @@ except Exception as e:
     print(f"❌ Error: {e}")
 
 # ========== PRUEBA 3: CREAR USUARIO ADMINISTRADOR ==========
-print("\n[3/10] Creando usuario administrador...")
+print("\n[3/11] Creando usuario administrador...")
 try:
     id_admin = UsuarioModel.crear(db.usuarios, {
         "usuario": "admin_test",
@@ -64,7 +64,7 @@ except Exception as e:
     print(f"❌ Error: {e}")
 
 # ========== PRUEBA 4: CREAR USUARIO PROFESOR ==========
-print("\n[4/10] Creando usuario profesor...")
+print("\n[4/11] Creando usuario profesor...")
 try:
     id_profesor = UsuarioModel.crear(db.usuarios, {
         "usuario": "prof_test",
@@ -78,7 +78,7 @@ except Exception as e:
     print(f"❌ Error: {e}")
 
 # ========== PRUEBA 5: CREAR CARRERA Y MATERIA ==========
-print("\n[5/10] Creando carrera y materia...")
+print("\n[5/11] Creando carrera y materia...")
 try:
     id_materia = CarreraMateriaModel.crear(db.carrera_materias, {
         "carrera": "Ingeniería en Sistemas",
@@ -93,7 +93,7 @@ except Exception as e:
     print(f"❌ Error: {e}")
 
 # ========== PRUEBA 6: ASIGNAR PROFESOR A MATERIA ==========
-print("\n[6/10] Asignando profesor a materia...")
+print("\n[6/11] Asignando profesor a materia...")
 try:
     id_asig = AsignacionModel.asignar_profesor_materia(db.profesor_carrera_materia, {
         "id_profesor": id_profesor,
@@ -105,7 +105,7 @@ except Exception as e:
     print(f"❌ Error: {e}")
 
 # ========== PRUEBA 7: CREAR CRONOGRAMA ==========
-print("\n[7/10] Creando cronograma (asignación de aula)...")
+print("\n[7/11] Creando cronograma (asignación de aula)...")
 try:
     id_cronograma = CronogramaModel.crear(db.cronograma, {
         "id_aula": id_aula,
@@ -121,8 +121,48 @@ try:
 except Exception as e:
     print(f"❌ Error: {e}")
 
-# ========== PRUEBA 8: VALIDATORS ==========
-print("\n[8/10] Probando Validators...")
+# ========== PRUEBA 8: CARGA MASIVA CON VARIAS FILAS POR AULA ==========
+print("\n[8/11] Carga masiva: dos horarios sin superposición en la misma aula...")
+try:
+    from services.cronograma_service import CronogramaService
+    
+    id_aula_lote = AulaModel.crear(db.aulas, {
+        "nro_aula": 102,
+        "piso": 1,
+        "cupo": 30,
+        "estado": "disponible",
+        "descripcion": "Aula de prueba de carga masiva"
+    })
+    fila = {
+        "id_aula": str(id_aula_lote),
+        "id_materia": str(id_materia),
+        "id_profesor": str(id_profesor),
+        "id_carrera": "Ingeniería en Sistemas",
+        "fecha": date.today().isoformat(),
+        "tipo": "teorica"
+    }
+    resultado = CronogramaService().crear_cronogramas_bulk([
+        {**fila, "hora_inicio": "08:00", "hora_fin": "10:00"},
+        {**fila, "hora_inicio": "10:00", "hora_fin": "12:00"},
+        {**fila, "hora_inicio": "11:00", "hora_fin": "13:00"}   # se superpone con la segunda
+    ])
+    if resultado["creados"] == 2 and [e["indice"] for e in resultado["errores"]] == [2]:
+        print("✅ Se crearon las dos filas sin superposición y se rechazó la superpuesta")
+    else:
+        print(f"❌ Resultado inesperado: {resultado}")
+    
+    # Cancelar uno de los dos no libera el aula: pasa al otro cronograma vigente
+    CronogramaService().cancelar_cronograma(resultado["ids"][0]["id"])
+    aula_lote = AulaModel.obtener_por_id(db.aulas, id_aula_lote)
+    if aula_lote["estado"] == "ocupada" and str(aula_lote["id_asignacion_actual"]) == resultado["ids"][1]["id"]:
+        print("✅ Al cancelar uno, el aula sigue ocupada por el otro cronograma")
+    else:
+        print(f"❌ Estado inesperado del aula: {aula_lote}")
+except Exception as e:
+    print(f"❌ Error: {e}")
+
+# ========== PRUEBA 9: VALIDATORS ==========
+print("\n[9/11] Probando Validators...")
 try:
     # Validar ObjectId
     assert Validators.es_objectid_valido(id_aula) == True
@@ -145,8 +185,8 @@ try:
 except AssertionError as e:
     print(f"❌ Error en validators: {e}")
 
-# ========== PRUEBA 9: JWT HELPER ==========
-print("\n[9/10] Probando JWT Helper...")
+# ========== PRUEBA 10: JWT HELPER ==========
+print("\n[10/11] Probando JWT Helper...")
 try:
     # Obtener usuario
     usuario = UsuarioModel.obtener_por_id(db.usuarios, id_admin)
@@ -170,8 +210,8 @@ try:
 except Exception as e:
     print(f"❌ Error en JWT: {e}")
 
-# ========== PRUEBA 10: MQTT EVENT PUBLISHER ==========
-print("\n[10/10] Probando MQTT Event Publisher...")
+# ========== PRUEBA 11: MQTT EVENT PUBLISHER ==========
+print("\n[11/11] Probando MQTT Event Publisher...")
 try:
     # Publicar evento de aula nueva
     resultado = MQTTEventPublisher.publicar_aula_nueva(str(id_aula), {
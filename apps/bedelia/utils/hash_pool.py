@@ -0,0 +1,256 @@
+"""
+Pool de verificación de contraseñas
+bcrypt corre en procesos aparte para no tomar el worker web (~250 ms de CPU a costo 12).
+El mismo módulo lo usan App_Bedelia (utils/hash_pool.py) y App_Alumno (hash_pool.py)
+"""
+
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FuturesTimeout
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Deque, Dict, Optional
+
+import bcrypt
+
+from config import (
+    AUTH_PROCESOS, AUTH_COLA_MAX, AUTH_COLA_POR_USUARIO,
+    AUTH_ESPERA_MAX_S, BCRYPT_COSTO
+)
+
+
+PREFIJOS_BCRYPT = ("$2a$", "$2b$", "$2y$")
+
+
+class AuthSaturado(Exception):
+    """Hay demasiadas verificaciones en curso: el login se rechaza sin hacer bcrypt"""
+
+
+# Corren en los procesos del pool (funciones de módulo para poder serializarlas)
+def _verificar(password: bytes, hash_guardado: bytes) -> bool:
+    try:
+        return bcrypt.checkpw(password, hash_guardado)
+    except ValueError:
+        # hash corrupto / salt inválida
+        return False
+
+
+def _generar(password: bytes, costo: int) -> str:
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds=costo)).decode("utf-8")
+
+
+class PoolHash:
+    """
+    Verificaciones bcrypt en un ProcessPoolExecutor con concurrencia acotada.
+
+    - En vuelo: como mucho 'procesos' verificaciones; el resto espera en cola.
+    - Equidad: una cola por usuario atendida en ronda, así una ráfaga de
+      intentos sobre una cuenta no demora los logins del resto.
+    - Cola llena (o demasiados intentos del mismo usuario): AuthSaturado
+      enseguida, sin gastar CPU.
+    - Rehash en segundo plano al costo BCRYPT_COSTO después de un login
+      correcto, solo si el pool está ocioso.
+    - Procesos con 'spawn': no se hereda el estado del worker (hilos MQTT, hub).
+      Cada proceso vuelve a ejecutar el script de arranque como __mp_main__: app.py
+      deja todo lo que conecta o arranca hilos dentro de crear_app().
+    """
+
+    def __init__(self, procesos: int = AUTH_PROCESOS, cola_max: int = AUTH_COLA_MAX,
+                 cola_por_usuario: int = AUTH_COLA_POR_USUARIO, espera_max_s: float = AUTH_ESPERA_MAX_S,
+                 costo: int = BCRYPT_COSTO):
+        self.procesos = max(1, procesos)
+        self.cola_max = cola_max
+        self.cola_por_usuario = cola_por_usuario
+        self.espera_max_s = espera_max_s
+        self.costo = costo
+
+        # RLock: un add_done_callback sobre un futuro ya terminado corre en el mismo hilo
+        self._lock = threading.RLock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._colas: Dict[str, Deque] = {}
+        self._ronda: Deque[str] = deque()
+        self._encolados = 0
+        self._en_vuelo = 0
+
+        self.verificados = 0
+        self.rechazados = 0
+        self.rehasheados = 0
+
+    # -----------------------------
+    # Executor
+    # -----------------------------
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # Llamar con self._lock tomado; se crea en el primer uso (después del fork del servidor)
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.procesos,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    def _enviar(self, funcion, *args) -> Future:
+        # Llamar con self._lock tomado
+        try:
+            return self._get_executor().submit(funcion, *args)
+        except BrokenProcessPool:
+            # Un proceso murió: se recrea el pool
+            self._executor = None
+            return self._get_executor().submit(funcion, *args)
+
+    # -----------------------------
+    # Verificación
+    # -----------------------------
+
+    @staticmethod
+    def es_bcrypt(hash_guardado: str) -> bool:
+        return bool(hash_guardado) and hash_guardado.startswith(PREFIJOS_BCRYPT)
+
+    def verificar(self, usuario: str, password: str, hash_guardado: str) -> bool:
+        """
+        Verifica una contraseña contra su hash bcrypt sin usar CPU del worker web
+
+        Args:
+            usuario: Clave de equidad (nombre de usuario)
+            password: Contraseña en texto plano
+            hash_guardado: Hash bcrypt guardado
+
+        Returns:
+            bool: True si la contraseña es correcta
+
+        Raises:
+            AuthSaturado: Si la cola está llena o la verificación no empezó a tiempo
+        """
+        if not password or not self.es_bcrypt(hash_guardado):
+            return False
+
+        ticket: Future = Future()
+        with self._lock:
+            cola = self._colas.get(usuario)
+            if self._encolados >= self.cola_max or (cola is not None and len(cola) >= self.cola_por_usuario):
+                self.rechazados += 1
+                raise AuthSaturado("Demasiados intentos de login en curso, reintentá en unos segundos")
+            if cola is None:
+                cola = self._colas[usuario] = deque()
+                self._ronda.append(usuario)
+            cola.append((password.encode("utf-8"), hash_guardado.encode("utf-8"), ticket))
+            self._encolados += 1
+            self._despachar()
+
+        try:
+            return ticket.result(timeout=self.espera_max_s)
+        except FuturesTimeout:
+            # Si todavía no se despachó, no se despacha (no se gasta CPU en balde)
+            ticket.cancel()
+            with self._lock:
+                self.rechazados += 1
+            raise AuthSaturado("El login tardó demasiado, reintentá en unos segundos")
+
+    def _despachar(self):
+        # Llamar con self._lock tomado: pasa trabajos de las colas al pool, en ronda
+        while self._en_vuelo < self.procesos and self._ronda:
+            usuario = self._ronda.popleft()
+            cola = self._colas[usuario]
+            password, hash_guardado, ticket = cola.popleft()
+            self._encolados -= 1
+            if cola:
+                self._ronda.append(usuario)
+            else:
+                del self._colas[usuario]
+
+            if not ticket.set_running_or_notify_cancel():
+                continue
+            self._en_vuelo += 1
+            try:
+                futuro = self._enviar(_verificar, password, hash_guardado)
+            except Exception as e:
+                self._en_vuelo -= 1
+                ticket.set_exception(e)
+                continue
+            futuro.add_done_callback(lambda f, t=ticket: self._terminado(f, t))
+
+    def _terminado(self, futuro: Future, ticket: Future):
+        with self._lock:
+            self._en_vuelo -= 1
+            self.verificados += 1
+            self._despachar()
+        try:
+            ticket.set_result(futuro.result())
+        except Exception as e:
+            ticket.set_exception(e)
+
+    # -----------------------------
+    # Rehash
+    # -----------------------------
+
+    def necesita_rehash(self, hash_guardado: str) -> bool:
+        """True si el hash no es bcrypt (texto plano) o tiene otro costo"""
+        if not self.es_bcrypt(hash_guardado):
+            return True
+        try:
+            return int(hash_guardado[4:6]) != self.costo
+        except ValueError:
+            return True
+
+    def rehash_en_segundo_plano(self, password: str, hash_guardado: str, guardar: Callable[[str], None]) -> bool:
+        """
+        Recalcula el hash al costo configurado (después de un login correcto)
+
+        Args:
+            password: Contraseña ya verificada
+            hash_guardado: Hash actual
+            guardar: Recibe el hash nuevo y lo persiste (compare-and-set contra el actual)
+
+        Returns:
+            bool: True si se programó el rehash
+        """
+        if not self.necesita_rehash(hash_guardado):
+            return False
+
+        with self._lock:
+            # Con logins esperando se deja para un login posterior
+            if self._encolados or self._en_vuelo >= self.procesos:
+                return False
+            self._en_vuelo += 1
+            try:
+                futuro = self._enviar(_generar, password.encode("utf-8"), self.costo)
+            except Exception as e:
+                self._en_vuelo -= 1
+                print(f"⚠️  No se pudo programar el rehash: {e}")
+                return False
+
+        def _fin(f: Future):
+            with self._lock:
+                self._en_vuelo -= 1
+                self._despachar()
+            try:
+                guardar(f.result())
+                self.rehasheados += 1
+            except Exception as e:
+                print(f"⚠️  Error al rehashear contraseña: {e}")
+
+        futuro.add_done_callback(_fin)
+        return True
+
+    def generar(self, password: str) -> str:
+        """Hash bcrypt al costo configurado, calculado en el pool"""
+        with self._lock:
+            futuro = self._enviar(_generar, password.encode("utf-8"), self.costo)
+        return futuro.result()
+
+    def estadisticas(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "procesos": self.procesos,
+                "en_vuelo": self._en_vuelo,
+                "encolados": self._encolados,
+                "usuarios_en_cola": len(self._colas),
+                "verificados": self.verificados,
+                "rechazados": self.rechazados,
+                "rehasheados": self.rehasheados,
+                "costo": self.costo,
+            }
+
+
+# Instancia singleton (una por proceso)
+pool_hash = PoolHash()
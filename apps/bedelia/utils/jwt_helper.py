@@ -2,12 +2,28 @@
 JWT Helper - Generación y validación de tokens JWT
 Algoritmo: HS256
 Expiración: 15 minutos 
+Los tokens ya verificados se cachean hasta su expiración (ver utils/jwt_cache.py)
 """
 
+import uuid
 import jwt
 from datetime import datetime, timedelta
 from typing import Dict, Any, Optional
-from config import SECRET_KEY
+from config import SECRET_KEY, JWT_CACHE_MAX, JWT_REVOCADOS_REFRESCO_S
+from utils.jwt_cache import CacheJWT
+
+
+def _redis():
+    """Importación lazy: el cliente Redis se crea recién al primer uso"""
+    from db.redis import redis_client
+    return redis_client.client
+
+
+_cache = CacheJWT(
+    max_items=JWT_CACHE_MAX,
+    redis_fn=_redis,
+    refresco_s=JWT_REVOCADOS_REFRESCO_S
+)
 
 
 class JWTHelper:
@@ -19,13 +35,14 @@ class JWTHelper:
     EXPIRATION_MINUTES = 15  # Según prompt MAESTRO
     
     @staticmethod
-    def generar_token(usuario_data: Dict[str, Any]) -> str:
+    def generar_token(usuario_data: Dict[str, Any], id_sesion: Optional[str] = None) -> str:
         """
         Genera un token JWT
         
         Args:
             usuario_data: Diccionario con datos del usuario
                 Debe contener: usuario, rol, _id
+            id_sesion: Sesión de refresh a la que pertenece el token (claim 'sid')
         
         Returns:
             Token JWT como string
@@ -43,9 +60,12 @@ class JWTHelper:
             "rol": usuario_data.get("rol"),
             "id_usuario": str(usuario_data.get("_id")),
             "nombre": usuario_data.get("nombre"),
+            "jti": uuid.uuid4().hex,  # Identifica el token para revocarlo
             "iat": datetime.utcnow(),  # Issued at
             "exp": datetime.utcnow() + timedelta(minutes=JWTHelper.EXPIRATION_MINUTES)
         }
+        if id_sesion:
+            payload["sid"] = id_sesion
         
         # Generar token
         token = jwt.encode(payload, SECRET_KEY, algorithm=JWTHelper.ALGORITHM)
@@ -69,12 +89,7 @@ class JWTHelper:
                 print(f"Usuario: {payload['usuario']}, Rol: {payload['rol']}")
         """
         try:
-            payload = jwt.decode(
-                token,
-                SECRET_KEY,
-                algorithms=[JWTHelper.ALGORITHM]
-            )
-            return payload
+            return _cache.validar(token, JWTHelper._decodificar)
         except jwt.ExpiredSignatureError:
             # Token expirado
             return None
@@ -82,6 +97,51 @@ class JWTHelper:
             # Token inválido
             return None
     
+    @staticmethod
+    def _decodificar(token: str) -> Dict[str, Any]:
+        return jwt.decode(
+            token,
+            SECRET_KEY,
+            algorithms=[JWTHelper.ALGORITHM]
+        )
+
+    @staticmethod
+    def revocar_token(token: str) -> bool:
+        """
+        Revoca un token válido hasta su expiración (logout)
+        
+        Args:
+            token: Token JWT como string
+        
+        Returns:
+            True si se revocó, False si el token no es válido
+        """
+        payload = JWTHelper.validar_token(token)
+        if not payload:
+            return False
+        _cache.revocar(token, payload)
+        return True
+
+    @staticmethod
+    def revocar_claims(claims: Dict[str, Any]) -> bool:
+        """
+        Revoca un token conociendo solo su jti y exp (ej. al cerrar una sesión)
+        
+        Args:
+            claims: Diccionario con 'jti' y 'exp'
+        
+        Returns:
+            True si se registró en Redis
+        """
+        if not claims.get("jti"):
+            return False
+        return _cache.revocar("", claims)
+
+    @staticmethod
+    def estadisticas_cache() -> Dict[str, Any]:
+        """Métricas del cache de tokens verificados"""
+        return _cache.estadisticas()
+
     @staticmethod
     def extraer_token_header(authorization_header: Optional[str]) -> Optional[str]:
         """
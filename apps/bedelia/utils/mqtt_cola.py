@@ -0,0 +1,277 @@
+"""
+Cola de publicación MQTT
+Los requests solo encolan; un hilo dedicado serializa y publica en segundo plano
+"""
+
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+
+from config import (
+    MQTT_COLA_MAX, MQTT_LOTE_MAX, MQTT_TOPICS_COALESCIBLES,
+    MQTT_DESBORDE_DIR, MQTT_DESBORDE_SEGMENTO_MB, MQTT_DESBORDE_MAX_MB, MQTT_DRENAJE_MSG_S
+)
+from utils.mqtt_desborde import DesbordeDisco
+
+
+# (topic, payload, qos, encolado_at). payload None = el último valor del topic coalescible
+Mensaje = Tuple[str, Optional[Dict[str, Any]], int, float]
+
+
+class _Limitador:
+    """Token bucket: como mucho 'tasa' mensajes por segundo, con ráfagas de hasta 'rafaga'"""
+
+    def __init__(self, tasa: float, rafaga: int):
+        self.tasa = tasa
+        self.rafaga = max(1, rafaga)
+        self._fichas = float(self.rafaga)
+        self._ultimo = time.monotonic()
+
+    def esperar(self):
+        if self.tasa <= 0:
+            return
+        ahora = time.monotonic()
+        self._fichas = min(self.rafaga, self._fichas + (ahora - self._ultimo) * self.tasa)
+        self._ultimo = ahora
+        if self._fichas < 1:
+            time.sleep((1 - self._fichas) / self.tasa)
+            self._fichas = 1.0
+            self._ultimo = time.monotonic()
+        self._fichas -= 1
+
+
+class ColaMQTT:
+    """
+    Cola acotada en memoria drenada por un único hilo publicador.
+
+    - Orden: FIFO con un solo consumidor, así que cada topic se publica en orden.
+    - Coalescencia: de los topics en MQTT_TOPICS_COALESCIBLES (ej. métricas)
+      solo se publica el valor más reciente que haya en la cola.
+    - Contrapresión: si la cola está llena el evento se escribe en el desborde
+      a disco (utils/mqtt_desborde.py); mientras haya eventos en disco los nuevos
+      van detrás de ellos, así se mantiene el orden. Solo con el desborde lleno
+      (o deshabilitado) el evento se descarta (y se cuenta).
+    - Drenaje: a lo sumo MQTT_DRENAJE_MSG_S mensajes por segundo, así al volver
+      el broker la cola acumulada no le llega de golpe.
+    - Los eventos leídos de disco se confirman recién después de publicarlos.
+    - Vencimiento (MQTT 5): lo que pasó más de su MQTT_EXPIRACION_S en la cola
+      no se publica, y el resto sale con el vencimiento descontado.
+    """
+
+    ESPERA_REINTENTO_MAX = 10  # segundos
+
+    def __init__(self, max_items: int = MQTT_COLA_MAX, lote_max: int = MQTT_LOTE_MAX,
+                 coalescibles: Optional[List[str]] = None,
+                 desborde: Optional[DesbordeDisco] = None, drenaje_msg_s: float = MQTT_DRENAJE_MSG_S):
+        self.max_items = max_items
+        self.lote_max = lote_max
+        self.coalescibles = set(MQTT_TOPICS_COALESCIBLES if coalescibles is None else coalescibles)
+        self._desborde = desborde or DesbordeDisco(
+            MQTT_DESBORDE_DIR,
+            MQTT_DESBORDE_SEGMENTO_MB * 1024 * 1024,
+            MQTT_DESBORDE_MAX_MB * 1024 * 1024
+        )
+        self._limitador = _Limitador(drenaje_msg_s, lote_max)
+
+        self._cond = threading.Condition()
+        self._cola: deque = deque()
+        self._ultimo: Dict[str, Tuple[Dict[str, Any], int]] = {}
+        self._hilo: Optional[threading.Thread] = None
+
+        self.encolados = 0
+        self.publicados = 0
+        self.descartados = 0
+        self.desbordados = 0
+        self.coalescidos = 0
+        self.reintentos = 0
+        self.vencidos = 0
+        self.profundidad_max = 0
+        self.latencia_ms = 0.0  # promedio móvil exponencial encolado -> publicado
+
+    # -----------------------------
+    # Productores (hilos de request)
+    # -----------------------------
+
+    def encolar(self, topic: str, payload: Dict[str, Any], qos: int = 1) -> bool:
+        """
+        Encola un evento sin bloquear
+
+        Args:
+            topic: Topic completo
+            payload: Diccionario con datos del evento (no modificarlo después)
+            qos: Quality of Service
+
+        Returns:
+            bool: True si se encoló (o se fusionó con uno pendiente o se escribió
+            en disco), False si la cola y el desborde están llenos
+        """
+        self._asegurar_hilo()
+        payload.setdefault("timestamp", datetime.utcnow().isoformat())
+
+        with self._cond:
+            if topic in self.coalescibles and topic in self._ultimo:
+                self._ultimo[topic] = (payload, qos)
+                self.coalescidos += 1
+                return True
+
+            if len(self._cola) >= self.max_items or not self._desborde.vacio():
+                if self._desborde.agregar(topic, payload, qos):
+                    self.desbordados += 1
+                    if self.desbordados % 1000 == 1:
+                        print(f"📦 Cola MQTT llena ({self.max_items}): {self.desbordados} eventos escritos en disco")
+                    self._cond.notify()
+                    return True
+                self.descartados += 1
+                if self.descartados % 100 == 1:
+                    print(f"⚠️  Cola MQTT llena ({self.max_items}): {self.descartados} eventos descartados")
+                return False
+
+            if topic in self.coalescibles:
+                self._ultimo[topic] = (payload, qos)
+                self._cola.append((topic, None, qos, time.monotonic()))
+            else:
+                self._cola.append((topic, payload, qos, time.monotonic()))
+
+            self.encolados += 1
+            self.profundidad_max = max(self.profundidad_max, len(self._cola))
+            self._cond.notify()
+        return True
+
+    # -----------------------------
+    # Consumidor (hilo publicador)
+    # -----------------------------
+
+    def iniciar(self):
+        """Arranca el hilo publicador sin esperar al primer evento (drena lo que quedó en disco)"""
+        self._asegurar_hilo()
+
+    def _asegurar_hilo(self):
+        # El hilo se inicia en el primer uso (después de un fork de gunicorn)
+        if self._hilo is None or not self._hilo.is_alive():
+            with self._cond:
+                if self._hilo is None or not self._hilo.is_alive():
+                    self._desborde.abrir()
+                    self._hilo = threading.Thread(target=self._drenar, name="mqtt-publicador", daemon=True)
+                    self._hilo.start()
+
+    def _tomar_lote(self) -> Tuple[List[Mensaje], Optional[List[Any]]]:
+        """
+        Returns:
+            (lote, cursores): cursores es None si el lote salió de memoria; si salió
+            del desborde, el cursor de cada mensaje para confirmarlo en disco
+        """
+        with self._cond:
+            if not self._cola and self._desborde.vacio():
+                self._cond.wait(timeout=1.0)
+            lote = []
+            while self._cola and len(lote) < self.lote_max:
+                topic, payload, qos, encolado_at = self._cola.popleft()
+                if payload is None:
+                    payload, qos = self._ultimo.pop(topic)
+                lote.append((topic, payload, qos, encolado_at))
+            if lote or self._desborde.vacio():
+                return lote, None
+
+            # Memoria vacía: sigue lo más viejo del disco
+            leidos = self._desborde.leer(self.lote_max)
+            return [m[:4] for m in leidos], [m[4] for m in leidos]
+
+    def _confirmar(self, cursores: List[Any], cantidad: int):
+        if cantidad:
+            with self._cond:
+                self._desborde.confirmar(cursores[cantidad - 1], cantidad)
+
+    def _devolver(self, pendientes: List[Mensaje]):
+        """Vuelve a poner al frente los mensajes no publicados (conservando el orden)"""
+        with self._cond:
+            for topic, payload, qos, encolado_at in reversed(pendientes):
+                # Si ya llegó un valor más nuevo de un topic coalescible, el viejo sobra
+                if topic in self.coalescibles and topic in self._ultimo:
+                    continue
+                self._cola.appendleft((topic, payload, qos, encolado_at))
+            self.reintentos += len(pendientes)
+
+    @staticmethod
+    def _get_mqtt_client():
+        """Importación lazy para evitar imports circulares"""
+        from mqtt_client import get_mqtt_client
+        return get_mqtt_client()
+
+    def _drenar(self):
+        espera = 0.5
+        while True:
+            lote, cursores = self._tomar_lote()
+            if not lote:
+                continue
+
+            try:
+                mqtt_client = self._get_mqtt_client()
+            except Exception as e:
+                print(f"❌ Error al obtener cliente MQTT: {e}")
+                mqtt_client = None
+
+            if not mqtt_client or not mqtt_client.client.is_connected():
+                # Los del desborde siguen en disco sin confirmar: no hace falta devolverlos
+                if cursores is None:
+                    self._devolver(lote)
+                time.sleep(espera)
+                espera = min(espera * 2, self.ESPERA_REINTENTO_MAX)
+                continue
+
+            for i, (topic, payload, qos, encolado_at) in enumerate(lote):
+                antiguedad = time.monotonic() - encolado_at
+                if mqtt_client.vencido(topic, antiguedad):
+                    # Venció esperando (broker caído): el broker lo descartaría igual
+                    self.vencidos += 1
+                    continue
+                self._limitador.esperar()
+                try:
+                    mqtt_client.publish(topic, payload, qos=qos, antiguedad_s=antiguedad)
+                except Exception as e:
+                    print(f"❌ Error al publicar en {topic}: {e}")
+                    if cursores is None:
+                        self._devolver(lote[i:])
+                    else:
+                        self._confirmar(cursores, i)
+                    time.sleep(espera)
+                    espera = min(espera * 2, self.ESPERA_REINTENTO_MAX)
+                    break
+
+                self.publicados += 1
+                latencia = (time.monotonic() - encolado_at) * 1000
+                self.latencia_ms = latencia if self.publicados == 1 else 0.9 * self.latencia_ms + 0.1 * latencia
+            else:
+                if cursores is not None:
+                    self._confirmar(cursores, len(lote))
+                espera = 0.5
+
+    # -----------------------------
+    # Observabilidad
+    # -----------------------------
+
+    def estadisticas(self) -> Dict[str, Any]:
+        """Métricas de contrapresión de la cola"""
+        with self._cond:
+            profundidad = len(self._cola)
+            desborde = self._desborde.estadisticas()
+        return {
+            "profundidad": profundidad,
+            "max_items": self.max_items,
+            "profundidad_max": self.profundidad_max,
+            "encolados": self.encolados,
+            "publicados": self.publicados,
+            "descartados": self.descartados,
+            "desbordados": self.desbordados,
+            "desborde": desborde,
+            "drenaje_msg_s": self._limitador.tasa,
+            "coalescidos": self.coalescidos,
+            "reintentos": self.reintentos,
+            "vencidos": self.vencidos,
+            "latencia_ms_promedio": round(self.latencia_ms, 2)
+        }
+
+
+# Instancia singleton (una por proceso)
+cola_mqtt = ColaMQTT()
@@ -0,0 +1,273 @@
+"""
+Desborde a disco de la cola MQTT
+Segmentos de archivo de tamaño fijo, mapeados en memoria, donde se escriben
+al final los eventos que no entran en la cola en memoria (broker caído)
+"""
+
+import fcntl
+import json
+import mmap
+import os
+import struct
+import time
+import zlib
+from collections import deque
+from typing import Any, Deque, Dict, List, Tuple
+
+
+# Cabecera: magic, posición de lectura, posición de escritura
+CABECERA = struct.Struct("<4sQQ")
+TAM_CABECERA = 64
+MAGIC = b"BDM1"
+# Registro: largo del payload, crc32 del payload
+REGISTRO = struct.Struct("<II")
+
+
+class Segmento:
+    """
+    Un archivo de desborde: append-only, preasignado y mapeado en memoria.
+
+    Escribir un registro es copiar bytes al mapa y actualizar la cabecera;
+    el kernel baja las páginas a disco, así que un evento escrito sobrevive a
+    que se caiga el proceso (no a un corte de energía sin flush).
+    """
+
+    def __init__(self, ruta: str, tamano: int):
+        self.ruta = ruta
+        existe = os.path.exists(ruta)
+        self._archivo = open(ruta, "r+b" if existe else "w+b")
+        if not existe:
+            self._archivo.truncate(tamano)
+        self.tamano = os.fstat(self._archivo.fileno()).st_size
+        self._mapa = mmap.mmap(self._archivo.fileno(), self.tamano)
+
+        magic, lectura, escritura = CABECERA.unpack_from(self._mapa, 0)
+        if magic != MAGIC:
+            lectura = escritura = TAM_CABECERA
+        self.lectura = lectura
+        self.escritura = escritura
+        self._guardar_cabecera()
+
+    def _guardar_cabecera(self):
+        CABECERA.pack_into(self._mapa, 0, MAGIC, self.lectura, self.escritura)
+
+    def vacio(self) -> bool:
+        return self.lectura >= self.escritura
+
+    def agregar(self, datos: bytes) -> bool:
+        """Escribe un registro al final; False si no entra en el segmento"""
+        fin = self.escritura + REGISTRO.size + len(datos)
+        if fin > self.tamano:
+            return False
+        REGISTRO.pack_into(self._mapa, self.escritura, len(datos), zlib.crc32(datos))
+        self._mapa[self.escritura + REGISTRO.size:fin] = datos
+        # La cabecera se actualiza después del registro: un corte a mitad no deja basura visible
+        self.escritura = fin
+        self._guardar_cabecera()
+        return True
+
+    def leer(self, cantidad: int) -> List[Tuple[bytes, int]]:
+        """
+        Lee registros desde la posición de lectura sin consumirlos
+
+        Returns:
+            Lista de (datos, posición siguiente) para confirmar con avanzar()
+        """
+        salida = []
+        pos = self.lectura
+        while pos < self.escritura and len(salida) < cantidad:
+            largo, crc = REGISTRO.unpack_from(self._mapa, pos)
+            inicio = pos + REGISTRO.size
+            datos = bytes(self._mapa[inicio:inicio + largo])
+            if inicio + largo > self.escritura or zlib.crc32(datos) != crc:
+                print(f"⚠️  Registro corrupto en {self.ruta} (offset {pos}): se descarta el resto del segmento")
+                self.lectura = self.escritura
+                self._guardar_cabecera()
+                break
+            pos = inicio + largo
+            salida.append((datos, pos))
+        return salida
+
+    def avanzar(self, posicion: int):
+        self.lectura = min(posicion, self.escritura)
+        self._guardar_cabecera()
+
+    def reiniciar(self):
+        self.lectura = self.escritura = TAM_CABECERA
+        self._guardar_cabecera()
+
+    def cerrar(self, borrar: bool = False):
+        self._mapa.flush()
+        self._mapa.close()
+        self._archivo.close()
+        if borrar:
+            os.remove(self.ruta)
+
+
+class DesbordeDisco:
+    """
+    Cola FIFO persistente formada por segmentos 'segmento-NNNNNN.bin'.
+
+    - Se escribe siempre en el último segmento; lleno, se abre el siguiente
+      (hasta max_bytes en total, después agregar() devuelve False).
+    - Se lee del primero; cuando se consume entero se borra el archivo.
+    - Lectura en dos pasos (leer / confirmar): lo que no se confirmó se vuelve
+      a leer, también después de reiniciar el proceso.
+    - Un solo proceso por directorio (flock); si otro lo tiene, el desborde
+      queda deshabilitado en este proceso.
+    - No es thread-safe: ColaMQTT lo usa con su propio lock tomado.
+    """
+
+    def __init__(self, directorio: str, tamano_segmento: int, max_bytes: int):
+        self.directorio = directorio
+        self.tamano_segmento = tamano_segmento
+        self.max_segmentos = max(2, max_bytes // tamano_segmento)
+        self.habilitado = False
+
+        self._segmentos: Deque[Segmento] = deque()
+        self._siguiente = 1
+        self._lock_archivo = None
+        self.pendientes = 0
+
+        self.escritos = 0
+        self.leidos = 0
+        self.rechazados = 0
+
+    def abrir(self) -> bool:
+        """Toma el directorio y recupera los segmentos que hayan quedado (idempotente)"""
+        if self.habilitado:
+            return True
+        try:
+            os.makedirs(self.directorio, exist_ok=True)
+            self._lock_archivo = open(os.path.join(self.directorio, ".lock"), "w")
+            fcntl.flock(self._lock_archivo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+            nombres = sorted(
+                n for n in os.listdir(self.directorio)
+                if n.startswith("segmento-") and n.endswith(".bin")
+            )
+            for nombre in nombres:
+                segmento = Segmento(os.path.join(self.directorio, nombre), self.tamano_segmento)
+                self._segmentos.append(segmento)
+                self._siguiente = int(nombre[9:-4]) + 1
+                self.pendientes += self._contar(segmento)
+        except Exception as e:
+            print(f"⚠️  Desborde MQTT a disco deshabilitado ({self.directorio}): {e}")
+            if self._lock_archivo is not None:
+                self._lock_archivo.close()
+                self._lock_archivo = None
+            return False
+
+        self.habilitado = True
+        if self.pendientes:
+            print(f"📦 Desborde MQTT: {self.pendientes} eventos pendientes recuperados de disco")
+        return True
+
+    @staticmethod
+    def _contar(segmento: Segmento) -> int:
+        cantidad = 0
+        lectura = segmento.lectura
+        while True:
+            registros = segmento.leer(1000)
+            if not registros:
+                break
+            cantidad += len(registros)
+            segmento.lectura = registros[-1][1]
+        segmento.lectura = lectura
+        return cantidad
+
+    def vacio(self) -> bool:
+        return self.pendientes == 0
+
+    # -----------------------------
+    # Escritura
+    # -----------------------------
+
+    def agregar(self, topic: str, payload: Dict[str, Any], qos: int) -> bool:
+        """
+        Agrega un evento al final del desborde
+
+        Returns:
+            bool: False si el desborde está deshabilitado o lleno
+        """
+        if not self.habilitado:
+            return False
+        datos = json.dumps(
+            {"topic": topic, "payload": payload, "qos": qos, "ts": time.time()},
+            default=str
+        ).encode("utf-8")
+
+        if not self._segmentos or not self._segmentos[-1].agregar(datos):
+            if len(self._segmentos) >= self.max_segmentos or not self._rotar() or not self._segmentos[-1].agregar(datos):
+                self.rechazados += 1
+                return False
+        self.pendientes += 1
+        self.escritos += 1
+        return True
+
+    def _rotar(self) -> bool:
+        ruta = os.path.join(self.directorio, f"segmento-{self._siguiente:06d}.bin")
+        try:
+            segmento = Segmento(ruta, self.tamano_segmento)
+        except Exception as e:
+            print(f"❌ No se pudo crear el segmento de desborde {ruta}: {e}")
+            return False
+        self._siguiente += 1
+        self._segmentos.append(segmento)
+        return True
+
+    # -----------------------------
+    # Lectura
+    # -----------------------------
+
+    def leer(self, cantidad: int) -> List[Tuple[str, Dict[str, Any], int, float, Tuple[Segmento, int]]]:
+        """
+        Lee hasta 'cantidad' eventos del principio sin consumirlos
+
+        Returns:
+            Lista de (topic, payload, qos, encolado_at, cursor); encolado_at en
+            reloj monotónico, cursor para pasarle a confirmar()
+        """
+        while self._segmentos:
+            primero = self._segmentos[0]
+            registros = primero.leer(cantidad)
+            if registros:
+                ahora_mono, ahora = time.monotonic(), time.time()
+                salida = []
+                for datos, posicion in registros:
+                    evento = json.loads(datos)
+                    encolado_at = ahora_mono - max(0.0, ahora - evento.get("ts", ahora))
+                    salida.append((evento["topic"], evento["payload"], evento["qos"], encolado_at, (primero, posicion)))
+                return salida
+            if len(self._segmentos) == 1:
+                # Todo consumido (si hubo un registro corrupto, el conteo se corrige acá)
+                self.pendientes = 0
+                return []
+            # Segmento consumido (o corrupto) y ya hay otro detrás: se borra
+            self._segmentos.popleft().cerrar(borrar=True)
+        return []
+
+    def confirmar(self, cursor: Tuple[Segmento, int], cantidad: int):
+        """Marca como publicados los eventos leídos hasta el cursor"""
+        segmento, posicion = cursor
+        segmento.avanzar(posicion)
+        self.pendientes = max(0, self.pendientes - cantidad)
+        self.leidos += cantidad
+        if not segmento.vacio():
+            return
+        if len(self._segmentos) > 1 and self._segmentos[0] is segmento:
+            self._segmentos.popleft().cerrar(borrar=True)
+        elif len(self._segmentos) == 1:
+            # Único segmento y sin pendientes: se reusa desde el principio
+            segmento.reiniciar()
+
+    def estadisticas(self) -> Dict[str, Any]:
+        return {
+            "habilitado": self.habilitado,
+            "pendientes": self.pendientes,
+            "segmentos": len(self._segmentos),
+            "max_segmentos": self.max_segmentos,
+            "escritos": self.escritos,
+            "leidos": self.leidos,
+            "rechazados": self.rechazados,
+        }
@@ -410,9 +410,10 @@
 MQTT Event Publisher - Publica eventos de negocio en MQTT
 """
 
-import json
 from datetime import datetime
-from typing import Dict, Any
+from typing import Dict, Any, List, Tuple
+
+from utils.mqtt_cola import cola_mqtt
 
 
 class MQTTEventPublisher:
@@ -422,16 +423,10 @@ class MQTTEventPublisher:
     
     BASE_TOPIC = "universidad"
     
-    @staticmethod
-    def _get_mqtt_client():
-        """Importación lazy para evitar imports circulares"""
-        from mqtt_client import get_mqtt_client  # ✅ CORRECCIÓN 1: Importar función, no variable
-        return get_mqtt_client()
-    
     @staticmethod
     def _publicar(topic: str, payload: Dict[str, Any], qos: int = 1) -> bool:
         """
-        Publica un mensaje en MQTT
+        Encola un mensaje para publicarlo en MQTT (no bloquea el request)
         
         Args:
             topic: Topic completo (ej: universidad/aulas/nueva)
@@ -439,30 +434,32 @@ class MQTTEventPublisher:
             qos: Quality of Service (default: 1)
             
         Returns:
-            bool: True si se publicó correctamente
+            bool: True si se encoló (False si la cola está llena)
         """
-        try:
-            mqtt_client = MQTTEventPublisher._get_mqtt_client()
-            
-            # ✅ CORRECCIÓN 2: Verificar que el cliente exista y esté conectado
-            if not mqtt_client or not mqtt_client.client.is_connected():
-                print("⚠️  MQTT no conectado")
-                return False
-            
-            # Agregar timestamp automático
-            payload["timestamp"] = datetime.utcnow().isoformat()
-            
-            # Convertir a JSON
-            mensaje = json.dumps(payload, default=str)
-            
-            # Publicar
-            mqtt_client.publish(topic, payload)
-            print(f"✅ Evento publicado en {topic}")
-            return True
+        # Timestamp del evento (no del momento en que se publica)
+        payload["timestamp"] = datetime.utcnow().isoformat()
+        return cola_mqtt.encolar(topic, payload, qos)
+    
+    @staticmethod
+    def _publicar_lote(mensajes: List[Tuple[str, Dict[str, Any], int]]) -> int:
+        """
+        Encola varios mensajes con el mismo timestamp
+        
+        Args:
+            mensajes: Lista de (topic, payload, qos)
             
-        except Exception as e:
-            print(f"❌ Error al publicar en MQTT: {e}")
-            return False
+        Returns:
+            int: Cantidad de mensajes encolados
+        """
+        timestamp = datetime.utcnow().isoformat()
+        encolados = 0
+        
+        for topic, payload, qos in mensajes:
+            payload["timestamp"] = timestamp
+            if cola_mqtt.encolar(topic, payload, qos):
+                encolados += 1
+        
+        return encolados
     
     # ==================== EVENTOS DE AULAS ====================
     
@@ -478,8 +475,8 @@ class MQTTEventPublisher:
         return MQTTEventPublisher._publicar(topic, payload)
     
     @staticmethod
-    def publicar_aula_asignada(id_aula: str, id_cronograma: str, datos: Dict[str, Any]) -> bool:
-        """Publica evento cuando se asigna un aula"""
+    def evento_aula_asignada(id_aula: str, id_cronograma: str, datos: Dict[str, Any]) -> Tuple[str, Dict[str, Any], int]:
+        """Arma (topic, payload, qos) del evento de aula asignada (para publicar o para el outbox)"""
         topic = f"{MQTTEventPublisher.BASE_TOPIC}/aulas/asignada"
         payload = {
             "evento": "aula_asignada",
@@ -487,11 +484,35 @@ class MQTTEventPublisher:
             "id_cronograma": id_cronograma,
             "datos": datos
         }
-        return MQTTEventPublisher._publicar(topic, payload)
+        return topic, payload, 1
     
     @staticmethod
-    def publicar_aula_liberada(id_aula: str, id_cronograma: str, motivo: str = "finalizado") -> bool:
-        """Publica evento cuando se libera un aula"""
+    def publicar_aula_asignada(id_aula: str, id_cronograma: str, datos: Dict[str, Any]) -> bool:
+        """Publica evento cuando se asigna un aula"""
+        return MQTTEventPublisher._publicar(
+            *MQTTEventPublisher.evento_aula_asignada(id_aula, id_cronograma, datos)
+        )
+    
+    @staticmethod
+    def publicar_aulas_asignadas(asignaciones: List[Dict[str, Any]]) -> int:
+        """
+        Publica en lote eventos de aula asignada (carga masiva de cronogramas)
+        
+        Args:
+            asignaciones: Lista de {"id_aula", "id_cronograma", "datos"}
+            
+        Returns:
+            int: Cantidad de eventos publicados
+        """
+        mensajes = [
+            MQTTEventPublisher.evento_aula_asignada(asig["id_aula"], asig["id_cronograma"], asig["datos"])
+            for asig in asignaciones
+        ]
+        return MQTTEventPublisher._publicar_lote(mensajes)
+    
+    @staticmethod
+    def evento_aula_liberada(id_aula: str, id_cronograma: str, motivo: str = "finalizado") -> Tuple[str, Dict[str, Any], int]:
+        """Arma (topic, payload, qos) del evento de aula liberada"""
         topic = f"{MQTTEventPublisher.BASE_TOPIC}/aulas/liberada"
         payload = {
             "evento": "aula_liberada",
@@ -499,13 +520,20 @@ class MQTTEventPublisher:
             "id_cronograma": id_cronograma,
             "motivo": motivo
         }
-        return MQTTEventPublisher._publicar(topic, payload)
+        return topic, payload, 1
+    
+    @staticmethod
+    def publicar_aula_liberada(id_aula: str, id_cronograma: str, motivo: str = "finalizado") -> bool:
+        """Publica evento cuando se libera un aula"""
+        return MQTTEventPublisher._publicar(
+            *MQTTEventPublisher.evento_aula_liberada(id_aula, id_cronograma, motivo)
+        )
     
     # ==================== NOTIFICACIONES ====================
     
     @staticmethod
-    def notificar_alumnos(carrera: str, id_materia: str, mensaje: str, datos: Dict[str, Any]) -> bool:
-        """Notifica a alumnos de una carrera/materia específica"""
+    def evento_notificacion_alumnos(carrera: str, id_materia: str, mensaje: str, datos: Dict[str, Any]) -> Tuple[str, Dict[str, Any], int]:
+        """Arma (topic, payload, qos) de una notificación a alumnos de una carrera/materia"""
         topic = f"{MQTTEventPublisher.BASE_TOPIC}/notificaciones/{carrera}/{id_materia}"
         payload = {
             "evento": "notificacion_alumnos",
@@ -514,7 +542,14 @@ class MQTTEventPublisher:
             "mensaje": mensaje,
             "datos": datos
         }
-        return MQTTEventPublisher._publicar(topic, payload)
+        return topic, payload, 1
+    
+    @staticmethod
+    def notificar_alumnos(carrera: str, id_materia: str, mensaje: str, datos: Dict[str, Any]) -> bool:
+        """Notifica a alumnos de una carrera/materia específica"""
+        return MQTTEventPublisher._publicar(
+            *MQTTEventPublisher.evento_notificacion_alumnos(carrera, id_materia, mensaje, datos)
+        )
     
     @staticmethod
     def notificar_profesor(id_profesor: str, mensaje: str, datos: Dict[str, Any]) -> bool:
@@ -554,8 +589,75 @@ class MQTTEventPublisher:
         }
         return MQTTEventPublisher._publicar(topic, payload)
     
+    # ==================== ESTADO RETENIDO ====================
+    # Un mensaje retenido por aula y por cronograma del día (ver relay_estado.py):
+    # quien se suscribe recibe el estado completo sin pedir GET /aulas
+    
+    @staticmethod
+    def topic_estado_aula(id_aula: str) -> str:
+        return f"{MQTTEventPublisher.BASE_TOPIC}/aulas/estado/{id_aula}"
+    
+    @staticmethod
+    def topic_cronograma_dia(fecha: str, id_cronograma: str) -> str:
+        """fecha: YYYY-MM-DD (suscribirse a universidad/cronogramas/<fecha>/# trae el día completo)"""
+        return f"{MQTTEventPublisher.BASE_TOPIC}/cronogramas/{fecha}/{id_cronograma}"
+    
+    @staticmethod
+    def evento_estado_aula(aula: Dict[str, Any]) -> Tuple[str, Dict[str, Any], int]:
+        """Arma (topic, payload, qos) del estado actual de un aula (documento completo)"""
+        id_aula = str(aula["_id"])
+        topic = MQTTEventPublisher.topic_estado_aula(id_aula)
+        payload = {
+            "evento": "estado_aula",
+            "id_aula": id_aula,
+            "nro_aula": aula.get("nro_aula"),
+            "piso": aula.get("piso"),
+            "cupo": aula.get("cupo"),
+            "estado": aula.get("estado"),
+            "descripcion": aula.get("descripcion"),
+            "id_asignacion_actual": str(aula["id_asignacion_actual"]) if aula.get("id_asignacion_actual") else None,
+            "updated_at": aula.get("updated_at")
+        }
+        return topic, payload, 1
+    
+    @staticmethod
+    def evento_cronograma_dia(cronograma: Dict[str, Any]) -> Tuple[str, Dict[str, Any], int]:
+        """Arma (topic, payload, qos) del estado actual de un cronograma en el topic de su día"""
+        id_cronograma = str(cronograma["_id"])
+        fecha = cronograma["fecha"].strftime("%Y-%m-%d")
+        topic = MQTTEventPublisher.topic_cronograma_dia(fecha, id_cronograma)
+        payload = {
+            "evento": "cronograma_dia",
+            "id_cronograma": id_cronograma,
+            "id_aula": str(cronograma.get("id_aula")),
+            "id_carrera": cronograma.get("id_carrera"),
+            "id_materia": str(cronograma.get("id_materia")),
+            "id_profesor": str(cronograma.get("id_profesor")),
+            "fecha": fecha,
+            "hora_inicio": cronograma.get("hora_inicio"),
+            "hora_fin": cronograma.get("hora_fin"),
+            "tipo": cronograma.get("tipo"),
+            "estado": cronograma.get("estado"),
+            "cupo_actual": cronograma.get("cupo_actual"),
+            "updated_at": cronograma.get("updated_at")
+        }
+        return topic, payload, 1
+    
     # ==================== MÉTRICAS ====================
     
+    @staticmethod
+    def evento_metricas_aulas(total: int, disponibles: int, ocupadas: int, deshabilitadas: int) -> Tuple[str, Dict[str, Any], int]:
+        """Arma (topic, payload, qos) de las métricas de aulas (ver services/metricas_publicador.py)"""
+        topic = f"{MQTTEventPublisher.BASE_TOPIC}/metricas/aulas"
+        payload = {
+            "evento": "metricas_aulas",
+            "total_aulas": total,
+            "disponibles": disponibles,
+            "ocupadas": ocupadas,
+            "deshabilitadas": deshabilitadas
+        }
+        return topic, payload, 0  # QoS 0 para métricas
+    
     @staticmethod
     def publicar_metricas_aulas(total: int, disponibles: int, ocupadas: int, deshabilitadas: int) -> bool:
         """
@@ -570,12 +672,6 @@ class MQTTEventPublisher:
         Returns:
             bool: True si se publicó correctamente
         """
-        topic = f"{MQTTEventPublisher.BASE_TOPIC}/metricas/aulas"
-        payload = {
-            "evento": "metricas_aulas",
-            "total_aulas": total,
-            "disponibles": disponibles,
-            "ocupadas": ocupadas,
-            "deshabilitadas": deshabilitadas
-        }
-        return MQTTEventPublisher._publicar(topic, payload, qos=0)  # QoS 0 para métricas
\ No newline at end of file
+        return MQTTEventPublisher._publicar(
+            *MQTTEventPublisher.evento_metricas_aulas(total, disponibles, ocupadas, deshabilitadas)
+        )
\ No newline at end of file
@@ -3,7 +3,7 @@ Validators - Validaciones comunes reutilizables
 """
 
 from datetime import datetime, time
-from typing import Any
+from typing import Any, Iterable, List, Optional
 from bson import ObjectId
 
 
@@ -199,3 +199,27 @@ class Validators:
         """
         roles_validos = ["administrador", "profesor", "alumno"]
         return rol in roles_validos
+    
+    @staticmethod
+    def parsear_expand(valor: Optional[str], permitidos: Iterable[str]) -> List[str]:
+        """
+        Parsea el query param 'expand' (datos relacionados a incluir, separados por coma)
+        
+        Args:
+            valor: Valor del parámetro (None o vacío: nada)
+            permitidos: Expansiones que acepta el endpoint
+        
+        Returns:
+            Lista de expansiones pedidas
+        
+        Raises:
+            ValueError: Si se pide una expansión desconocida
+        """
+        pedidos = [parte.strip() for parte in (valor or "").split(",") if parte.strip()]
+        desconocidos = [p for p in pedidos if p not in permitidos]
+        if desconocidos:
+            raise ValueError(
+                f"Parámetro 'expand' inválido: {', '.join(desconocidos)}. "
+                f"Valores permitidos: {', '.join(permitidos)}"
+            )
+        return pedidos